@@ -1,7 +1,11 @@
 import os
-from typing import TypedDict, Optional
+import json
+import asyncio
+from typing import Callable, List, Optional, Tuple, TypedDict
 from langchain_core.messages import HumanMessage, SystemMessage
-from api_config import api_config
+from agents.base import BaseAgent
+from cache import plan_cache, make_cache_key, normalize_prompt
+from singleflight import plan_flights
 
 class ArchitectState(TypedDict):
     """State for the Architect Agent."""
@@ -9,36 +13,185 @@ class ArchitectState(TypedDict):
     file_structure: dict
     tech_stack: str
 
-class ArchitectAgent:
-    """Agent responsible for planning the application structure."""
+class PlanStreamParser:
+    """
+    Incremental JSON scanner for a plan arriving token by token.
     
-    def __init__(self, user_api_key: Optional[str] = None, user_provider: Optional[str] = None, user_base_url: Optional[str] = None):
+    feed() returns the "files" entries completed by each chunk, so they can be
+    dispatched before the rest of the plan has arrived. Anything before the
+    first "{" (such as a ```json fence) is skipped. Top-level string values seen
+    so far (e.g. tech_stack) are kept in values. The scanner never raises:
+    malformed output simply stops producing entries, and the final plan is
+    still parsed (or replaced by the default plan) from the full text.
+    """
+    
+    def __init__(self):
+        self.values: dict = {}
+        self._stack: List[dict] = []  # open containers: {"kind", "key", "expect_key", "current"}
+        self._string: Optional[List[str]] = None  # raw characters of the string being read
+        self._escape = False
+        self._done = False
+    
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """Scan more output and return newly completed (filename, description) entries."""
+        entries = []
+        for char in text:
+            if self._done:
+                break
+            
+            if self._string is not None:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    entry = self._end_string()
+                    if entry is not None:
+                        entries.append(entry)
+                    continue
+                self._string.append(char)
+                continue
+            
+            if not self._stack:
+                if char == "{":
+                    self._open(char)
+                continue
+            
+            top = self._stack[-1]
+            if char in "{[":
+                self._open(char)
+            elif char in "}]":
+                self._stack.pop()
+                self._done = not self._stack
+            elif char == ":":
+                top["expect_key"] = False
+            elif char == ",":
+                top["expect_key"] = top["kind"] == "{"
+            elif char == '"':
+                self._string = []
+        return entries
+    
+    def _open(self, kind: str) -> None:
+        parent = self._stack[-1] if self._stack else None
+        key = parent["current"] if parent is not None and parent["kind"] == "{" else None
+        self._stack.append({"kind": kind, "key": key, "expect_key": kind == "{", "current": None})
+    
+    def _end_string(self) -> Optional[Tuple[str, str]]:
+        raw = "".join(self._string)
+        self._string = None
+        try:
+            value = json.loads(f'"{raw}"')
+        except ValueError:
+            self._done = True  # Not JSON after all; leave it to the final parse
+            return None
+        
+        top = self._stack[-1]
+        if top["kind"] == "{" and top["expect_key"]:
+            top["current"] = value
+            return None
+        
+        if len(self._stack) == 1 and top["current"] is not None:
+            self.values[top["current"]] = value
+        elif len(self._stack) == 2 and top["kind"] == "{" and top["key"] == "files" and top["current"] is not None:
+            return top["current"], value
+        return None
+
+class ArchitectAgent(BaseAgent):
+    """
+    Agent responsible for planning the application structure.
+    
+    Stateless apart from its cache setting: pass the caller's llm to each
+    call, or construct it with credentials to use its own.
+    """
+    
+    name = "architect"
+    temperature = 0.7
+    
+    def __init__(
+        self,
+        user_api_key: Optional[str] = None,
+        user_provider: Optional[str] = None,
+        user_base_url: Optional[str] = None,
+        use_cache: bool = True
+    ):
         """
         Initialize Architect Agent.
         
         Args:
-            user_api_key: User's own API key (REQUIRED)
-            user_provider: User's API provider (REQUIRED)
+            user_api_key: User's own API key (optional; otherwise pass llm per call)
+            user_provider: User's API provider
             user_base_url: Custom base URL (optional)
+            use_cache: Serve repeated prompts from the plan cache
         """
-        self.user_api_key = user_api_key
-        self.user_provider = user_provider
-        self.user_base_url = user_base_url
-        
-        # Get LLM for user projects (requires user's API key)
-        self.llm = api_config.get_llm(
-            context="user_project",
-            user_api_key=user_api_key,
-            user_provider=user_provider,
-            user_base_url=user_base_url,
-            temperature=0.7
-        )
+        super().__init__(user_api_key, user_provider, user_base_url)
+        self.cache = plan_cache if use_cache else None
     
-    def plan(self, user_prompt: str) -> dict:
+    def plan(self, user_prompt: str, llm=None) -> dict:
         """
         Generate a file structure plan based on user's prompt.
         Returns a JSON structure with files and their purposes.
+        Plans served from the cache are marked with "cached": True. Identical
+        concurrent calls share one LLM call.
         """
+        llm = self._resolve_llm(llm)
+        cache_key = self._cache_key(user_prompt, llm)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        return plan_flights.do(
+            self._flight_key(user_prompt, llm),
+            lambda: self._finish_plan(cache_key, self._invoke(self._build_messages(user_prompt), llm))
+        )
+    
+    async def aplan(self, user_prompt: str, llm=None) -> dict:
+        """Async version of plan(); cache lookups and stores run on a worker thread."""
+        llm = self._resolve_llm(llm)
+        cache_key = self._cache_key(user_prompt, llm)
+        cached = await self._acache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        async def plan() -> dict:
+            content = await self._ainvoke(self._build_messages(user_prompt), llm)
+            return await asyncio.to_thread(self._finish_plan, cache_key, content)
+        
+        return await plan_flights.ado(self._flight_key(user_prompt, llm), plan)
+    
+    async def astream_plan(
+        self,
+        user_prompt: str,
+        on_file: Callable[[str, str, Optional[str]], None],
+        llm=None
+    ) -> dict:
+        """
+        Stream the plan, calling on_file(filename, description, tech_stack) for
+        each "files" entry as soon as it is complete (tech_stack is None if the
+        model has not emitted it yet).
+        
+        Returns the same plan aplan() would. If the output turns out to be
+        malformed that is the default plan, so callers must drop dispatched
+        entries that are not in the returned plan.
+        """
+        llm = self._resolve_llm(llm)
+        cache_key = self._cache_key(user_prompt, llm)
+        cached = await self._acache_get(cache_key)
+        if cached is not None:
+            for filename, description in cached.get("files", {}).items():
+                on_file(filename, description, cached.get("tech_stack"))
+            return cached
+        
+        parser = PlanStreamParser()
+        
+        def on_token(delta: str) -> None:
+            for filename, description in parser.feed(delta):
+                on_file(filename, description, parser.values.get("tech_stack"))
+        
+        content = await self._ainvoke(self._build_messages(user_prompt), llm, on_token=on_token)
+        return await asyncio.to_thread(self._finish_plan, cache_key, content)
+    
+    def _build_messages(self, user_prompt: str) -> list:
+        """Build the planning prompt."""
         system_prompt = """You are an expert software architect. 
 Given a user's app description, create a minimal file structure plan.
 Return ONLY a valid JSON object with this structure:
@@ -48,36 +201,77 @@ Return ONLY a valid JSON object with this structure:
     "index.html": "Main HTML entry point",
     "App.tsx": "Root React component",
     "styles.css": "Global styles"
+  },
+  "dependencies": {
+    "index.html": ["App.tsx", "styles.css"],
+    "App.tsx": ["styles.css"]
   }
 }
+"dependencies" is optional: for each file, list the other planned files it imports or references.
 Keep it simple and minimal. No markdown, no explanations."""
 
-        messages = [
+        return [
             SystemMessage(content=system_prompt),
             HumanMessage(content=f"User wants: {user_prompt}")
         ]
+    
+    def _finish_plan(self, cache_key: Optional[str], content: str) -> dict:
+        """Parse the model output, caching real plans but never the fallback."""
+        plan = self._parse_plan(content)
+        if plan is None:
+            return self._default_plan()
         
-        response = self.llm.invoke(messages)
-        
-        # Parse the JSON response
-        import json
+        if cache_key is not None:
+            self.cache.set(cache_key, json.dumps(plan))
+        return plan
+    
+    def _parse_plan(self, content: str) -> Optional[dict]:
+        """Parse the JSON plan, returning None if the output is not a valid plan."""
+        # Decode the first JSON object, ignoring markdown fences or prose around it
+        start = content.find("{")
+        if start == -1:
+            return None
         try:
-            # Clean the response (remove markdown if present)
-            content = response.content.strip()
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-            
-            plan = json.loads(content.strip())
-            return plan
-        except Exception as e:
-            # Fallback structure
-            return {
-                "tech_stack": "HTML + CSS + JS",
-                "files": {
-                    "index.html": "Main HTML file",
-                    "style.css": "Styling",
-                    "script.js": "JavaScript logic"
-                }
+            plan, _ = json.JSONDecoder().raw_decode(content, start)
+        except ValueError:
+            return None
+        
+        if not isinstance(plan, dict) or not isinstance(plan.get("files"), dict):
+            return None
+        return plan
+    
+    def _default_plan(self) -> dict:
+        """Fallback structure used when the model output cannot be parsed."""
+        return {
+            "tech_stack": "HTML + CSS + JS",
+            "files": {
+                "index.html": "Main HTML file",
+                "style.css": "Styling",
+                "script.js": "JavaScript logic"
             }
+        }
+    
+    def _cache_key(self, user_prompt: str, llm) -> Optional[str]:
+        """Key a plan on the normalized prompt plus the model and endpoint."""
+        if self.cache is None:
+            return None
+        return make_cache_key(normalize_prompt(user_prompt), *self._cache_identity(llm))
+    
+    def _flight_key(self, user_prompt: str, llm) -> tuple:
+        return (normalize_prompt(user_prompt), self._flight_identity(llm))
+    
+    def _cache_get(self, cache_key: Optional[str]) -> Optional[dict]:
+        if cache_key is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        plan = json.loads(cached)
+        plan["cached"] = True
+        return plan
+    
+    async def _acache_get(self, cache_key: Optional[str]) -> Optional[dict]:
+        """_cache_get() on a worker thread: the persistent tier is a SQLite file."""
+        if cache_key is None:
+            return None
+        return await asyncio.to_thread(self._cache_get, cache_key)
@@ -0,0 +1,128 @@
+from typing import Callable, Optional
+from api_config import api_config
+from metrics import track_llm_call
+from rate_limit import rate_limits
+from hedging import hedging
+
+class BaseAgent:
+    """
+    Shared LLM plumbing for the agents.
+
+    Agents hold configuration only (temperature, cache), so one instance can
+    serve every request: each call takes the caller's LLM. An agent built with
+    credentials keeps that LLM as its default, for standalone use.
+    """
+
+    # Label for this agent's LLM latency and token metrics
+    name = "agent"
+    temperature = 0.7
+
+    def __init__(
+        self,
+        user_api_key: Optional[str] = None,
+        user_provider: Optional[str] = None,
+        user_base_url: Optional[str] = None
+    ):
+        """
+        Initialize the agent.
+
+        Args:
+            user_api_key: User's own API key (optional; without it every call needs an llm)
+            user_provider: User's API provider
+            user_base_url: Custom base URL (optional)
+        """
+        self.user_api_key = user_api_key
+        self.user_provider = user_provider
+        self.user_base_url = user_base_url
+        self.llm = self.get_llm(user_api_key, user_provider, user_base_url) if user_api_key else None
+
+    def get_llm(self, user_api_key: Optional[str], user_provider: Optional[str], user_base_url: Optional[str] = None):
+        """
+        Pooled LLM for the given credentials at this agent's temperature.
+
+        Raises:
+            ValueError: If the credentials or provider are missing or invalid
+        """
+        return api_config.get_llm(
+            context="user_project",
+            user_api_key=user_api_key,
+            user_provider=user_provider,
+            user_base_url=user_base_url,
+            temperature=self.temperature
+        )
+
+    def _resolve_llm(self, llm=None):
+        llm = llm or self.llm
+        if llm is None:
+            raise ValueError(f"{type(self).__name__} needs an llm: pass one or construct it with API credentials")
+        return llm
+
+    def _invoke(self, messages: list, llm=None) -> str:
+        """
+        Run the model and return the response text.
+
+        Calls go through the provider key's rate limiter, which retries 429s
+        and transient errors.
+        """
+        llm = self._resolve_llm(llm)
+        with track_llm_call(llm, self.name) as usage:
+            response = rate_limits.run(llm, lambda: llm.invoke(messages))
+            usage.append(getattr(response, "usage_metadata", None))
+        return response.content
+
+    async def _ainvoke(
+        self,
+        messages: list,
+        llm=None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Async version of _invoke(). With on_token the response is streamed and
+        every content delta is passed to it as it arrives.
+
+        Unstreamed calls may be hedged (see hedging.py); streamed ones
+        are not, as their deltas have already been handed out.
+        """
+        llm = self._resolve_llm(llm)
+        if on_token is None:
+            async def call(llm) -> str:
+                with track_llm_call(llm, self.name) as usage:
+                    response = await rate_limits.arun(llm, lambda: llm.ainvoke(messages))
+                    usage.append(getattr(response, "usage_metadata", None))
+                return response.content
+
+            return await hedging.arun(llm, call, self.name)
+
+        with track_llm_call(llm, self.name) as usage:
+            chunks = []
+
+            async def stream() -> str:
+                async for chunk in llm.astream(messages):
+                    # With stream_usage the provider reports token usage on the final chunk
+                    usage.append(getattr(chunk, "usage_metadata", None))
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        on_token(chunk.content)
+                return "".join(chunks)
+
+            # Deltas already handed to on_token cannot be taken back, so only retry before the first one
+            return await rate_limits.arun(llm, stream, can_retry=lambda: not chunks)
+
+    @staticmethod
+    def _flight_identity(llm) -> int:
+        """
+        LLM part of a single-flight key. Pooled clients are shared per provider,
+        key, endpoint and temperature, so only calls with the same credentials
+        are coalesced.
+        """
+        return id(llm)
+
+    @staticmethod
+    def _cache_identity(llm) -> tuple:
+        """Model, temperature and endpoint of an LLM, for cache keys (never the key itself)."""
+        # Custom endpoints all report model "default", so the base URL is part of the identity
+        return (
+            getattr(llm, "model_name", None),
+            getattr(llm, "temperature", None),
+            getattr(llm, "openai_api_base", None)
+        )
@@ -1,54 +1,198 @@
 import os
-from typing import Optional
+import asyncio
+from typing import Callable, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
-from api_config import api_config
+from agents.base import BaseAgent
+from cache import file_cache, make_cache_key
+from singleflight import file_flights
 
-class EngineerAgent:
-    """Agent responsible for writing code for individual files."""
+class EngineerAgent(BaseAgent):
+    """
+    Agent responsible for writing code for individual files.
     
-    def __init__(self, user_api_key: Optional[str] = None, user_provider: Optional[str] = None, user_base_url: Optional[str] = None):
+    Stateless apart from its cache setting: pass the caller's llm to each
+    call, or construct it with credentials to use its own.
+    """
+    
+    name = "engineer"
+    temperature = 0.3
+    
+    def __init__(
+        self,
+        user_api_key: Optional[str] = None,
+        user_provider: Optional[str] = None,
+        user_base_url: Optional[str] = None,
+        use_cache: bool = True
+    ):
         """
         Initialize Engineer Agent.
         
         Args:
-            user_api_key: User's own API key (REQUIRED)
-            user_provider: User's API provider (REQUIRED)
+            user_api_key: User's own API key (optional; otherwise pass llm per call)
+            user_provider: User's API provider
             user_base_url: Custom base URL (optional)
+            use_cache: Serve identical file requests from the file cache
         """
-        self.user_api_key = user_api_key
-        self.user_provider = user_provider
-        self.user_base_url = user_base_url
-        
-        # Get LLM for user projects
-        self.llm = api_config.get_llm(
-            context="user_project",
-            user_api_key=user_api_key,
-            user_provider=user_provider,
-            user_base_url=user_base_url,
-            temperature=0.3
-        )
+        super().__init__(user_api_key, user_provider, user_base_url)
+        self.cache = file_cache if use_cache else None
+    
+    def write_file(
+        self,
+        filename: str,
+        description: str,
+        user_prompt: str,
+        tech_stack: str,
+        context: str = "",
+        llm=None
+    ) -> str:
+        """
+        Generate code for a specific file. Identical concurrent calls share one LLM call.
+        
+        Args:
+            context: Interface summaries of the files this one depends on
+            llm: The caller's LLM (defaults to the agent's own)
+        """
+        llm = self._resolve_llm(llm)
+        cache_key = self._cache_key(filename, description, user_prompt, tech_stack, llm, context)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        def write() -> str:
+            messages = self._build_messages(filename, description, user_prompt, tech_stack, context)
+            code = self._clean_code(self._invoke(messages, llm))
+            self._cache_set(cache_key, code)
+            return code
+        
+        return file_flights.do(self._flight_key(filename, description, user_prompt, tech_stack, context, llm), write)
     
-    def write_file(self, filename: str, description: str, user_prompt: str, tech_stack: str) -> str:
+    async def awrite_file(
+        self,
+        filename: str,
+        description: str,
+        user_prompt: str,
+        tech_stack: str,
+        context: str = "",
+        on_token: Optional[Callable[[str], None]] = None,
+        llm=None
+    ) -> str:
         """
-        Generate code for a specific file.
+        Async version of write_file(); cache reads and writes run on a worker thread.
+        
+        Args:
+            context: Interface summaries of the files this one depends on
+            on_token: Optional callback; when given the response is streamed
+                and every content delta is passed to it as it arrives. A call
+                that joins an identical one in flight gets the whole file as
+                one delta, as on a cache hit.
+            llm: The caller's LLM (defaults to the agent's own)
         """
+        llm = self._resolve_llm(llm)
+        cache_key = self._cache_key(filename, description, user_prompt, tech_stack, llm, context)
+        cached = await self._acache_get(cache_key)
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached)
+            return cached
+        
+        leader = []
+        
+        async def write() -> str:
+            leader.append(True)
+            messages = self._build_messages(filename, description, user_prompt, tech_stack, context)
+            code = self._clean_code(await self._ainvoke(messages, llm, on_token=on_token))
+            await self._acache_set(cache_key, code)
+            return code
+        
+        code = await file_flights.ado(self._flight_key(filename, description, user_prompt, tech_stack, context, llm), write)
+        if not leader and on_token is not None:
+            on_token(code)
+        return code
+    
+    def _cache_key(
+        self,
+        filename: str,
+        description: str,
+        user_prompt: str,
+        tech_stack: str,
+        llm,
+        context: str = ""
+    ) -> Optional[str]:
+        """Content-address a file request, including the model, temperature and endpoint."""
+        if self.cache is None:
+            return None
+        # Context is only appended when present so keys for independent files stay stable
+        return make_cache_key(
+            filename,
+            description,
+            user_prompt,
+            tech_stack,
+            *self._cache_identity(llm),
+            *([context] if context else [])
+        )
+    
+    def _flight_key(
+        self,
+        filename: str,
+        description: str,
+        user_prompt: str,
+        tech_stack: str,
+        context: str,
+        llm
+    ) -> tuple:
+        return (filename, description, user_prompt, tech_stack, context, self._flight_identity(llm))
+    
+    def _cache_get(self, cache_key: Optional[str]) -> Optional[str]:
+        if cache_key is None:
+            return None
+        return self.cache.get(cache_key)
+    
+    def _cache_set(self, cache_key: Optional[str], code: str) -> None:
+        # Empty output is almost always a failed generation; don't pin it
+        if cache_key is not None and code:
+            self.cache.set(cache_key, code)
+    
+    # The file cache reads and writes a file per entry, so the async path does it on a worker thread
+    async def _acache_get(self, cache_key: Optional[str]) -> Optional[str]:
+        if cache_key is None:
+            return None
+        return await asyncio.to_thread(self._cache_get, cache_key)
+    
+    async def _acache_set(self, cache_key: Optional[str], code: str) -> None:
+        if cache_key is not None and code:
+            await asyncio.to_thread(self._cache_set, cache_key, code)
+    
+    def _build_messages(
+        self,
+        filename: str,
+        description: str,
+        user_prompt: str,
+        tech_stack: str,
+        context: str = ""
+    ) -> list:
+        """Build the prompt for a single file."""
         system_prompt = f"""You are an expert software engineer.
 Generate ONLY the code for the file '{filename}'.
 Tech Stack: {tech_stack}
 File Purpose: {description}
 User's App Idea: {user_prompt}
-
+"""
+        if context:
+            system_prompt += f"""
+This file uses these already-written files. Reference their names exactly:
+{context}
+"""
+        system_prompt += """
 Return ONLY the raw code. No markdown, no explanations, no ```."""
 
-        messages = [
+        return [
             SystemMessage(content=system_prompt),
             HumanMessage(content=f"Write the complete code for {filename}")
         ]
-        
-        response = self.llm.invoke(messages)
-        
-        # Clean the response
-        code = response.content.strip()
+    
+    def _clean_code(self, content: str) -> str:
+        """Strip whitespace and markdown fences from the model output."""
+        code = content.strip()
         
         # Remove markdown code blocks if present
         if code.startswith("```"):
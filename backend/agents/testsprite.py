@@ -1,44 +1,106 @@
 import os
-from typing import Optional
+import re
+import json
+import textwrap
+from typing import Callable, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
-from api_config import api_config
+from agents.base import BaseAgent
 
-class TestSpriteAgent:
-    """Agent responsible for generating test scripts."""
+PLAYWRIGHT_IMPORT = "const { test, expect } = require('@playwright/test');"
+
+# Import lines fragments may include despite the prompt; the merged script declares one
+_PLAYWRIGHT_IMPORT_LINE = re.compile(
+    r"^\s*(?:import\s.*from\s*['\"]@playwright/test['\"]|(?:const|let|var)\s*\{[^}]*\}\s*=\s*require\(['\"]@playwright/test['\"]\));?\s*$",
+    re.MULTILINE
+)
+
+# Longest file excerpt sent when generating a per-file test fragment
+MAX_FRAGMENT_SOURCE_CHARS = 4000
+
+def merge_test_fragments(fragments: dict) -> str:
+    """
+    Merge per-file test fragments into one Playwright script.
+    
+    Each fragment becomes a test.describe block named after its file, in the
+    order given, so the same fragments always produce the same script.
+    """
+    blocks = [PLAYWRIGHT_IMPORT]
+    for filename, fragment in fragments.items():
+        body = _PLAYWRIGHT_IMPORT_LINE.sub("", fragment).strip()
+        if body:
+            blocks.append(f"test.describe({json.dumps(filename)}, () => {{\n{textwrap.indent(body, '  ')}\n}});")
+    return "\n\n".join(blocks) + "\n"
+
+class TestSpriteAgent(BaseAgent):
+    """
+    Agent responsible for generating test scripts.
+    
+    Stateless: pass the caller's llm to each call, or construct it with
+    credentials to use its own.
+    """
+    
+    name = "testsprite"
+    temperature = 0.2
     
-    def __init__(self, user_api_key: Optional[str] = None, user_provider: Optional[str] = None, user_base_url: Optional[str] = None):
+    def generate_tests(self, files: dict, user_prompt: str, llm=None) -> str:
         """
-        Initialize TestSprite Agent.
+        Generate Playwright test script for the application.
+        """
+        return self._clean_code(self._invoke(self._build_messages(files, user_prompt), llm))
+    
+    async def agenerate_tests(
+        self,
+        files: dict,
+        user_prompt: str,
+        on_token: Optional[Callable[[str], None]] = None,
+        llm=None
+    ) -> str:
+        """
+        Async version of generate_tests().
         
         Args:
-            user_api_key: User's own API key (REQUIRED)
-            user_provider: User's API provider (REQUIRED)
-            user_base_url: Custom base URL (optional)
+            on_token: Optional callback; when given the response is streamed
+                and every content delta is passed to it as it arrives
+            llm: The caller's LLM (defaults to the agent's own)
         """
-        self.user_api_key = user_api_key
-        self.user_provider = user_provider
-        self.user_base_url = user_base_url
-        
-        # Get LLM for user projects
-        self.llm = api_config.get_llm(
-            context="user_project",
-            user_api_key=user_api_key,
-            user_provider=user_provider,
-            user_base_url=user_base_url,
-            temperature=0.2
-        )
-    
-    def generate_tests(self, files: dict, user_prompt: str) -> str:
+        content = await self._ainvoke(self._build_messages(files, user_prompt), llm, on_token=on_token)
+        return self._clean_code(content)
+    
+    def generate_file_tests(self, filename: str, code: str, user_prompt: str, llm=None) -> str:
         """
-        Generate Playwright test script for the application.
+        Generate Playwright test cases for a single file, to be merged with
+        merge_test_fragments() once every file is done.
         """
+        return self._clean_code(self._invoke(self._build_fragment_messages(filename, code, user_prompt), llm))
+    
+    async def agenerate_file_tests(self, filename: str, code: str, user_prompt: str, llm=None) -> str:
+        """Async version of generate_file_tests()."""
+        content = await self._ainvoke(self._build_fragment_messages(filename, code, user_prompt), llm)
+        return self._clean_code(content)
+    
+    def _build_fragment_messages(self, filename: str, code: str, user_prompt: str) -> list:
+        """Build the prompt for one file's test cases."""
+        system_prompt = """You are a QA automation expert.
+Write Playwright test cases that cover ONLY the given file.
+Return ONLY test(...) blocks using the `test` and `expect` globals.
+No imports, no require, no test.describe wrapper, no markdown, no explanations."""
+
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=f"""User's App: {user_prompt}
+File: {filename}
+{code[:MAX_FRAGMENT_SOURCE_CHARS]}""")
+        ]
+    
+    def _build_messages(self, files: dict, user_prompt: str) -> list:
+        """Build the test generation prompt."""
         system_prompt = """You are a QA automation expert.
 Generate a Playwright test script that validates the core functionality.
 Return ONLY the test code. No markdown, no explanations."""
 
         file_list = "\n".join([f"- {name}: {files[name][:100]}..." for name in files.keys()])
         
-        messages = [
+        return [
             SystemMessage(content=system_prompt),
             HumanMessage(content=f"""User's App: {user_prompt}
 Files in the app:
@@ -49,11 +111,10 @@ Generate a basic Playwright test that:
 2. Tests the main functionality
 3. Verifies key elements exist""")
         ]
-        
-        response = self.llm.invoke(messages)
-        
-        # Clean the response
-        code = response.content.strip()
+    
+    def _clean_code(self, content: str) -> str:
+        """Strip whitespace and markdown fences from the model output."""
+        code = content.strip()
         if code.startswith("```"):
             lines = code.split("\n")
             code = "\n".join(lines[1:-1])
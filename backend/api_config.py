@@ -3,14 +3,70 @@ API Configuration Manager for CodeGenesis
 Handles dual API system: Platform API (A4F) and User BYOK (Bring Your Own Key)
 """
 import os
-from typing import Optional, Literal
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
+import hmac
+import json
+import hashlib
+import secrets
+from typing import TYPE_CHECKING, Optional, Literal
+import httpx
+from urllib.parse import urlparse
+from llm_pool import DEFAULT_HOST, LLMClientPool
+from cache import MemoryCache
+from rate_limit import RateLimiterRegistry, rate_limits
+from hedging import HedgePolicy, hedging
+from metrics import track_llm_call
 
-load_dotenv()
+if TYPE_CHECKING:
+    # langchain_openai is imported on first use, keeping it out of backend startup
+    from langchain_openai import ChatOpenAI
 
 APIContext = Literal["platform", "user_project"]
 
+# Predefined user providers: default model, OpenAI-compatible base URL and extra headers
+PROVIDERS = {
+    "openai": {
+        "model": "gpt-4o-mini",
+        "base_url": None
+    },
+    "anthropic": {
+        "model": "claude-3-5-sonnet-20241022",
+        "base_url": "https://api.anthropic.com/v1",
+        # Key validation probe authenticates with the native header
+        "probe_auth_header": "x-api-key",
+        "probe_headers": {"anthropic-version": "2023-06-01"}
+    },
+    "gemini": {
+        # Google AI Studio / Gemini
+        "model": "gemini-1.5-flash",
+        "base_url": "https://generativelanguage.googleapis.com/v1beta",
+        "probe_auth_header": "x-goog-api-key"
+    },
+    "openrouter": {
+        "model": "anthropic/claude-3.5-sonnet",  # Default, can be overridden
+        "base_url": "https://openrouter.ai/api/v1",
+        "headers": {"HTTP-Referer": "https://codegenesis.app", "X-Title": "CodeGenesis"},
+        # The models list is public; the key endpoint needs a valid key
+        "probe_path": "/key"
+    },
+    "a4f": {
+        # User's own A4F key
+        "model": "provider-2/gemini-2.5-flash",
+        "base_url": "https://api.a4f.co/v1"
+    }
+}
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# Ask providers for token usage on streamed responses too (stream_options.include_usage);
+# turn off for OpenAI-compatible servers that reject the option
+STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "true").lower() in ("1", "true", "yes")
+
+# Status codes from the models-list probe that prove a key is (in)valid;
+# anything else is inconclusive and falls back to a completion call. A 200 only
+# counts from a known provider: custom servers may list models without auth.
+PROBE_VALID_STATUS = {200}
+PROBE_INVALID_STATUS = {401, 403}
+
 
 class APIConfigManager:
     """
@@ -28,6 +84,34 @@ class APIConfigManager:
         
         # User BYOK defaults (can be overridden per-user)
         self.default_user_provider = os.getenv("DEFAULT_USER_PROVIDER", "a4f")  # a4f, openai, anthropic, gemini
+        
+        # Shared, reusable LLM clients (one HTTP connection pool per provider host)
+        self.client_pool = LLMClientPool(
+            max_size=int(os.getenv("LLM_POOL_MAX_SIZE", "64")),
+            idle_ttl=float(os.getenv("LLM_POOL_IDLE_TTL", "600")),
+            max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+        )
+        
+        # API key validation results, keyed by a salted hash (keys are never stored)
+        self._key_salt = os.getenv("KEY_HASH_SALT", "").encode("utf-8") or secrets.token_bytes(32)
+        self.validation_cache = MemoryCache(max_entries=int(os.getenv("VALIDATION_CACHE_ENTRIES", "4096")))
+        self.validation_ttl_valid = float(os.getenv("VALIDATION_TTL_VALID", "600"))
+        self.validation_ttl_invalid = float(os.getenv("VALIDATION_TTL_INVALID", "60"))
+        self.probe_timeout = float(os.getenv("VALIDATION_PROBE_TIMEOUT", "5"))
+        self._probe_client: Optional[httpx.Client] = None
+        self._aprobe_client: Optional[httpx.AsyncClient] = None
+        
+        # Per-provider-key admission control for every agent LLM call (see rate_limit.py)
+        self.rate_limits: RateLimiterRegistry = rate_limits
+        
+        # Hedging for slow agent calls, used by generations that opt in (see hedging.py).
+        # Duplicates go to the user's own provider unless an operator-paid secondary is configured.
+        self.hedge_provider = os.getenv("HEDGE_SECONDARY_PROVIDER")
+        self.hedge_api_key = os.getenv("HEDGE_SECONDARY_API_KEY")
+        self.hedge_base_url = os.getenv("HEDGE_SECONDARY_BASE_URL")
+        self.hedging: HedgePolicy = hedging
+        if self.hedge_provider and self.hedge_api_key:
+            self.hedging.secondary = self._get_secondary_llm
     
     def get_llm(
         self, 
@@ -36,7 +120,7 @@ class APIConfigManager:
         user_provider: Optional[str] = None,
         user_base_url: Optional[str] = None,
         temperature: float = 0.7
-    ) -> ChatOpenAI:
+    ) -> "ChatOpenAI":
         """
         Get LLM instance based on context and user configuration.
         
@@ -69,13 +153,29 @@ class APIConfigManager:
         
         raise ValueError(f"Invalid context: {context}")
     
-    def _get_a4f_llm(self, temperature: float) -> ChatOpenAI:
+    def _get_a4f_llm(self, temperature: float) -> "ChatOpenAI":
         """Get A4F API LLM instance (platform features only)"""
-        return ChatOpenAI(
-            model=self.platform_model,
-            openai_api_key=self.platform_api_key,
-            openai_api_base=self.platform_base_url,
-            temperature=temperature
+        from langchain_openai import ChatOpenAI
+        
+        return self.client_pool.get(
+            "platform",
+            self.platform_api_key,
+            self.platform_base_url,
+            temperature,
+            lambda http_client, http_async_client: ChatOpenAI(
+                model=self.platform_model,
+                openai_api_key=self.platform_api_key,
+                openai_api_base=self.platform_base_url,
+                temperature=temperature,
+                stream_usage=STREAM_USAGE,
+                max_retries=0,
+                metadata={
+                    "provider": "platform",
+                    "rate_limit_key": self.rate_limit_key("platform", self.platform_base_url, self.platform_api_key)
+                },
+                http_client=http_client,
+                http_async_client=http_async_client
+            )
         )
     
     def _get_user_llm(
@@ -84,69 +184,82 @@ class APIConfigManager:
         provider: str, 
         base_url: Optional[str],
         temperature: float
-    ) -> ChatOpenAI:
+    ) -> "ChatOpenAI":
         """Get user's custom LLM instance based on their provider"""
+        from langchain_openai import ChatOpenAI
         
-        # If custom base URL is provided, use it
-        if base_url:
-            return ChatOpenAI(
-                model="default",  # Model name might be specified in base URL
-                openai_api_key=api_key,
-                openai_api_base=base_url,
-                temperature=temperature
-            )
-        
-        # Predefined providers
-        if provider == "openai":
-            return ChatOpenAI(
-                model="gpt-4o-mini",
-                openai_api_key=api_key,
-                temperature=temperature
-            )
-        
-        elif provider == "anthropic":
-            return ChatOpenAI(
-                model="claude-3-5-sonnet-20241022",
-                openai_api_key=api_key,
-                openai_api_base="https://api.anthropic.com/v1",
-                temperature=temperature
-            )
-        
-        elif provider == "gemini":
-            # Google AI Studio / Gemini
-            return ChatOpenAI(
-                model="gemini-1.5-flash",
-                openai_api_key=api_key,
-                openai_api_base="https://generativelanguage.googleapis.com/v1beta",
-                temperature=temperature
-            )
+        model, base_url, headers = self._resolve_provider(provider, base_url)
         
-        elif provider == "openrouter":
-            # OpenRouter
-            return ChatOpenAI(
-                model="anthropic/claude-3.5-sonnet", # Default, can be overridden
+        return self.client_pool.get(
+            provider,
+            api_key,
+            base_url,
+            temperature,
+            lambda http_client, http_async_client: ChatOpenAI(
+                model=model,
                 openai_api_key=api_key,
-                openai_api_base="https://openrouter.ai/api/v1",
+                openai_api_base=base_url,
                 temperature=temperature,
-                default_headers={"HTTP-Referer": "https://codegenesis.app", "X-Title": "CodeGenesis"}
+                default_headers=headers,
+                stream_usage=STREAM_USAGE,
+                max_retries=0,
+                metadata={
+                    "provider": provider,
+                    "rate_limit_key": self.rate_limit_key(provider, base_url, api_key)
+                },
+                http_client=http_client,
+                http_async_client=http_async_client
             )
+        )
+    
+    def _get_secondary_llm(self, llm) -> "ChatOpenAI":
+        """The secondary provider's LLM at the temperature of llm, for hedges and failover."""
+        return self._get_user_llm(self.hedge_api_key, self.hedge_provider, self.hedge_base_url, llm.temperature)
+    
+    def _resolve_provider(self, provider: str, base_url: Optional[str]) -> tuple:
+        """
+        Resolve (model, base_url, headers) for a user provider.
         
-        elif provider == "a4f":
-            # User's own A4F key
-            return ChatOpenAI(
-                model="provider-2/gemini-2.5-flash",
-                openai_api_key=api_key,
-                openai_api_base="https://api.a4f.co/v1",
-                temperature=temperature
-            )
+        Raises:
+            ValueError: If the provider is unknown and no custom base URL is given
+        """
+        # If custom base URL is provided, use it
+        if base_url:
+            # Model name might be specified in base URL
+            return "default", base_url, None
         
-        else:
+        if provider not in PROVIDERS:
             raise ValueError(f"Unsupported provider: {provider}")
+        
+        config = PROVIDERS[provider]
+        return config["model"], config["base_url"], config.get("headers")
+    
+    def pool_stats(self) -> dict:
+        """LLM client pool metrics."""
+        return self.client_pool.stats()
+    
+    def rate_limit_key(self, provider: str, base_url: Optional[str], api_key: Optional[str]) -> str:
+        """Limiter key for a provider key: provider, host and a short salted key fingerprint."""
+        host = urlparse(base_url).hostname if base_url else DEFAULT_HOST
+        fingerprint = hmac.new(self._key_salt, (api_key or "").encode("utf-8"), hashlib.sha256).hexdigest()
+        return f"{provider}:{host}:{fingerprint[:12]}"
+    
+    def rate_limit_stats(self) -> dict:
+        """Per-provider-key limiter state: window, in-flight calls, tokens, 429s and retries."""
+        return self.rate_limits.stats()
+    
+    def hedge_stats(self) -> dict:
+        """Hedges fired, won and skipped, failovers and current hedge thresholds."""
+        return self.hedging.stats()
 
     
     def validate_user_api_key(self, api_key: str, provider: str, base_url: Optional[str] = None) -> bool:
         """
-        Validate user's API key by making a test call.
+        Validate user's API key.
+        
+        Results are cached for VALIDATION_TTL_VALID / VALIDATION_TTL_INVALID
+        seconds. On a miss a models-list request is tried first; only when it
+        is inconclusive is a test completion made.
         
         Args:
             api_key: User's API key
@@ -156,15 +269,119 @@ class APIConfigManager:
         Returns:
             True if valid, False otherwise
         """
+        cache_key = self._validation_cache_key(api_key, provider, base_url)
+        cached = self.validation_cache.get(cache_key)
+        if cached is not None:
+            return cached == "valid"
+        
+        try:
+            valid = self._probe_key(api_key, provider, base_url)
+            if valid is None:
+                # Fix: Pass None for base_url if not provided, and pass temperature as keyword arg
+                llm = self._get_user_llm(api_key, provider, base_url, temperature=0.1)
+                # Make a simple test call, retried by the limiter so a 429 or 5xx is not taken for a bad key
+                with track_llm_call(llm, "validate_key"):
+                    self.rate_limits.run(llm, lambda: llm.invoke("Say 'OK'"))
+                valid = True
+        except Exception as e:
+            print(f"API key validation failed: {e}")
+            return self._validation_failed(cache_key, e)
+        
+        self._cache_validation(cache_key, valid)
+        return valid
+    
+    async def avalidate_user_api_key(self, api_key: str, provider: str, base_url: Optional[str] = None) -> bool:
+        """Async version of validate_user_api_key()."""
+        cache_key = self._validation_cache_key(api_key, provider, base_url)
+        cached = self.validation_cache.get(cache_key)
+        if cached is not None:
+            return cached == "valid"
+        
         try:
-            # Fix: Pass None for base_url if not provided, and pass temperature as keyword arg
-            llm = self._get_user_llm(api_key, provider, base_url, temperature=0.1)
-            # Make a simple test call
-            response = llm.invoke("Say 'OK'")
-            return True
+            valid = await self._aprobe_key(api_key, provider, base_url)
+            if valid is None:
+                llm = self._get_user_llm(api_key, provider, base_url, temperature=0.1)
+                with track_llm_call(llm, "validate_key"):
+                    await self.rate_limits.arun(llm, lambda: llm.ainvoke("Say 'OK'"))
+                valid = True
         except Exception as e:
             print(f"API key validation failed: {e}")
+            return self._validation_failed(cache_key, e)
+        
+        self._cache_validation(cache_key, valid)
+        return valid
+    
+    def _validation_cache_key(self, api_key: str, provider: str, base_url: Optional[str]) -> str:
+        """Salted HMAC of the credentials, so the cache never holds a usable key."""
+        payload = json.dumps([api_key, provider, base_url]).encode("utf-8")
+        return hmac.new(self._key_salt, payload, hashlib.sha256).hexdigest()
+    
+    def _cache_validation(self, cache_key: str, valid: bool) -> None:
+        self.validation_cache.set(
+            cache_key,
+            "valid" if valid else "invalid",
+            ttl=self.validation_ttl_valid if valid else self.validation_ttl_invalid
+        )
+    
+    def _validation_failed(self, cache_key: str, error: Exception) -> bool:
+        """Cache rejections from the provider; transient errors are not cached."""
+        status = getattr(error, "status_code", None)
+        if status in PROBE_INVALID_STATUS:
+            self._cache_validation(cache_key, False)
+        return False
+    
+    def _probe_request(self, api_key: str, provider: str, base_url: Optional[str]) -> tuple:
+        """Build the (url, headers) for a models-list probe (or the provider's probe_path)."""
+        config = {} if base_url else PROVIDERS.get(provider, {})
+        _, resolved_base_url, headers = self._resolve_provider(provider, base_url)
+        url = (resolved_base_url or OPENAI_BASE_URL).rstrip("/") + config.get("probe_path", "/models")
+        
+        headers = dict(headers or {})
+        headers.update(config.get("probe_headers", {}))
+        auth_header = config.get("probe_auth_header")
+        if auth_header:
+            headers[auth_header] = api_key
+        else:
+            headers["Authorization"] = f"Bearer {api_key}"
+        return url, headers
+    
+    def _probe_key(self, api_key: str, provider: str, base_url: Optional[str]) -> Optional[bool]:
+        """Cheap models-list probe. Returns None when the result is inconclusive."""
+        url, headers = self._probe_request(api_key, provider, base_url)
+        if self._probe_client is None:
+            self._probe_client = httpx.Client(timeout=self.probe_timeout)
+        try:
+            response = self._probe_client.get(url, headers=headers)
+        except httpx.HTTPError:
+            return None
+        return self._probe_result(response.status_code, authenticated=not base_url)
+    
+    async def _aprobe_key(self, api_key: str, provider: str, base_url: Optional[str]) -> Optional[bool]:
+        """Async version of _probe_key()."""
+        url, headers = self._probe_request(api_key, provider, base_url)
+        if self._aprobe_client is None:
+            self._aprobe_client = httpx.AsyncClient(timeout=self.probe_timeout)
+        try:
+            response = await self._aprobe_client.get(url, headers=headers)
+        except httpx.HTTPError:
+            return None
+        return self._probe_result(response.status_code, authenticated=not base_url)
+    
+    @staticmethod
+    def _probe_result(status_code: int, authenticated: bool) -> Optional[bool]:
+        """
+        Map a probe status to valid (True), invalid (False) or inconclusive (None).
+        
+        Args:
+            status_code: HTTP status of the probe
+            authenticated: Whether the probed endpoint is known to require a
+                key; a 200 from one that may not proves nothing
+        """
+        if status_code in PROBE_VALID_STATUS:
+            return True if authenticated else None
+        if status_code in PROBE_INVALID_STATUS:
             return False
+        return None
 
 
 # Global instance
@@ -0,0 +1,128 @@
+"""
+Project Archives for CodeGenesis
+Streams zip / tar.gz exports of a project one chunk at a time
+"""
+import io
+import tarfile
+import time
+import zipfile
+import zlib
+from collections.abc import Mapping
+from typing import Iterator, Union
+
+CHUNK_SIZE = 64 * 1024
+
+ARCHIVE_FORMATS = {
+    "zip": "application/zip",
+    "tar.gz": "application/gzip"
+}
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Unseekable sink that collects written bytes until they are drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _as_bytes(files: Mapping, path: str) -> Union[bytes, memoryview]:
+    """File content as bytes, using the VFS's zero-copy views when available."""
+    if hasattr(files, "read_bytes"):
+        return files.read_bytes(path)
+    content = files[path]
+    return content.encode("utf-8") if isinstance(content, str) else content
+
+
+def _chunks(data: Union[bytes, memoryview]) -> Iterator[memoryview]:
+    view = memoryview(data)
+    for start in range(0, len(view), CHUNK_SIZE):
+        yield view[start:start + CHUNK_SIZE]
+
+
+def stream_zip(files: Mapping, compression_level: int = 6) -> Iterator[bytes]:
+    """
+    Yield a zip archive of files (path -> content) chunk by chunk.
+
+    Only one file's content is encoded at a time, and output is handed out
+    every CHUNK_SIZE bytes of input, so the archive is never built in memory.
+    Level 0 stores files uncompressed.
+    """
+    sink = _ChunkBuffer()
+    compression = zipfile.ZIP_STORED if compression_level == 0 else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(sink, "w", compression=compression, compresslevel=compression_level or None) as archive:
+        for path in files:
+            data = _as_bytes(files, path)
+            with archive.open(path, "w", force_zip64=len(data) >= zipfile.ZIP64_LIMIT) as entry:
+                for chunk in _chunks(data):
+                    entry.write(chunk)
+                    output = sink.drain()
+                    if output:
+                        yield output
+            output = sink.drain()
+            if output:
+                yield output
+
+    yield sink.drain()
+
+
+def stream_tar_gz(files: Mapping, compression_level: int = 6) -> Iterator[bytes]:
+    """
+    Yield a gzip-compressed tar archive of files (path -> content) chunk by chunk.
+
+    Tar headers come from TarInfo.tobuf() and the gzip stream from zlib, so
+    nothing but the current chunk is ever buffered.
+    """
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    mtime = int(time.time())
+
+    for path in files:
+        data = _as_bytes(files, path)
+        info = tarfile.TarInfo(path)
+        info.size = len(data)
+        info.mtime = mtime
+        info.mode = 0o644
+
+        output = compressor.compress(info.tobuf(tarfile.PAX_FORMAT))
+        for chunk in _chunks(data):
+            output += compressor.compress(chunk)
+            if output:
+                yield output
+            output = b""
+
+        remainder = info.size % tarfile.BLOCKSIZE
+        if remainder:
+            output += compressor.compress(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+        if output:
+            yield output
+
+    # End-of-archive marker: two empty blocks
+    yield compressor.compress(tarfile.NUL * tarfile.BLOCKSIZE * 2) + compressor.flush()
+
+
+def stream_archive(files: Mapping, archive_format: str = "zip", compression_level: int = 6) -> Iterator[bytes]:
+    """
+    Stream files as a zip or tar.gz archive.
+
+    Raises:
+        ValueError: If the format or compression level is not supported
+    """
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unsupported archive format: {archive_format}")
+    if not 0 <= compression_level <= 9:
+        raise ValueError("Compression level must be between 0 and 9")
+
+    if archive_format == "zip":
+        return stream_zip(files, compression_level)
+    return stream_tar_gz(files, compression_level)
@@ -0,0 +1,194 @@
+"""
+Batch Generation for CodeGenesis
+Runs many generations through one shared, bounded executor and summarizes the batch
+"""
+import asyncio
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from metrics import count_llm_calls
+
+# Batch generations in flight across every batch; their LLM calls are further
+# paced per provider key by rate_limits, whose window follows the provider's limits
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# Most prompts accepted in one batch request
+MAX_BATCH_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "500"))
+
+
+class BatchExecutor:
+    """
+    Process-wide bound on batch generations in flight.
+
+    Shared by every batch, so concurrent batches split the slots instead of
+    each starting its own pool. Slots are granted in request order.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_BATCH_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queued = 0
+        self.running = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one generation slot for the duration of the block."""
+        semaphore = self._get_semaphore()
+        self.queued += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queued": self.queued,
+            "running": self.running
+        }
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # One semaphore per event loop (the app has one; tests start several)
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore, self._loop = asyncio.Semaphore(self.concurrency), loop
+        return self._semaphore
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """q-th percentile (0-100) with linear interpolation between ranks."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+async def run_batch(
+    prompts: List[str],
+    generate: Callable[[str], Awaitable[dict]],
+    executor: Optional[BatchExecutor] = None,
+    max_concurrency: Optional[int] = None
+) -> AsyncIterator[dict]:
+    """
+    Generate every prompt and yield one event per project as it finishes.
+
+    Yields {"event": "project", ...} in completion order, each with the
+    prompt's index, its status ("completed" or "failed"), latency, LLM calls
+    and tokens, and then one {"event": "summary", ...} for the whole batch.
+    Only as many generations as the batch may run at once are started;
+    each one that finishes starts the next prompt. Leaving the iterator
+    early cancels the generations still running.
+
+    Args:
+        prompts: Prompts to generate
+        generate: Runs one generation; a result with an "error" key counts as failed
+        executor: Shared executor to run in (defaults to batch_executor)
+        max_concurrency: Optional cap on this batch's generations in flight
+    """
+    executor = executor or batch_executor
+    window = min(max_concurrency or executor.concurrency, executor.concurrency)
+    start = time.monotonic()
+
+    async def generate_one(index: int, prompt: str) -> dict:
+        async with executor.slot():
+            started = time.monotonic()
+            with count_llm_calls() as usage:
+                try:
+                    result = await generate(prompt)
+                except Exception as e:
+                    result = {"error": "GENERATION_FAILED", "message": str(e), "status": "error"}
+            event = {
+                "event": "project",
+                "index": index,
+                "prompt": prompt,
+                "status": "failed" if "error" in result else "completed",
+                "latency": round(time.monotonic() - started, 3),
+                "llm_calls": usage[0],
+                "tokens": {"prompt": usage[1], "completion": usage[2]}
+            }
+        if "error" in result:
+            event.update(error=result["error"], message=result.get("message", ""))
+            if "project_id" in result:
+                # Checkpointed; resume with /api/generate/{project_id}/resume
+                event["project_id"] = result["project_id"]
+        else:
+            event["result"] = result
+        return event
+
+    remaining = iter(enumerate(prompts))
+    running = set()
+
+    def refill() -> None:
+        # Tasks are created only for the prompts that can run now, not the whole batch
+        for index, prompt in itertools.islice(remaining, window - len(running)):
+            running.add(asyncio.create_task(generate_one(index, prompt)))
+
+    events = []
+    try:
+        refill()
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            running -= done
+            refill()
+            for event in sorted((task.result() for task in done), key=lambda event: event["index"]):
+                events.append(event)
+                yield event
+    finally:
+        for task in running:
+            task.cancel()
+
+    yield summarize_batch(events, time.monotonic() - start)
+
+
+def summarize_batch(events: List[dict], elapsed: float) -> dict:
+    """Batch-wide token, latency and failure figures from its project events."""
+    latencies = [event["latency"] for event in events]
+    failures = {}
+    for event in events:
+        if event["status"] == "failed":
+            failures[event["error"]] = failures.get(event["error"], 0) + 1
+    prompt_tokens = sum(event["tokens"]["prompt"] for event in events)
+    completion_tokens = sum(event["tokens"]["completion"] for event in events)
+
+    def seconds(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value, 3)
+
+    return {
+        "event": "summary",
+        "projects": len(events),
+        "completed": len(events) - sum(failures.values()),
+        "failed": sum(failures.values()),
+        "failures": failures,
+        # Files that failed inside otherwise completed projects
+        "file_errors": sum(len(event["result"].get("errors") or {}) for event in events if "result" in event),
+        "llm_calls": sum(event["llm_calls"] for event in events),
+        "tokens": {
+            "prompt": prompt_tokens,
+            "completion": completion_tokens,
+            "total": prompt_tokens + completion_tokens
+        },
+        "latency": {
+            "p50": seconds(percentile(latencies, 50)),
+            "p95": seconds(percentile(latencies, 95)),
+            "max": seconds(max(latencies, default=None)),
+            "mean": seconds(sum(latencies) / len(latencies) if latencies else None)
+        },
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(events) / elapsed, 3) if elapsed > 0 else None
+    }
+
+
+# Shared by every batch request
+batch_executor = BatchExecutor()
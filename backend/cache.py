@@ -0,0 +1,347 @@
+"""
+Caching for CodeGenesis
+Content-addressed caches that let repeated generations skip LLM calls
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def make_cache_key(*parts) -> str:
+    """Content-address a tuple of inputs as a sha256 hex digest."""
+    payload = json.dumps([str(part) for part in parts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Fold case and collapse whitespace so trivially different prompts share a key."""
+    return " ".join(prompt.split()).casefold()
+
+
+class DiskCache:
+    """
+    Size-bounded on-disk cache with LRU eviction and per-entry TTL.
+
+    Each entry is one JSON file named by its key. Recency is tracked in memory
+    and mirrored to file mtimes, so the LRU order survives restarts.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, default_ttl: float = 7 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value, or None on a miss or expired entry."""
+        path = self._path(key)
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            if entry["expires_at"] < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._index.move_to_end(key)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self.hits += 1
+            return entry["value"]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """Store a value, evicting least recently used entries over max_bytes."""
+        data = json.dumps({
+            "expires_at": time.time() + (ttl if ttl is not None else self.default_ttl),
+            "value": value
+        }).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Cache write failed: {e}")
+                return
+
+            self._total_bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+
+            while self._total_bytes > self.max_bytes:
+                oldest = next(iter(self._index))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _remove(self, key: str) -> None:
+        self._total_bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU index from files already on disk."""
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+
+class MemoryCache:
+    """Bounded in-process LRU cache with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 3600):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + (ttl if ttl is not None else self.default_ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+class SQLiteCache:
+    """
+    Persistent cache in a SQLite file with LRU eviction and per-entry TTL.
+
+    The database runs in WAL mode, so every uvicorn worker on the host can
+    share one file and its entries survive restarts.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, default_ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # A lost entry only costs a regeneration, so skip the fsync on every commit
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> Optional[tuple]:
+        """(value, expires_at) of a live entry, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0], row[1]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+class TieredCache:
+    """Memory tier in front of a persistent tier; persistent hits are promoted for their remaining TTL."""
+
+    def __init__(self, memory: MemoryCache, persistent: SQLiteCache):
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        entry = self.persistent.get_entry(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        self.memory.set(key, value, ttl=expires_at - time.time())
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.memory.set(key, value, ttl)
+        self.persistent.set(key, value, ttl)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.persistent.clear()
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        persistent = self.persistent.stats()
+        # Every lookup reaches the memory tier; only its misses reach the persistent tier
+        lookups = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + persistent["hits"]
+        return {
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory": memory,
+            "persistent": persistent
+        }
+
+
+_CACHE_ROOT = os.path.join(tempfile.gettempdir(), "codegenesis")
+
+# Shared cache for EngineerAgent.write_file outputs
+file_cache = DiskCache(
+    os.getenv("FILE_CACHE_DIR", os.path.join(_CACHE_ROOT, "file_cache")),
+    max_bytes=int(os.getenv("FILE_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    default_ttl=float(os.getenv("FILE_CACHE_TTL", str(7 * 24 * 3600)))
+)
+
+# Shared cache for ArchitectAgent.plan results
+plan_cache = TieredCache(
+    MemoryCache(
+        max_entries=int(os.getenv("PLAN_CACHE_MEMORY_ENTRIES", "512")),
+        default_ttl=float(os.getenv("PLAN_CACHE_TTL", str(24 * 3600)))
+    ),
+    SQLiteCache(
+        os.getenv("PLAN_CACHE_DB", os.path.join(_CACHE_ROOT, "plan_cache.sqlite3")),
+        max_entries=int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "10000")),
+        default_ttl=float(os.getenv("PLAN_CACHE_TTL", str(24 * 3600)))
+    )
+)
@@ -0,0 +1,144 @@
+"""
+Generation Checkpoints for CodeGenesis
+Persists workflow state after every node and engineer output after every file, so generations can resume
+"""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, AsyncIterator, Sequence
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# Checkpoint generations so a crashed or failed run can resume without repeating LLM calls
+CHECKPOINTS_ENABLED = os.getenv("CHECKPOINTS", "true").lower() in ("1", "true", "yes")
+# Checkpoints of generations that never finished are dropped after this many seconds
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL", str(7 * 24 * 3600)))
+
+
+class SqliteCheckpointer(SqliteSaver):
+    """
+    LangGraph's SqliteSaver, usable from both invoke() and ainvoke().
+
+    The async methods run the sync ones on a worker thread so disk writes do
+    not block the event loop; SqliteSaver serializes them on its own lock.
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator:
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+class GenerationCheckpoints:
+    """
+    SQLite store for resumable generations, keyed by project ID.
+
+    - saver: the LangGraph checkpointer, which saves the workflow state after
+      every node (architect, engineer, testsprite)
+    - a file ledger, which saves each engineer file (and its pipelined test
+      fragment) as soon as it is written, so a resumed engineer node only
+      writes the files that are still missing
+
+    Checkpoints hold prompts and generated code, never API keys.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.saver = SqliteCheckpointer(sqlite3.connect(path, timeout=5, check_same_thread=False))
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generation_files ("
+            "project_id TEXT NOT NULL, filename TEXT NOT NULL, description TEXT NOT NULL, "
+            "tech_stack TEXT NOT NULL, code TEXT NOT NULL, test_fragment TEXT, "
+            "PRIMARY KEY (project_id, filename))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations (project_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+        )
+
+    def touch(self, project_id: str) -> None:
+        """Mark a generation as active (checkpoints are pruned by last activity)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO generations (project_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT (project_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (project_id, time.time())
+            )
+
+    def save_file(self, project_id: str, filename: str, description: str, tech_stack: str, code: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generation_files "
+                "(project_id, filename, description, tech_stack, code) VALUES (?, ?, ?, ?, ?)",
+                (project_id, filename, description, tech_stack, code)
+            )
+
+    def save_fragment(self, project_id: str, filename: str, fragment: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE generation_files SET test_fragment = ? WHERE project_id = ? AND filename = ?",
+                (fragment, project_id, filename)
+            )
+
+    def completed_files(self, project_id: str, descriptions: dict, tech_stack: str) -> tuple:
+        """
+        Files already written for a generation whose plan entry is unchanged.
+
+        Returns:
+            (files, fragments): code and saved test fragments by filename
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename, description, tech_stack, code, test_fragment FROM generation_files WHERE project_id = ?",
+                (project_id,)
+            ).fetchall()
+
+        files, fragments = {}, {}
+        for filename, description, saved_stack, code, fragment in rows:
+            if descriptions.get(filename) == description and saved_stack == tech_stack:
+                files[filename] = code
+                if fragment is not None:
+                    fragments[filename] = fragment
+        return files, fragments
+
+    def delete(self, project_id: str) -> None:
+        """Drop a generation's checkpoints and saved files."""
+        self.saver.delete_thread(project_id)
+        with self._lock:
+            self._conn.execute("DELETE FROM generation_files WHERE project_id = ?", (project_id,))
+            self._conn.execute("DELETE FROM generations WHERE project_id = ?", (project_id,))
+
+    def prune(self, max_age: float = CHECKPOINT_TTL) -> int:
+        """Drop generations inactive for max_age seconds; returns how many."""
+        with self._lock:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT project_id FROM generations WHERE updated_at < ?",
+                (time.time() - max_age,)
+            )]
+        for project_id in stale:
+            self.delete(project_id)
+        return len(stale)
+
+
+# Shared checkpoint store (survives restarts); None when CHECKPOINTS is off
+generation_checkpoints = GenerationCheckpoints(
+    os.getenv("CHECKPOINT_DB", os.path.join(tempfile.gettempdir(), "codegenesis", "checkpoints.sqlite3"))
+) if CHECKPOINTS_ENABLED else None
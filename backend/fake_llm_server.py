@@ -0,0 +1,315 @@
+"""
+Fake LLM Server for CodeGenesis
+Local OpenAI-compatible chat-completions stand-in for offline load testing
+
+    uvicorn fake_llm_server:app --port 9000
+    python fake_llm_server.py --port 9000 --latency lognormal:0.8,0.5 --tokens-per-second 80
+
+Point the backend at it with user_provider "custom" and
+user_base_url "http://localhost:9000/v1"; any API key works except ones
+starting with "sk-invalid", which are rejected like a revoked key.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from typing import Callable, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Time to first token: fixed:S | uniform:MIN,MAX | normal:MEAN,STDDEV | lognormal:MEDIAN,SIGMA | exponential:MEAN
+DEFAULT_LATENCY = os.getenv("FAKE_LLM_LATENCY", "fixed:0")
+# Completion tokens per second after the first token (0 = no delay)
+DEFAULT_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0"))
+# Fraction of requests answered with a 500 / a 429
+DEFAULT_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+DEFAULT_RATE_LIMIT_RATE = float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0"))
+# Retry-After (seconds) sent with 429s
+DEFAULT_RETRY_AFTER = float(os.getenv("FAKE_LLM_RETRY_AFTER", "1"))
+# Requests beyond this many in flight get a 429, like a provider's concurrency cap (0 = unlimited)
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("FAKE_LLM_MAX_CONCURRENCY", "0"))
+# Files in architect plans and approximate tokens per generated file
+DEFAULT_PLAN_FILES = int(os.getenv("FAKE_LLM_PLAN_FILES", "3"))
+DEFAULT_FILE_TOKENS = int(os.getenv("FAKE_LLM_FILE_TOKENS", "200"))
+
+MODELS = ["fake-gpt", "default"]
+
+# Characters per token, for usage accounting and stream pacing
+CHARS_PER_TOKEN = 4
+# Tokens sent per streamed chunk
+CHUNK_TOKENS = 4
+
+_ENGINEER_FILE = re.compile(r"code for the file '([^']+)'")
+_PLAN_FILE_NAMES = ["index.html", "style.css", "script.js"]
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution spec into a sampler returning seconds (never negative).
+
+    Raises:
+        ValueError: If the distribution or its parameters are invalid
+    """
+    name, _, args = spec.partition(":")
+    try:
+        params = [float(arg) for arg in args.split(",")] if args else []
+    except ValueError:
+        raise ValueError(f"Invalid latency parameters: {spec}")
+
+    distributions = {
+        "fixed": (1, lambda rng, s: s),
+        "uniform": (2, lambda rng, low, high: rng.uniform(low, high)),
+        "normal": (2, lambda rng, mean, stddev: rng.gauss(mean, stddev)),
+        "lognormal": (2, lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0),
+        "exponential": (1, lambda rng, mean: rng.expovariate(1 / mean) if mean > 0 else 0.0)
+    }
+    if name not in distributions:
+        raise ValueError(f"Unknown latency distribution: {name}")
+    arity, sample = distributions[name]
+    if len(params) != arity:
+        raise ValueError(f"{name} latency takes {arity} parameter(s): {spec}")
+
+    return lambda rng: max(0.0, sample(rng, *params))
+
+
+class FakeLLMConfig:
+    """Behaviour of a fake server; unset options use the FAKE_LLM_* environment defaults."""
+
+    def __init__(
+        self,
+        latency: Optional[str] = None,
+        tokens_per_second: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        rate_limit_rate: Optional[float] = None,
+        retry_after: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        plan_files: Optional[int] = None,
+        file_tokens: Optional[int] = None,
+        seed: Optional[int] = None
+    ):
+        """
+        Raises:
+            ValueError: If the latency spec is invalid
+        """
+        self.latency = latency or DEFAULT_LATENCY
+        self.sample_latency = parse_latency(self.latency)
+        self.tokens_per_second = DEFAULT_TOKENS_PER_SECOND if tokens_per_second is None else tokens_per_second
+        self.error_rate = DEFAULT_ERROR_RATE if error_rate is None else error_rate
+        self.rate_limit_rate = DEFAULT_RATE_LIMIT_RATE if rate_limit_rate is None else rate_limit_rate
+        self.retry_after = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+        self.max_concurrency = DEFAULT_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        self.plan_files = max(1, DEFAULT_PLAN_FILES if plan_files is None else plan_files)
+        self.file_tokens = DEFAULT_FILE_TOKENS if file_tokens is None else file_tokens
+        self.random = random.Random(seed)
+
+
+def count_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def fake_reply(messages: list, config: FakeLLMConfig) -> str:
+    """Plausible output for the CodeGenesis agent that sent these messages."""
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+
+    if "software architect" in system:
+        names = (_PLAN_FILE_NAMES + [f"module{n}.js" for n in range(1, config.plan_files)])[:config.plan_files]
+        return json.dumps({
+            "tech_stack": "HTML + CSS + JS",
+            "files": {name: f"Fake {name}" for name in names},
+            "dependencies": {names[0]: names[1:]} if len(names) > 1 else {}
+        })
+
+    if "QA automation" in system:
+        test = "test('app loads', async ({ page }) => {\n  await page.goto('/');\n  await expect(page).toHaveTitle(/.*/);\n});"
+        if "test(...) blocks" in system:
+            return test
+        return "const { test, expect } = require('@playwright/test');\n\n" + test
+
+    match = _ENGINEER_FILE.search(system)
+    if match:
+        filename = match.group(1)
+        comment = "<!-- {} -->" if filename.endswith((".html", ".htm")) else "/* {} */"
+        lines = [comment.format(f"{filename}: generated by the fake LLM server")]
+        while count_tokens("\n".join(lines)) < config.file_tokens:
+            lines.append(comment.format(f"line {len(lines)} of {filename}"))
+        return "\n".join(lines)
+
+    return "This is a fake response from the local LLM server."
+
+
+def _error(status: int, message: str, error_type: str, headers: Optional[dict] = None) -> JSONResponse:
+    """OpenAI-style error body."""
+    return JSONResponse(
+        {"error": {"message": message, "type": error_type, "code": status}},
+        status_code=status,
+        headers=headers
+    )
+
+
+def create_app(config: Optional[FakeLLMConfig] = None) -> FastAPI:
+    """Build a fake server with the given behaviour."""
+    config = config or FakeLLMConfig()
+    app = FastAPI(title="CodeGenesis Fake LLM")
+    app.state.config = config
+    stats = {"requests": 0, "in_flight": 0, "rate_limited": 0, "errors": 0, "completion_tokens": 0}
+    app.state.stats = stats
+
+    def rejected(request: Request) -> Optional[JSONResponse]:
+        key = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not key or key.startswith("sk-invalid"):
+            return _error(401, "Incorrect API key provided", "invalid_request_error")
+        return None
+
+    @app.get("/v1/models")
+    def list_models(request: Request):
+        return rejected(request) or {
+            "object": "list",
+            "data": [{"id": model, "object": "model", "created": 0, "owned_by": "codegenesis"} for model in MODELS]
+        }
+
+    @app.get("/fake/stats")
+    def fake_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        stats["requests"] += 1
+        denied = rejected(request)
+        if denied is not None:
+            return denied
+
+        body = await request.json()
+        rng = config.random
+        if config.max_concurrency and stats["in_flight"] >= config.max_concurrency:
+            return _rate_limited()
+        if rng.random() < config.rate_limit_rate:
+            return _rate_limited()
+
+        stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(config.sample_latency(rng))
+            if rng.random() < config.error_rate:
+                stats["errors"] += 1
+                return _error(500, "Injected server error", "server_error")
+
+            messages = body.get("messages", [])
+            content = fake_reply(messages, config)
+            usage = {
+                "prompt_tokens": sum(count_tokens(str(m.get("content") or "")) for m in messages),
+                "completion_tokens": count_tokens(content)
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            stats["completion_tokens"] += usage["completion_tokens"]
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            model = body.get("model") or MODELS[0]
+
+            if body.get("stream"):
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                # The stream takes its own in-flight slot while it is being sent (see _stream)
+                return StreamingResponse(
+                    _stream(completion_id, model, content, usage if include_usage else None),
+                    media_type="text/event-stream"
+                )
+
+            if config.tokens_per_second > 0:
+                await asyncio.sleep(usage["completion_tokens"] / config.tokens_per_second)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            }
+        finally:
+            stats["in_flight"] -= 1
+
+    def _rate_limited() -> JSONResponse:
+        stats["rate_limited"] += 1
+        return _error(
+            429,
+            "Rate limit reached for requests",
+            "rate_limit_error",
+            headers={"Retry-After": f"{config.retry_after:g}"}
+        )
+
+    async def _stream(completion_id: str, model: str, content: str, usage: Optional[dict]):
+        def chunk(delta: dict, finish_reason: Optional[str] = None) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }) + "\n\n"
+
+        step = CHUNK_TOKENS * CHARS_PER_TOKEN
+        # Counted inside the generator: one that never starts (the client left) never held a slot
+        stats["in_flight"] += 1
+        try:
+            yield chunk({"role": "assistant", "content": ""})
+            for start in range(0, len(content), step):
+                if config.tokens_per_second > 0 and start:
+                    await asyncio.sleep(CHUNK_TOKENS / config.tokens_per_second)
+                yield chunk({"content": content[start:start + step]})
+            yield chunk({}, "stop")
+            if usage is not None:
+                yield "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": usage
+                }) + "\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["in_flight"] -= 1
+
+    return app
+
+
+# Server with the FAKE_LLM_* environment settings, for `uvicorn fake_llm_server:app`
+app = create_app()
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible fake LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", help="e.g. fixed:0.5, uniform:0.2,1, lognormal:0.8,0.5")
+    parser.add_argument("--tokens-per-second", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--rate-limit-rate", type=float)
+    parser.add_argument("--retry-after", type=float)
+    parser.add_argument("--max-concurrency", type=int)
+    parser.add_argument("--plan-files", type=int)
+    parser.add_argument("--file-tokens", type=int)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(FakeLLMConfig(
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            retry_after=args.retry_after,
+            max_concurrency=args.max_concurrency,
+            plan_files=args.plan_files,
+            file_tokens=args.file_tokens,
+            seed=args.seed
+        )),
+        host=args.host,
+        port=args.port
+    )
@@ -0,0 +1,238 @@
+"""
+Hedged LLM Calls for CodeGenesis
+Duplicate calls slower than recent ones to the same or a secondary provider, keep the first answer
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+from metrics import llm_hedges, llm_provider
+from rate_limit import call_timing, classify_error, rate_limits
+
+T = TypeVar("T")
+
+# Hedge once a call is slower than this percentile of recent calls by the same agent and provider
+DEFAULT_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+# Never hedge sooner than this many seconds, nor before HEDGE_MIN_SAMPLES latencies are known
+DEFAULT_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2"))
+DEFAULT_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Recent latencies kept per agent and provider
+DEFAULT_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+# Extra calls one generation may make: HEDGE_BUDGET_MIN plus HEDGE_BUDGET_RATIO per LLM call
+DEFAULT_BUDGET_MIN = int(os.getenv("HEDGE_BUDGET_MIN", "1"))
+DEFAULT_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+
+# Budget of the generation the current task belongs to; None = no hedging
+_hedge_budget: ContextVar[Optional["HedgeBudget"]] = ContextVar("hedge_budget", default=None)
+
+
+class HedgeBudget:
+    """
+    Caps the extra calls of one generation.
+
+    Allows minimum hedges plus ratio per call made, so a generation of N calls
+    costs at most minimum + N * (1 + ratio) calls.
+    """
+
+    def __init__(self, minimum: int, ratio: float):
+        self.minimum = minimum
+        self.ratio = ratio
+        self.calls = 0
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def record_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def try_spend(self) -> bool:
+        """Take one extra call from the budget, if any is left."""
+        with self._lock:
+            if self.spent >= self.minimum + self.ratio * self.calls:
+                return False
+            self.spent += 1
+            return True
+
+
+class HedgePolicy:
+    """
+    Opt-in hedging and failover for async LLM calls.
+
+    Inside a budget() scope, a call still running after the threshold (the
+    configured percentile of recent latencies of the same agent and provider,
+    at least min_delay) gets a duplicate: on the secondary provider if one is
+    configured, else on the same one. The first successful response wins and
+    the other call is cancelled. A call that fails with a retryable error
+    (after the rate limiter's own retries) fails over to the secondary.
+    Each duplicate is taken from the generation's HedgeBudget, and none is
+    sent into a provider key whose concurrency window is already full.
+
+    Thresholds learn from the winning attempt's own latency, from when it was
+    sent; calls that queued for the rate limiter or were retried are left out.
+    """
+
+    def __init__(
+        self,
+        percentile: Optional[float] = None,
+        min_delay: Optional[float] = None,
+        min_samples: Optional[int] = None,
+        window: Optional[int] = None,
+        budget_min: Optional[int] = None,
+        budget_ratio: Optional[float] = None,
+        secondary: Optional[Callable[[object], object]] = None
+    ):
+        """
+        Args:
+            secondary: Maps an LLM to the secondary provider's LLM at the same
+                temperature (None = hedge on the same provider, no failover)
+        """
+        self.percentile = DEFAULT_PERCENTILE if percentile is None else percentile
+        self.min_delay = DEFAULT_MIN_DELAY if min_delay is None else min_delay
+        self.min_samples = DEFAULT_MIN_SAMPLES if min_samples is None else min_samples
+        self.window = window or DEFAULT_WINDOW
+        self.budget_min = DEFAULT_BUDGET_MIN if budget_min is None else budget_min
+        self.budget_ratio = DEFAULT_BUDGET_RATIO if budget_ratio is None else budget_ratio
+        self.secondary = secondary
+
+        self._latencies: Dict[tuple, deque] = {}
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.hedges_won = 0
+        self.failovers = 0
+        self.skipped = 0
+
+    @contextmanager
+    def budget(self, enabled: bool = True) -> Iterator[Optional[HedgeBudget]]:
+        """Scope of one generation: calls made in it (and tasks it starts) may be hedged."""
+        budget = HedgeBudget(self.budget_min, self.budget_ratio) if enabled else None
+        token = _hedge_budget.set(budget)
+        try:
+            yield budget
+        finally:
+            _hedge_budget.reset(token)
+
+    def threshold(self, agent: str, provider: str) -> Optional[float]:
+        """Seconds after which a call is hedged, or None until enough latencies are known."""
+        with self._lock:
+            samples = sorted(self._latencies.get((agent, provider), ()))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(self.percentile * len(samples)) - 1))
+        return max(self.min_delay, samples[index])
+
+    def record(self, agent: str, provider: str, latency: float) -> None:
+        with self._lock:
+            samples = self._latencies.get((agent, provider))
+            if samples is None:
+                samples = self._latencies[(agent, provider)] = deque(maxlen=self.window)
+            samples.append(latency)
+
+    async def arun(self, llm, call: Callable[[object], Awaitable[T]], agent: str) -> T:
+        """
+        Await call(llm), hedged or failed over under the current budget.
+
+        Args:
+            llm: The caller's LLM
+            call: Makes the call on the LLM it is given
+            agent: Agent name, for latency thresholds and metrics
+
+        Raises:
+            Exception: The primary call's error if no attempt succeeded
+        """
+        budget = _hedge_budget.get()
+        if budget is None:
+            return await call(llm)
+
+        budget.record_call()
+        provider = llm_provider(llm)
+        primary = asyncio.ensure_future(self._timed(call, llm))
+        attempts = [primary]
+        try:
+            await asyncio.wait(attempts, timeout=self.threshold(agent, provider))
+            if not primary.done():
+                backup = self.secondary(llm) if self.secondary else llm
+                if self._spend(budget, backup, agent, "hedged"):
+                    attempts.append(asyncio.ensure_future(self._timed(call, backup)))
+
+            while True:
+                done, _ = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in attempts if task in done and not task.cancelled() and task.exception() is None), None)
+                if winner is not None:
+                    if winner is not primary:
+                        self._count(agent, "won")
+                    result, latency = winner.result()
+                    if latency is not None:
+                        self.record(agent, provider, latency)
+                    return result
+                attempts = [task for task in attempts if task not in done]
+                if not attempts:
+                    break
+
+            error = primary.exception()
+            if self.secondary and classify_error(error):
+                backup = self.secondary(llm)
+                if self._spend(budget, backup, agent, "failover"):
+                    return await call(backup)
+            raise error
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        """Hedges fired, won and skipped, failovers and the current thresholds."""
+        with self._lock:
+            keys = list(self._latencies)
+            stats = {
+                "hedged": self.hedged,
+                "hedges_won": self.hedges_won,
+                "failovers": self.failovers,
+                "skipped": self.skipped,
+                "secondary": self.secondary is not None
+            }
+        stats["thresholds"] = {f"{agent}:{provider}": self.threshold(agent, provider) for agent, provider in keys}
+        return stats
+
+    @staticmethod
+    async def _timed(call: Callable[[object], Awaitable[T]], llm) -> tuple:
+        """
+        (result, latency) of one attempt: seconds since it was sent, or None
+        if it waited for the rate limiter or was retried.
+        """
+        sent = time.monotonic()
+        with call_timing() as timing:
+            result = await call(llm)
+        if timing.get("delayed"):
+            return result, None
+        return result, timing.get("latency", time.monotonic() - sent)
+
+    def _spend(self, budget: HedgeBudget, llm, agent: str, outcome: str) -> bool:
+        # A full window means the provider key is the bottleneck; a duplicate would only queue
+        limiter = rate_limits.for_llm(llm)
+        if (limiter is not None and limiter.in_flight >= int(limiter.limit)) or not budget.try_spend():
+            self._count(agent, "skipped")
+            return False
+        self._count(agent, outcome)
+        return True
+
+    def _count(self, agent: str, outcome: str) -> None:
+        with self._lock:
+            if outcome == "hedged":
+                self.hedged += 1
+            elif outcome == "won":
+                self.hedges_won += 1
+            elif outcome == "failover":
+                self.failovers += 1
+            else:
+                self.skipped += 1
+        llm_hedges.inc(agent=agent, outcome=outcome)
+
+
+# Shared policy; APIConfigManager configures its secondary provider
+hedging = HedgePolicy()
@@ -0,0 +1,341 @@
+"""
+Background Jobs for CodeGenesis
+Runs long generations outside the HTTP request and persists their state in SQLite
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+# Job lifecycle: queued -> running -> completed | failed
+# Each process leases the jobs it owns and renews the lease while it is alive; jobs
+# whose owner stopped renewing (a crash, a stopped worker) are adopted by another process.
+JOB_LEASE = float(os.getenv("JOB_LEASE", "30"))
+
+
+class JobStore:
+    """
+    SQLite-backed store for generation jobs.
+
+    Safe to share between uvicorn workers: every job is owned by the store
+    that created or adopted it, and only its owner claims it. Owners renew
+    their leases; recover() only adopts jobs whose lease has expired.
+
+    API keys are never written here (see JobQueue).
+    """
+
+    def __init__(self, path: str, lease: float = JOB_LEASE):
+        self.path = path
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, has_key INTEGER NOT NULL DEFAULT 0, "
+            "project_id TEXT, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, owner TEXT, "
+            "lease_until REAL NOT NULL DEFAULT 0, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._migrate()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def create(self, request: dict, has_key: bool = False) -> str:
+        """
+        Persist a new queued job owned by this store and return its ID.
+
+        Args:
+            request: The job's request (without credentials); its project_id,
+                if any, is kept on the job so a failed run can be resumed
+            has_key: Whether the job was submitted with an API key, which
+                only its submitting process holds
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, request, has_key, project_id, owner, lease_until, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(request), int(has_key), request.get("project_id"), self.owner, now + self.lease, now, now)
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Public view of a job (never includes the API key)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, project_id, result, error, attempts, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        return {
+            "job_id": row[0],
+            "status": row[1],
+            "project_id": row[2],
+            "result": json.loads(row[3]) if row[3] else None,
+            "error": row[4],
+            "attempts": row[5],
+            "created_at": row[6],
+            "updated_at": row[7]
+        }
+
+    def claim(self, job_id: str) -> Optional[tuple]:
+        """Mark a queued job this store owns as running; returns (request, has_key, attempts) or None."""
+        with self._lock:
+            claimed = self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ? AND status = 'queued' AND owner = ?",
+                (time.time(), job_id, self.owner)
+            ).rowcount
+            if not claimed:
+                return None
+            row = self._conn.execute("SELECT request, has_key, attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]), bool(row[1]), row[2]
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self._finish(job_id, "completed", result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str, project_id: Optional[str] = None) -> None:
+        """Mark a job failed; project_id records the checkpointed project to resume it with."""
+        self._finish(job_id, "failed", error=error, project_id=project_id)
+
+    def requeue(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id)
+            )
+
+    def renew(self) -> None:
+        """Extend the lease on every unfinished job this store owns."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN ('queued', 'running')",
+                (time.time() + self.lease, self.owner)
+            )
+
+    def release(self) -> None:
+        """Give up this store's queued jobs so the next process adopts them at once."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = 0 WHERE owner = ? AND status = 'queued'",
+                (self.owner,)
+            )
+
+    def recover(self) -> list:
+        """
+        Adopt unfinished jobs whose owner's lease expired and re-queue them.
+
+        Jobs owned by a live process (another uvicorn worker sharing this
+        database) are left alone.
+
+        Returns:
+            IDs of the adopted jobs, oldest first
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') AND lease_until < ? ORDER BY created_at",
+                (now,)
+            ).fetchall()
+            adopted = []
+            for (job_id,) in rows:
+                # Re-check the lease so two processes never adopt the same job
+                if self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner = ?, lease_until = ?, updated_at = ? "
+                    "WHERE id = ? AND status IN ('queued', 'running') AND lease_until < ?",
+                    (self.owner, now + self.lease, now, job_id, now)
+                ).rowcount:
+                    adopted.append(job_id)
+        return adopted
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def _finish(
+        self,
+        job_id: str,
+        status: str,
+        result: Optional[str] = None,
+        error: Optional[str] = None,
+        project_id: Optional[str] = None
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, project_id = COALESCE(?, project_id), updated_at = ? "
+                "WHERE id = ?",
+                (status, result, error, project_id, time.time(), job_id)
+            )
+
+    def _migrate(self) -> None:
+        # Databases from before leases: add the new columns and erase stored API keys
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "has_key" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN has_key INTEGER NOT NULL DEFAULT 0")
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0")
+        if "project_id" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN project_id TEXT")
+        if "api_key" in columns:
+            self._conn.execute("UPDATE jobs SET has_key = 1, api_key = NULL WHERE api_key IS NOT NULL")
+
+
+class JobQueue:
+    """
+    Worker pool that runs jobs from a JobStore.
+
+    - concurrency workers pull job IDs from an in-process queue
+    - start() adopts jobs whose process stopped; a heartbeat renews this
+      process's leases and keeps adopting orphaned jobs while it runs
+    - shutdown() stops taking work and drains in-flight jobs; jobs that do not
+      finish within the drain timeout are re-queued for the next start
+
+    API keys live only in this process's memory, keyed by job ID, and are
+    dropped when the job finishes. A job adopted from another process has no
+    key, so it fails and must be submitted again.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        runner: Callable[[dict, Optional[str]], Awaitable[dict]],
+        concurrency: int = 4,
+        max_attempts: int = 3
+    ):
+        self.store = store
+        self.runner = runner
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._keys: dict = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._workers: list = []
+        self._running: set = set()
+        self._accepting = False
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        """Start workers and re-queue recovered jobs."""
+        if self.started:
+            return
+
+        self._queue = asyncio.Queue()
+        self._accepting = True
+        self._adopt()
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._heartbeat = asyncio.create_task(self._renew_leases())
+
+    async def submit(self, request: dict, api_key: Optional[str]) -> str:
+        """Persist a job and schedule it. Returns the job ID."""
+        if not self.started:
+            await self.start()
+        if not self._accepting:
+            raise RuntimeError("Job queue is shutting down")
+
+        job_id = self.store.create(request, has_key=api_key is not None)
+        if api_key is not None:
+            self._keys[job_id] = api_key
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def shutdown(self, drain_timeout: float = 30.0) -> None:
+        """Stop accepting jobs, wait for in-flight ones, re-queue the rest."""
+        if not self.started:
+            return
+
+        self._accepting = False
+        if self._running:
+            await asyncio.wait(list(self._running), timeout=drain_timeout)
+
+        self._heartbeat.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(self._heartbeat, *self._workers, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        self._keys.clear()
+        self.store.release()
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "in_flight": len(self._running),
+            "queued_in_memory": self._queue.qsize() if self._queue else 0,
+            "jobs": self.store.counts()
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            if not self._accepting:
+                # Leave it queued in the store for the next process
+                continue
+
+            claimed = self.store.claim(job_id)
+            if claimed is None:
+                continue
+            request, has_key, attempts = claimed
+            api_key = self._keys.get(job_id)
+
+            if attempts > self.max_attempts:
+                self._keys.pop(job_id, None)
+                self.store.fail(job_id, f"Gave up after {self.max_attempts} attempts")
+                continue
+            if has_key and api_key is None:
+                # Adopted after its process stopped; the key went with it
+                error = "The API key is not kept across restarts; submit the job again"
+                if request.get("project_id"):
+                    error += f" or resume project {request['project_id']}"
+                self.store.fail(job_id, error)
+                continue
+
+            task = asyncio.create_task(self.runner(request, api_key))
+            self._running.add(task)
+            try:
+                result = await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # Shutdown timed out while this job was running
+                task.cancel()
+                self.store.requeue(job_id)
+                raise
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                # GenerationFailed carries the checkpointed project the client can resume
+                self.store.fail(job_id, str(e), project_id=getattr(e, "project_id", None))
+                self._keys.pop(job_id, None)
+            else:
+                self.store.complete(job_id, result)
+                self._keys.pop(job_id, None)
+            finally:
+                self._running.discard(task)
+
+    async def _renew_leases(self) -> None:
+        while True:
+            await asyncio.sleep(self.store.lease / 3)
+            self.store.renew()
+            self._adopt()
+
+    def _adopt(self) -> None:
+        for job_id in self.store.recover():
+            self._queue.put_nowait(job_id)
+
+
+# Shared job store (survives restarts)
+job_store = JobStore(os.getenv("JOBS_DB", os.path.join(tempfile.gettempdir(), "codegenesis", "jobs.sqlite3")))
@@ -0,0 +1,165 @@
+"""
+LLM Client Pool for CodeGenesis
+Reuses ChatOpenAI instances and shares HTTP connection pools per provider host
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+# (provider, sha256(api_key), base_url, temperature)
+PoolKey = Tuple[str, str, Optional[str], float]
+
+DEFAULT_HOST = "api.openai.com"
+
+
+def hash_api_key(api_key: Optional[str]) -> str:
+    """Hash an API key so it never appears in pool keys or metrics."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+class LLMClientPool:
+    """
+    LRU-bounded registry of LLM clients.
+
+    - Clients are keyed by (provider, hashed key, base_url, temperature)
+    - All clients for the same host share one sync and one async httpx client,
+      so warm requests reuse open keep-alive connections instead of doing a
+      new TLS handshake
+    - Entries idle for longer than idle_ttl seconds are evicted, and host
+      connection pools are dropped once no pooled client uses them. They are
+      not closed, since a generation may still hold an evicted client; the
+      garbage collector closes them once the last one is gone
+    """
+
+    def __init__(
+        self,
+        max_size: int = 64,
+        idle_ttl: float = 600.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20
+    ):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+
+        self._clients: "OrderedDict[PoolKey, tuple]" = OrderedDict()  # key -> (llm, host, last_used)
+        self._hosts: Dict[str, Tuple[httpx.Client, httpx.AsyncClient]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(
+        self,
+        provider: str,
+        api_key: Optional[str],
+        base_url: Optional[str],
+        temperature: float,
+        factory: Callable[[httpx.Client, httpx.AsyncClient], object]
+    ):
+        """
+        Get a pooled client, creating it with factory(http_client, http_async_client) on a miss.
+        """
+        key: PoolKey = (provider, hash_api_key(api_key), base_url, float(temperature))
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._clients.get(key)
+            if entry is not None:
+                llm, host, _ = entry
+                self._clients[key] = (llm, host, now)
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return llm
+
+            self.misses += 1
+            host = urlparse(base_url).netloc if base_url else DEFAULT_HOST
+            http_client, http_async_client = self._host_clients(host)
+            llm = factory(http_client, http_async_client)
+            self._clients[key] = (llm, host, now)
+
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+            self._release_unused_hosts()
+
+            return llm
+
+    def clear(self) -> None:
+        """Drop every pooled client and close host connection pools (at shutdown)."""
+        with self._lock:
+            self._clients.clear()
+            hosts, self._hosts = self._hosts, {}
+        for http_client, _ in hosts.values():
+            # The async clients are left to the garbage collector; closing them
+            # here would need the event loop that owns their connections
+            http_client.close()
+
+    def stats(self) -> dict:
+        """Pool size and hit/miss metrics (no key material)."""
+        with self._lock:
+            hosts = {}
+            for host, (http_client, http_async_client) in self._hosts.items():
+                hosts[host] = {
+                    "clients": sum(1 for _, h, _ in self._clients.values() if h == host),
+                    "open_connections": (
+                        self._open_connections(http_client) + self._open_connections(http_async_client)
+                    )
+                }
+
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hosts": hosts
+            }
+
+    def _host_clients(self, host: str) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """Get or create the shared HTTP clients for a provider host."""
+        if host not in self._hosts:
+            self._hosts[host] = (
+                httpx.Client(limits=self.limits, timeout=None),
+                httpx.AsyncClient(limits=self.limits, timeout=None)
+            )
+        return self._hosts[host]
+
+    def _evict_idle(self, now: float) -> None:
+        """Evict clients unused for longer than idle_ttl (oldest first)."""
+        evicted = False
+        while self._clients:
+            key, (_, _, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            self._clients.popitem(last=False)
+            self.evictions += 1
+            evicted = True
+
+        if evicted:
+            self._release_unused_hosts()
+
+    def _release_unused_hosts(self) -> None:
+        """Forget HTTP clients for hosts that no pooled LLM references anymore."""
+        in_use = {host for _, host, _ in self._clients.values()}
+        for host in list(self._hosts):
+            if host not in in_use:
+                # Not closed: LLMs checked out before the eviction still use it
+                del self._hosts[host]
+
+    @staticmethod
+    def _open_connections(client) -> int:
+        """Best-effort count of open connections in an httpx client's pool."""
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        return len(getattr(pool, "connections", []) or [])
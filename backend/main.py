@@ -1,15 +1,62 @@
+import os
+import json
+import uuid
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
-from orchestrator import CodeGenesisOrchestrator
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from dotenv import load_dotenv
-from api_config import api_config
-from langchain_core.messages import HumanMessage, SystemMessage
 
+# The only load_dotenv(): project modules read their settings at import time
 load_dotenv()
 
-app = FastAPI(title="CodeGenesis API")
+from api_config import api_config
+from cache import file_cache, plan_cache
+from jobs import JobQueue, job_store
+from vfs import blob_store, projects
+from archive import ARCHIVE_FORMATS, stream_archive
+from metrics import CONTENT_TYPE, RequestMetricsMiddleware, cache_collector, metrics_registry, rate_limit_collector, track_llm_call
+from rate_limit import rate_limits
+from singleflight import file_flights, generation_flights, plan_flights
+from batch import MAX_BATCH_PROMPTS, batch_executor, run_batch
+
+# The LLM stack (orchestrator -> langgraph, langchain) is imported inside the
+# handlers that need it, so the app starts and /api/health answers without it.
+
+async def _run_generation_job(request: dict, user_api_key: Optional[str]) -> dict:
+    """Run one queued /api/generate job."""
+    from orchestrator import CodeGenesisOrchestrator
+    
+    orchestrator = CodeGenesisOrchestrator(
+        user_api_key=user_api_key,
+        user_provider=request["user_provider"],
+        user_base_url=request.get("user_base_url"),
+        use_cache=request.get("use_cache", True),
+        pipeline_tests=request.get("pipeline_tests"),
+        stream_plan=request.get("stream_plan"),
+        hedge=request.get("hedge"),
+        project_id=request.get("project_id")
+    )
+    # A job re-queued after a crash resumes from its checkpoint under the same project ID
+    return await orchestrator.agenerate_app(request["prompt"])
+
+job_queue = JobQueue(
+    job_store,
+    _run_generation_job,
+    concurrency=int(os.getenv("JOB_WORKERS", "4"))
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resume jobs left over from the last run; on shutdown drain in-flight ones, then close LLM connections
+    await job_queue.start()
+    yield
+    await job_queue.shutdown(drain_timeout=float(os.getenv("JOB_DRAIN_TIMEOUT", "30")))
+    api_config.client_pool.clear()
+
+app = FastAPI(title="CodeGenesis API", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -19,12 +66,47 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
-class GenerateRequest(BaseModel):
-    prompt: str
+# Cache hit ratios and job queue depth are read from the existing stats() at scrape time
+metrics_registry.register_collector(cache_collector(lambda: {
+    "file": file_cache.stats(),
+    "plan": plan_cache.stats(),
+    "key_validation": api_config.validation_cache.stats(),
+    "llm_pool": api_config.pool_stats()
+}))
+metrics_registry.register_collector(lambda: [
+    ("codegenesis_jobs_in_flight", "gauge", "Background jobs currently running.", [({}, job_queue.stats()["in_flight"])])
+])
+metrics_registry.register_collector(rate_limit_collector(api_config.rate_limit_stats))
+
+class LLMOptions(BaseModel):
     user_api_key: Optional[str] = None
     user_provider: Optional[str] = None  # "openai", "anthropic", "gemini", "a4f", "custom"
     user_base_url: Optional[str] = None  # For custom API endpoints
+    use_cache: bool = True  # Set False to force a fresh plan and fresh LLM output for every file
+    hedge: Optional[bool] = None  # Duplicate slow LLM calls within a budget (default: LLM_HEDGING)
+
+class GenerateOptions(LLMOptions):
+    pipeline_tests: Optional[bool] = None  # Generate tests per file while engineering (default: PIPELINE_TESTS)
+    stream_plan: Optional[bool] = None  # Start files while the plan is still streaming (default: STREAM_PLAN)
+
+class GenerateRequest(GenerateOptions):
+    prompt: str
+    background: bool = False  # Return a job ID immediately and poll /api/jobs/{id}
+
+class BatchGenerateRequest(GenerateOptions):
+    prompts: List[str]
+    max_concurrency: Optional[int] = Field(None, ge=1)  # Cap on this batch's generations in flight, below the shared BATCH_MAX_CONCURRENCY
+
+class RegenerateRequest(LLMOptions):
+    # Only the options regeneration honours: it never runs in the background,
+    # pipelines tests or starts files from a streaming plan
+    prompt: str
+    previous_plan: dict
+    previous_files: dict
+    previous_tests: str = ""
+    file_plan: Optional[dict] = None  # Edited plan; if omitted the architect re-plans the prompt
 
 class ChatRequest(BaseModel):
     message: str
@@ -35,7 +117,7 @@ def read_root():
     return {"message": "CodeGenesis Architect Engine is Online"}
 
 @app.post("/api/generate")
-def generate_app(request: GenerateRequest):
+async def generate_app(request: GenerateRequest):
     """
     Generate an application from a text prompt.
     REQUIRES user's API key - platform API is NOT used for project generation.
@@ -48,29 +130,305 @@ def generate_app(request: GenerateRequest):
             "status": "error"
         }
     
-    # Initialize orchestrator with user's API credentials
-    orchestrator = CodeGenesisOrchestrator(
-        user_api_key=request.user_api_key,
-        user_provider=request.user_provider,
-        user_base_url=request.user_base_url
+    if request.background:
+        # The project ID is returned up front so a job that fails partway can be resumed
+        project_id = uuid.uuid4().hex
+        job_id = await job_queue.submit(
+            {**request.model_dump(exclude={"user_api_key", "background"}), "project_id": project_id},
+            request.user_api_key
+        )
+        return {"job_id": job_id, "project_id": project_id, "status": "queued"}
+    
+    from orchestrator import GenerationFailed
+    
+    try:
+        return await _generate_shared(request, request.prompt)
+    except ValueError as e:
+        return {
+            "error": "INVALID_API_CONFIG",
+            "message": str(e),
+            "status": "error"
+        }
+    except GenerationFailed as e:
+        return _generation_failed(e)
+
+def _generation_failed(error) -> dict:
+    """Error response for a checkpointed generation that stopped; resume it by project ID."""
+    return {
+        "error": "GENERATION_FAILED",
+        "message": str(error),
+        "project_id": error.project_id,
+        "status": "error"
+    }
+
+async def _generate_shared(request: GenerateOptions, prompt: str) -> dict:
+    """Run one generation, sharing it with identical requests already in flight."""
+    from orchestrator import CodeGenesisOrchestrator
+    
+    async def generate() -> dict:
+        # Initialize orchestrator with user's API credentials
+        orchestrator = CodeGenesisOrchestrator(
+            user_api_key=request.user_api_key,
+            user_provider=request.user_provider,
+            user_base_url=request.user_base_url,
+            use_cache=request.use_cache,
+            pipeline_tests=request.pipeline_tests,
+            stream_plan=request.stream_plan,
+            hedge=request.hedge
+        )
+        return await orchestrator.agenerate_app(prompt)
+    
+    # Identical requests in flight with the same key share one generation
+    flight_key = (
+        prompt,
+        request.user_provider,
+        request.user_base_url,
+        api_config.rate_limit_key(request.user_provider, request.user_base_url, request.user_api_key),
+        request.use_cache,
+        request.pipeline_tests,
+        request.stream_plan,
+        request.hedge
     )
+    return await generation_flights.ado(flight_key, generate)
+
+@app.post("/api/generate/batch")
+async def generate_batch(request: BatchGenerateRequest):
+    """
+    Generate one application per prompt, streamed back as NDJSON.
+    
+    Generations run through the shared batch executor and their LLM calls
+    through the per-provider-key rate limiters. One "project" line is written
+    per prompt as it finishes (with its index in prompts), then a "summary"
+    line with batch-wide tokens, latency and failures.
+    """
+    if not request.user_api_key or not request.user_provider:
+        return {
+            "error": "API_KEY_REQUIRED",
+            "message": "Please configure your API key in Settings to generate projects.",
+            "status": "error"
+        }
+    
+    if not request.prompts or len(request.prompts) > MAX_BATCH_PROMPTS:
+        return {
+            "error": "INVALID_BATCH",
+            "message": f"A batch needs between 1 and {MAX_BATCH_PROMPTS} prompts.",
+            "status": "error"
+        }
+    
+    from orchestrator import GenerationFailed
+    
+    async def generate(prompt: str) -> dict:
+        try:
+            return await _generate_shared(request, prompt)
+        except ValueError as e:
+            return {
+                "error": "INVALID_API_CONFIG",
+                "message": str(e),
+                "status": "error"
+            }
+        except GenerationFailed as e:
+            return _generation_failed(e)
+    
+    async def lines():
+        async for event in run_batch(request.prompts, generate, max_concurrency=request.max_concurrency):
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/api/generate/{project_id}/resume")
+async def resume_generation(project_id: str, request: GenerateOptions):
+    """
+    Resume a generation that crashed or stopped on an error.
+    
+    Continues from its last checkpoint: finished steps and files already
+    written are not sent to the LLM again. Takes the same credentials and
+    options as /api/generate (API keys are never checkpointed).
+    """
+    if not request.user_api_key or not request.user_provider:
+        return {
+            "error": "API_KEY_REQUIRED",
+            "message": "Please configure your API key in Settings to generate projects.",
+            "status": "error"
+        }
+    
+    from orchestrator import CodeGenesisOrchestrator, GenerationFailed
+    
+    async def resume() -> Optional[dict]:
+        orchestrator = CodeGenesisOrchestrator(
+            user_api_key=request.user_api_key,
+            user_provider=request.user_provider,
+            user_base_url=request.user_base_url,
+            use_cache=request.use_cache,
+            pipeline_tests=request.pipeline_tests,
+            stream_plan=request.stream_plan,
+            hedge=request.hedge,
+            project_id=project_id
+        )
+        return await orchestrator.aresume_app()
     
     try:
-        result = orchestrator.generate_app(request.prompt)
-        return result
+        # Concurrent resumes of one project share a single run on its checkpoint thread
+        result = await generation_flights.ado(("resume", project_id), resume)
     except ValueError as e:
         return {
             "error": "INVALID_API_CONFIG",
             "message": str(e),
             "status": "error"
         }
+    except GenerationFailed as e:
+        return _generation_failed(e)
+    
+    if result is None:
+        return {
+            "error": "CHECKPOINT_NOT_FOUND",
+            "message": f"No resumable generation '{project_id}'",
+            "status": "error"
+        }
+    return result
+
+@app.post("/api/regenerate")
+async def regenerate_app(request: RegenerateRequest):
+    """
+    Regenerate an application after a prompt or plan edit.
+    Only added or changed plan entries are rebuilt; unchanged files are carried
+    over and tests are regenerated only if the file set changed.
+    """
+    if not request.user_api_key or not request.user_provider:
+        return {
+            "error": "API_KEY_REQUIRED",
+            "message": "Please configure your API key in Settings to generate projects.",
+            "status": "error"
+        }
+    
+    from orchestrator import CodeGenesisOrchestrator
+    
+    try:
+        orchestrator = CodeGenesisOrchestrator(
+            user_api_key=request.user_api_key,
+            user_provider=request.user_provider,
+            user_base_url=request.user_base_url,
+            use_cache=request.use_cache,
+            hedge=request.hedge
+        )
+        return await orchestrator.aregenerate_app(
+            request.prompt,
+            request.previous_plan,
+            request.previous_files,
+            request.previous_tests,
+            request.file_plan
+        )
+    except ValueError as e:
+        return {
+            "error": "INVALID_API_CONFIG",
+            "message": str(e),
+            "status": "error"
+        }
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """Poll a background generation job."""
+    job = job_store.get(job_id)
+    if job is None:
+        return {
+            "error": "JOB_NOT_FOUND",
+            "message": f"No job with ID {job_id}",
+            "status": "error"
+        }
+    return job
+
+@app.get("/api/projects/{project_id}/archive")
+def project_archive(project_id: str, format: str = "zip", compression_level: int = 6):
+    """
+    Stream a generated project as a zip or tar.gz archive.
+    The archive is produced chunk by chunk from the project's VirtualFileSystem
+    and sent with chunked transfer encoding.
+    """
+    vfs = projects.get(project_id)
+    if vfs is None:
+        return {
+            "error": "PROJECT_NOT_FOUND",
+            "message": f"No project with ID {project_id}",
+            "status": "error"
+        }
+    
+    try:
+        chunks = stream_archive(vfs.get_all_files(), format, compression_level)
+    except ValueError as e:
+        return {
+            "error": "INVALID_ARCHIVE_OPTIONS",
+            "message": str(e),
+            "status": "error"
+        }
+    
+    return StreamingResponse(
+        chunks,
+        media_type=ARCHIVE_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{project_id}.{format}"'}
+    )
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/generate/stream")
+async def generate_app_stream(request: GenerateRequest):
+    """
+    Generate an application and stream progress as Server-Sent Events.
+    Emits status transitions, the plan, per-file start/delta/complete events,
+    test script deltas and a final "done" event with the full result.
+    """
+    async def events():
+        if not request.user_api_key or not request.user_provider:
+            yield _sse("error", {
+                "error": "API_KEY_REQUIRED",
+                "message": "Please configure your API key in Settings to generate projects.",
+                "status": "error"
+            })
+            return
+        
+        from orchestrator import CodeGenesisOrchestrator
+        
+        orchestrator = None
+        try:
+            orchestrator = CodeGenesisOrchestrator(
+                user_api_key=request.user_api_key,
+                user_provider=request.user_provider,
+                user_base_url=request.user_base_url,
+                use_cache=request.use_cache,
+                pipeline_tests=request.pipeline_tests,
+                stream_plan=request.stream_plan,
+                hedge=request.hedge
+            )
+            async for event in orchestrator.astream_app(request.prompt):
+                yield _sse(event.pop("event"), event)
+        except ValueError as e:
+            yield _sse("error", {
+                "error": "INVALID_API_CONFIG",
+                "message": str(e),
+                "status": "error"
+            })
+        except Exception as e:
+            yield _sse("error", {
+                "error": "GENERATION_FAILED",
+                "message": str(e),
+                "project_id": orchestrator.project_id if orchestrator else None,
+                "status": "error"
+            })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/api/chat")
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest):
     """
     AI chatbot for platform features (recommendations, help, etc.)
     Always uses platform A4F API - not user's API key.
     """
+    from langchain_core.messages import HumanMessage, SystemMessage
+    
     # Get platform LLM (always A4F)
     llm = api_config.get_llm(context="platform", temperature=0.7)
     
@@ -87,18 +445,22 @@ Be helpful, concise, and friendly."""
         HumanMessage(content=request.message)
     ]
     
-    response = llm.invoke(messages)
+    # Through the platform key's limiter: the SDK's own retries are off
+    with track_llm_call(llm, "chat") as usage:
+        response = await rate_limits.arun(llm, lambda: llm.ainvoke(messages))
+        usage.append(getattr(response, "usage_metadata", None))
     return {"response": response.content}
 
 @app.post("/api/validate-key")
-def validate_api_key(request: GenerateRequest):
+async def validate_api_key(request: GenerateRequest):
     """Validate user's API key."""
     if not request.user_api_key or not request.user_provider:
         return {"valid": False, "message": "API key and provider required"}
     
-    is_valid = api_config.validate_user_api_key(
+    is_valid = await api_config.avalidate_user_api_key(
         request.user_api_key,
-        request.user_provider
+        request.user_provider,
+        request.user_base_url
     )
     
     return {
@@ -110,6 +472,31 @@ def validate_api_key(request: GenerateRequest):
 def health_check():
     return {"status": "healthy", "agents": ["architect", "engineer", "testsprite"]}
 
+@app.get("/api/stats")
+def stats():
+    """Runtime metrics for pooled LLM clients, rate limiters, hedging, caches, coalesced calls, jobs, batches, VFS blobs and projects."""
+    return {
+        "llm_pool": api_config.pool_stats(),
+        "rate_limits": api_config.rate_limit_stats(),
+        "hedging": api_config.hedge_stats(),
+        "key_validation": api_config.validation_cache.stats(),
+        "file_cache": file_cache.stats(),
+        "plan_cache": plan_cache.stats(),
+        "single_flight": {
+            flights.operation: flights.stats()
+            for flights in (generation_flights, plan_flights, file_flights)
+        },
+        "jobs": job_queue.stats(),
+        "batch": batch_executor.stats(),
+        "vfs": blob_store.stats(),
+        "projects": projects.stats()
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of request, node and LLM latency, token usage and cache metrics."""
+    return Response(metrics_registry.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,418 @@
+"""
+Metrics for CodeGenesis
+In-process counters, gauges and histograms exposed in the Prometheus text format
+"""
+import asyncio
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Upper bounds (seconds) for latency histograms: sub-second cache hits up to multi-minute generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# A collector returns (name, type, help, [(labels, value), ...]) families, computed at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+
+class MetricsRegistry:
+    """Metrics and scrape-time collectors rendered together by render()."""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> None:
+        """
+        Raises:
+            ValueError: If a metric with the same name is already registered
+        """
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics.append(metric)
+
+    def register_collector(self, collector: Collector) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines += _family_header(metric.name, metric.kind, metric.documentation)
+            lines += [_sample(name, labels, value) for name, labels, value in metric.samples()]
+
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines += _family_header(name, kind, documentation)
+                lines += [_sample(name, labels, value) for labels, value in samples]
+
+        return "\n".join(lines) + "\n"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        registry: Optional[MetricsRegistry] = None
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        (registry or metrics_registry).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def value(self, **labels) -> float:
+        """Current value for a label set (0 if never touched)."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, self._labels(key), value
+
+
+class Counter(_Metric):
+    """Monotonically increasing total."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        """
+        Raises:
+            ValueError: If amount is negative
+        """
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels) -> Iterator[None]:
+        """Count the enclosed block as in progress."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed upper-bound buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: Optional[MetricsRegistry] = None
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        # bisect_left puts a value equal to a bound in that bucket (le is inclusive)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the duration of the enclosed block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def value(self, **labels) -> dict:
+        """{"count", "sum"} for a label set."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return {"count": state[2], "sum": state[1]} if state else {"count": 0, "sum": 0.0}
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            values = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every HTTP request.
+
+    Timed until the response body is fully sent, so streaming endpoints report
+    the whole stream. Requests are labelled by route template, never raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route in the shared scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_latency.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route,
+                status=status[0]
+            )
+
+
+def llm_provider(llm) -> str:
+    """Provider an LLM was built for (see APIConfigManager), or "unknown"."""
+    metadata = getattr(llm, "metadata", None)
+    if isinstance(metadata, dict):
+        return metadata.get("provider", "unknown")
+    return "unknown"
+
+
+# Counters of the enclosing count_llm_calls() blocks; child tasks inherit them
+_llm_call_counters: ContextVar[tuple] = ContextVar("llm_call_counters", default=())
+
+
+@contextmanager
+def count_llm_calls() -> Iterator[list]:
+    """
+    Count the LLM calls made in this context (and tasks it starts) as
+    counter[0], and their prompt and completion tokens as counter[1] and counter[2].
+    """
+    counter = [0, 0, 0]
+    token = _llm_call_counters.set(_llm_call_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _llm_call_counters.reset(token)
+
+
+@contextmanager
+def track_llm_call(llm, agent: str) -> Iterator[list]:
+    """
+    Time one LLM call and count its tokens.
+
+    Yields a list; append each response's (or stream chunk's) usage_metadata
+    to it and the prompt and completion tokens are counted when the block exits.
+    """
+    provider = llm_provider(llm)
+    counters = _llm_call_counters.get()
+    for counter in counters:
+        counter[0] += 1
+    usage = []
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        yield usage
+        outcome = "ok"
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        llm_latency.observe(time.perf_counter() - start, provider=provider, agent=agent, outcome=outcome)
+        for entry in usage:
+            if isinstance(entry, dict):
+                prompt_tokens, completion_tokens = entry.get("input_tokens") or 0, entry.get("output_tokens") or 0
+                llm_tokens.inc(prompt_tokens, provider=provider, agent=agent, type="prompt")
+                llm_tokens.inc(completion_tokens, provider=provider, agent=agent, type="completion")
+                for counter in counters:
+                    counter[1] += prompt_tokens
+                    counter[2] += completion_tokens
+
+
+def cache_collector(caches: Callable[[], Dict[str, dict]]) -> Collector:
+    """
+    Collector exposing hits, misses and hit ratio for caches.
+
+    Args:
+        caches: Returns {cache name: stats()} dicts with "hits" and "misses"
+    """
+    def collect():
+        stats = caches()
+        hits = [({"cache": name}, cache["hits"]) for name, cache in stats.items()]
+        misses = [({"cache": name}, cache["misses"]) for name, cache in stats.items()]
+        ratios = [
+            ({"cache": name}, cache["hits"] / (cache["hits"] + cache["misses"]) if cache["hits"] + cache["misses"] else 0.0)
+            for name, cache in stats.items()
+        ]
+        return [
+            ("codegenesis_cache_hits_total", "counter", "Cache lookups served from the cache.", hits),
+            ("codegenesis_cache_misses_total", "counter", "Cache lookups that missed.", misses),
+            ("codegenesis_cache_hit_ratio", "gauge", "Hits over lookups since process start.", ratios)
+        ]
+    return collect
+
+
+def rate_limit_collector(limiters: Callable[[], Dict[str, dict]]) -> Collector:
+    """
+    Collector exposing rate limiter state per provider key.
+
+    Args:
+        limiters: Returns {limiter key: RateLimiter.stats()}
+    """
+    def collect():
+        stats = limiters()
+
+        def family(field: str) -> list:
+            return [({"limiter": key}, limiter[field]) for key, limiter in stats.items()]
+
+        return [
+            ("codegenesis_rate_limit_concurrency", "gauge", "AIMD concurrency window per provider key.", family("concurrency_limit")),
+            ("codegenesis_rate_limit_in_flight", "gauge", "LLM calls in flight per provider key.", family("in_flight")),
+            ("codegenesis_rate_limit_tokens", "gauge", "Token bucket balance per provider key.", family("tokens")),
+            ("codegenesis_rate_limited_total", "counter", "429 responses per provider key.", family("rate_limited")),
+            ("codegenesis_llm_retries_total", "counter", "Retried LLM calls per provider key.", family("retries"))
+        ]
+    return collect
+
+
+def _family_header(name: str, kind: str, documentation: str) -> List[str]:
+    return [f"# HELP {name} {_escape(documentation, quote=False)}", f"# TYPE {name} {kind}"]
+
+
+def _sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if not labels:
+        return f"{name} {_format_value(value)}"
+    rendered = ",".join(f'{label}="{_escape(str(text))}"' for label, text in labels.items())
+    return f"{name}{{{rendered}}} {_format_value(value)}"
+
+
+def _escape(text: str, quote: bool = True) -> str:
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quote else text
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+# Shared registry and the backend's metrics
+metrics_registry = MetricsRegistry()
+
+request_latency = Histogram(
+    "codegenesis_http_request_duration_seconds",
+    "HTTP request latency, until the last body byte.",
+    ("method", "route", "status")
+)
+node_latency = Histogram(
+    "codegenesis_node_duration_seconds",
+    "Workflow node (architect, engineer, testsprite) latency.",
+    ("node",)
+)
+llm_latency = Histogram(
+    "codegenesis_llm_call_duration_seconds",
+    "LLM call latency by provider and agent.",
+    ("provider", "agent", "outcome")
+)
+llm_tokens = Counter(
+    "codegenesis_llm_tokens_total",
+    "Tokens reported by the provider, by type (prompt or completion).",
+    ("provider", "agent", "type")
+)
+coalesced_calls = Counter(
+    "codegenesis_coalesced_calls_total",
+    "Calls that joined an identical in-flight execution instead of running (see singleflight.py).",
+    ("operation",)
+)
+llm_calls_saved = Counter(
+    "codegenesis_llm_calls_saved_total",
+    "LLM calls avoided by coalescing identical concurrent calls.",
+    ("operation",)
+)
+llm_hedges = Counter(
+    "codegenesis_llm_hedges_total",
+    "Hedged LLM calls by outcome: hedged, won (the duplicate answered first), failover, skipped (no budget or full window).",
+    ("agent", "outcome")
+)
+generations_in_flight = Gauge(
+    "codegenesis_generations_in_flight",
+    "Generations currently running, by kind (generate, regenerate, stream, resume).",
+    ("kind",)
+)
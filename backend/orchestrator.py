@@ -1,108 +1,894 @@
-from typing import TypedDict, Optional
+import os
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, TypedDict, Optional
 from langgraph.graph import StateGraph, END
+from langgraph.config import get_stream_writer
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from agents.architect import ArchitectAgent
 from agents.engineer import EngineerAgent
-from agents.testsprite import TestSpriteAgent
-from vfs import VirtualFileSystem
+from agents.testsprite import TestSpriteAgent, merge_test_fragments
+from checkpoints import generation_checkpoints
+from hedging import hedging
+from metrics import generations_in_flight, node_latency
+from scheduling import dependency_context, plan_dependencies, summarize_interface, topological_waves
+from vfs import projects
+
+# Maximum number of engineer LLM calls in flight per generation
+DEFAULT_ENGINEER_CONCURRENCY = int(os.getenv("ENGINEER_MAX_CONCURRENCY", "4"))
+
+# Generate per-file test fragments while files are still being written
+DEFAULT_PIPELINE_TESTS = os.getenv("PIPELINE_TESTS", "false").lower() in ("1", "true", "yes")
+
+# Start writing files while the architect's plan is still streaming (async path only)
+DEFAULT_STREAM_PLAN = os.getenv("STREAM_PLAN", "false").lower() in ("1", "true", "yes")
+
+# Hedge slow LLM calls within a per-generation budget (async path only, see hedging.py)
+DEFAULT_HEDGE = os.getenv("LLM_HEDGING", "false").lower() in ("1", "true", "yes")
 
 class CodeGenState(TypedDict):
     """State for the CodeGenesis workflow."""
     user_prompt: str
     file_plan: dict
     generated_files: dict
+    file_errors: dict
+    test_fragments: dict
     test_script: str
     status: str
 
+def diff_plans(previous_plan: dict, plan: dict, previous_files: dict) -> dict:
+    """
+    Compare a new file plan against the previous one.
+    
+    A file is "changed" if it is new, its description changed, or it has no
+    previous output to carry over. A tech stack change invalidates every file.
+    
+    Returns:
+        {"changed": [...], "unchanged": [...], "removed": [...]} in plan order
+    """
+    old_files = previous_plan.get("files", {})
+    new_files = plan.get("files", {})
+    stack_changed = previous_plan.get("tech_stack") != plan.get("tech_stack")
+    
+    changed, unchanged = [], []
+    for filename, description in new_files.items():
+        if stack_changed or old_files.get(filename) != description or filename not in previous_files:
+            changed.append(filename)
+        else:
+            unchanged.append(filename)
+    
+    return {
+        "changed": changed,
+        "unchanged": unchanged,
+        "removed": [filename for filename in old_files if filename not in new_files]
+    }
+
+class GenerationFailed(Exception):
+    """A checkpointed generation stopped on an error; it can be resumed by project ID."""
+    
+    def __init__(self, project_id: str, error: Exception):
+        super().__init__(str(error))
+        self.project_id = project_id
+
+def _node(name: str) -> RunnableLambda:
+    """Graph node that runs the named step on the orchestrator carried in config."""
+    def invoke(state: CodeGenState, config: RunnableConfig) -> CodeGenState:
+        with node_latency.time(node=name):
+            return getattr(config["configurable"]["orchestrator"], f"_{name}_node")(state, config)
+    
+    async def ainvoke(state: CodeGenState, config: RunnableConfig) -> CodeGenState:
+        with node_latency.time(node=name):
+            return await getattr(config["configurable"]["orchestrator"], f"_a{name}_node")(state, config)
+    
+    # Sync for invoke, async for ainvoke
+    return RunnableLambda(invoke, afunc=ainvoke, name=name)
+
+def build_workflow(checkpointer=None):
+    """
+    Build and compile the LangGraph workflow.
+    
+    With a checkpointer, state is saved after every node under the run's
+    thread_id (the project ID).
+    """
+    workflow = StateGraph(CodeGenState)
+    
+    # Add nodes
+    workflow.add_node("architect", _node("architect"))
+    workflow.add_node("engineer", _node("engineer"))
+    workflow.add_node("testsprite", _node("testsprite"))
+    
+    # Define edges
+    workflow.set_entry_point("architect")
+    workflow.add_edge("architect", "engineer")
+    workflow.add_edge("engineer", "testsprite")
+    workflow.add_edge("testsprite", END)
+    
+    return workflow.compile(checkpointer=checkpointer)
+
+_workflow = None
+_agents = {}
+_shared_lock = threading.Lock()
+
+def get_workflow():
+    """The compiled workflow, built once per process and shared by every request."""
+    global _workflow
+    if _workflow is None:
+        with _shared_lock:
+            if _workflow is None:
+                checkpointer = None
+                if generation_checkpoints is not None:
+                    generation_checkpoints.prune()
+                    checkpointer = generation_checkpoints.saver
+                _workflow = build_workflow(checkpointer)
+    return _workflow
+
+def shared_agents(use_cache: bool = True) -> tuple:
+    """Process-wide (architect, engineer, testsprite) agents for a cache setting."""
+    with _shared_lock:
+        if use_cache not in _agents:
+            _agents[use_cache] = (
+                ArchitectAgent(use_cache=use_cache),
+                EngineerAgent(use_cache=use_cache),
+                TestSpriteAgent()
+            )
+        return _agents[use_cache]
+
 class CodeGenesisOrchestrator:
-    """LangGraph-based orchestrator for the coding workflow."""
+    """
+    Per-request context for the coding workflow.
     
-    def __init__(self, user_api_key: Optional[str] = None, user_provider: Optional[str] = None, user_base_url: Optional[str] = None):
+    Holds what one generation needs (the user's pooled LLMs, its VFS and
+    options). The compiled graph and the agents are shared by every request;
+    each run passes its orchestrator to the graph in config["configurable"].
+    """
+    
+    def __init__(
+        self,
+        user_api_key: Optional[str] = None,
+        user_provider: Optional[str] = None,
+        user_base_url: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        use_cache: bool = True,
+        pipeline_tests: Optional[bool] = None,
+        stream_plan: Optional[bool] = None,
+        hedge: Optional[bool] = None,
+        project_id: Optional[str] = None
+    ):
         """
-        Initialize orchestrator with user API credentials.
+        Initialize a generation with user API credentials.
         
         Args:
             user_api_key: User's own API key (REQUIRED for project generation)
             user_provider: User's API provider (REQUIRED)
             user_base_url: Custom base URL (optional)
+            max_concurrency: Max engineer calls in flight (1 = sequential)
+            use_cache: Reuse cached plans and engineer output for identical requests
+            pipeline_tests: Generate each file's tests as soon as the file is written
+                and merge them at the end, instead of one TestSprite call after
+                the last file (defaults to PIPELINE_TESTS)
+            stream_plan: On the async path, start writing each file while the
+                architect's plan is still streaming (defaults to STREAM_PLAN).
+                Early files are written without dependency context.
+            hedge: On the async path, duplicate LLM calls slower than recent
+                ones and keep the first answer, within a per-generation budget
+                (defaults to LLM_HEDGING)
+            project_id: ID of the generation (and its checkpoints); pass an
+                earlier one to resume that generation
         """
-        self.architect = ArchitectAgent(user_api_key, user_provider, user_base_url)
-        self.engineer = EngineerAgent(user_api_key, user_provider, user_base_url)
-        self.testsprite = TestSpriteAgent(user_api_key, user_provider, user_base_url)
-        self.vfs = VirtualFileSystem()
-        
-        # Build the graph
-        self.workflow = self._build_graph()
+        self.architect, self.engineer, self.testsprite = shared_agents(use_cache)
+        self.architect_llm = self.architect.get_llm(user_api_key, user_provider, user_base_url)
+        self.engineer_llm = self.engineer.get_llm(user_api_key, user_provider, user_base_url)
+        self.testsprite_llm = self.testsprite.get_llm(user_api_key, user_provider, user_base_url)
+        self.project_id = project_id or uuid.uuid4().hex
+        self.vfs = projects.create(self.project_id)
+        self.max_concurrency = max(1, max_concurrency or DEFAULT_ENGINEER_CONCURRENCY)
+        self.pipeline_tests = DEFAULT_PIPELINE_TESTS if pipeline_tests is None else pipeline_tests
+        self.stream_plan = DEFAULT_STREAM_PLAN if stream_plan is None else stream_plan
+        self.hedge = DEFAULT_HEDGE if hedge is None else hedge
+        self._early_writes = {}  # filename -> (description, tech_stack, task) started during planning
+        self._write_semaphore = None
     
-    def _build_graph(self):
-        """Build the LangGraph workflow."""
-        workflow = StateGraph(CodeGenState)
-        
-        # Add nodes
-        workflow.add_node("architect", self._architect_node)
-        workflow.add_node("engineer", self._engineer_node)
-        workflow.add_node("testsprite", self._testsprite_node)
-        
-        # Define edges
-        workflow.set_entry_point("architect")
-        workflow.add_edge("architect", "engineer")
-        workflow.add_edge("engineer", "testsprite")
-        workflow.add_edge("testsprite", END)
-        
-        return workflow.compile()
+    @property
+    def workflow(self):
+        return get_workflow()
+    
+    def _run_config(self, stream_tokens: bool = False) -> RunnableConfig:
+        """Graph config for one run of this generation (checkpointed under its project ID)."""
+        configurable = {"orchestrator": self, "stream_tokens": stream_tokens}
+        if generation_checkpoints is not None:
+            configurable["thread_id"] = self.project_id
+        return {"configurable": configurable}
     
-    def _architect_node(self, state: CodeGenState) -> CodeGenState:
+    def _architect_node(self, state: CodeGenState, config: RunnableConfig) -> CodeGenState:
         """Architect planning node."""
-        plan = self.architect.plan(state["user_prompt"])
+        plan = self.architect.plan(state["user_prompt"], llm=self.architect_llm)
+        state["file_plan"] = plan
+        state["status"] = "Planning complete"
+        return state
+    
+    async def _aarchitect_node(self, state: CodeGenState, config: RunnableConfig) -> CodeGenState:
+        """
+        Async architect planning node.
+        
+        In stream_plan mode each file is handed to the engineer as soon as its
+        plan entry has streamed in; the engineer node picks up those writes.
+        """
+        self._early_writes = {}
+        self._write_semaphore = asyncio.Semaphore(self.max_concurrency)
+        if not self.stream_plan:
+            plan = await self.architect.aplan(state["user_prompt"], llm=self.architect_llm)
+        else:
+            writer = get_stream_writer()
+            stream_tokens = config.get("configurable", {}).get("stream_tokens", False)
+            
+            def dispatch(filename: str, description: str, tech_stack: Optional[str]) -> None:
+                tech_stack = tech_stack or "HTML/CSS/JS"
+                if filename in self._early_writes:
+                    self._early_writes[filename][2].cancel()
+                task = asyncio.create_task(self._awrite_file(
+                    filename,
+                    description,
+                    state["user_prompt"],
+                    tech_stack,
+                    "",
+                    self._write_semaphore,
+                    writer,
+                    stream_tokens
+                ))
+                self._early_writes[filename] = (description, tech_stack, task)
+            
+            try:
+                plan = await self.architect.astream_plan(state["user_prompt"], dispatch, llm=self.architect_llm)
+            except BaseException:
+                for _, _, task in self._early_writes.values():
+                    task.cancel()
+                self._early_writes = {}
+                raise
         state["file_plan"] = plan
         state["status"] = "Planning complete"
         return state
     
-    def _engineer_node(self, state: CodeGenState) -> CodeGenState:
-        """Engineer coding node."""
+    def _engineer_node(self, state: CodeGenState, config: RunnableConfig) -> CodeGenState:
+        """
+        Engineer coding node. Files are written concurrently in dependency waves,
+        bounded by max_concurrency. In pipelined mode each finished file's test
+        fragment is generated alongside the remaining files.
+        """
         plan = state["file_plan"]
-        files = {}
+        completed, fragments = self._completed_files(plan)
         
-        for filename, description in plan.get("files", {}).items():
-            code = self.engineer.write_file(
-                filename, 
-                description, 
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as test_pool:
+            pending = []
+            on_file = None
+            if self.pipeline_tests:
+                on_file = lambda filename, code: pending.append((filename, test_pool.submit(
+                    self.testsprite.generate_file_tests,
+                    filename,
+                    code,
+                    state["user_prompt"],
+                    llm=self.testsprite_llm
+                )))
+                for filename in completed:
+                    if filename not in fragments:
+                        on_file(filename, completed[filename])
+            
+            files, errors = self._write_files(
+                [entry for entry in plan.get("files", {}).items() if entry[0] not in completed],
                 state["user_prompt"],
-                plan.get("tech_stack", "HTML/CSS/JS")
+                plan.get("tech_stack", "HTML/CSS/JS"),
+                dependencies=plan_dependencies(plan),
+                existing=completed,
+                on_file=self._checkpointing_files(plan, on_file)
             )
-            files[filename] = code
-            self.vfs.write_file(filename, code)
+            
+            for filename, future in pending:
+                try:
+                    fragments[filename] = future.result()
+                except Exception as e:
+                    print(f"TestSprite failed on {filename}: {e}")
+                    continue
+                self._checkpoint_fragment(filename, fragments[filename])
+        
+        files = self._with_completed(plan, completed, files)
+        state["generated_files"] = files
+        state["file_errors"] = errors
+        state["test_fragments"] = {filename: fragments[filename] for filename in files if filename in fragments}
+        state["status"] = "Code generation complete"
+        return state
+    
+    async def _aengineer_node(self, state: CodeGenState, config: RunnableConfig) -> CodeGenState:
+        """Async engineer coding node, bounded by max_concurrency."""
+        plan = state["file_plan"]
+        writer = get_stream_writer()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        completed, fragments = await asyncio.to_thread(self._completed_files, plan)
+        pending = []
+        saves = []
+        
+        async def write_fragment(filename: str, code: str) -> None:
+            async with semaphore:
+                try:
+                    fragment = await self.testsprite.agenerate_file_tests(
+                        filename,
+                        code,
+                        state["user_prompt"],
+                        llm=self.testsprite_llm
+                    )
+                except Exception as e:
+                    print(f"TestSprite failed on {filename}: {e}")
+                    return
+            fragments[filename] = fragment
+            await asyncio.to_thread(self._checkpoint_fragment, filename, fragment)
+            writer({"event": "test_fragment", "filename": filename, "content": fragment})
+        
+        on_file = None
+        if self.pipeline_tests:
+            on_file = lambda filename, code: pending.append(asyncio.create_task(write_fragment(filename, code)))
+            for filename in completed:
+                if filename not in fragments:
+                    on_file(filename, completed[filename])
+        
+        files, errors = await self._awrite_files(
+            [entry for entry in plan.get("files", {}).items() if entry[0] not in completed],
+            state["user_prompt"],
+            plan.get("tech_stack", "HTML/CSS/JS"),
+            dependencies=plan_dependencies(plan),
+            existing=completed,
+            writer=writer,
+            stream_tokens=config.get("configurable", {}).get("stream_tokens", False),
+            on_file=self._acheckpointing_files(plan, on_file, saves),
+            started=self._claim_early_writes(plan, writer),
+            semaphore=self._write_semaphore
+        )
+        # Saves first: each one hands its file on to on_file once it is stored
+        await asyncio.gather(*saves)
+        await asyncio.gather(*pending)
         
+        files = self._with_completed(plan, completed, files)
         state["generated_files"] = files
+        state["file_errors"] = errors
+        state["test_fragments"] = {filename: fragments[filename] for filename in files if filename in fragments}
         state["status"] = "Code generation complete"
         return state
     
-    def _testsprite_node(self, state: CodeGenState) -> CodeGenState:
-        """TestSprite QA node."""
-        test_code = self.testsprite.generate_tests(
-            state["generated_files"],
-            state["user_prompt"]
+    def _write_files(
+        self,
+        entries: list,
+        user_prompt: str,
+        tech_stack: str,
+        dependencies: Optional[dict] = None,
+        existing: Optional[dict] = None,
+        on_file: Optional[Callable[[str, str], None]] = None
+    ) -> tuple:
+        """
+        Write (filename, description) entries on a bounded thread pool.
+        
+        Files run in dependency waves: every file in a wave is generated in
+        parallel, and each gets interface summaries (not the source) of the
+        dependencies finished in earlier waves or given in existing.
+        on_file(filename, code) is called as each file succeeds.
+        Returns (files, errors) in entry order; a failed file does not abort the others.
+        """
+        files = {}
+        errors = {}
+        if not entries:
+            return files, errors
+        
+        descriptions = dict(entries)
+        dependencies = dependencies or {}
+        summaries = self._existing_summaries(existing, dependencies)
+        results = {}
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(entries))) as pool:
+            for wave in topological_waves(list(descriptions), dependencies):
+                futures = [
+                    (filename, pool.submit(
+                        self.engineer.write_file,
+                        filename,
+                        descriptions[filename],
+                        user_prompt,
+                        tech_stack,
+                        context=dependency_context(filename, dependencies, summaries),
+                        llm=self.engineer_llm
+                    ))
+                    for filename in wave
+                ]
+                
+                for filename, future in futures:
+                    try:
+                        results[filename] = future.result()
+                    except Exception as e:
+                        results[filename] = e
+                        continue
+                    summaries[filename] = summarize_interface(filename, results[filename])
+                    if on_file is not None:
+                        on_file(filename, results[filename])
+        
+        return self._collect_files(descriptions, results)
+    
+    async def _awrite_files(
+        self,
+        entries: list,
+        user_prompt: str,
+        tech_stack: str,
+        dependencies: Optional[dict] = None,
+        existing: Optional[dict] = None,
+        writer: Callable[[dict], None] = lambda event: None,
+        stream_tokens: bool = False,
+        on_file: Optional[Callable[[str, str], None]] = None,
+        started: Optional[dict] = None,
+        semaphore: Optional[asyncio.Semaphore] = None
+    ) -> tuple:
+        """
+        Async version of _write_files(), reporting per-file progress to writer.
+        
+        started maps entries that are already being written (by the streaming
+        architect) to their tasks; they are awaited instead of written again.
+        """
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+        descriptions = dict(entries)
+        dependencies = dependencies or {}
+        started = {filename: task for filename, task in (started or {}).items() if filename in descriptions}
+        summaries = self._existing_summaries(existing, dependencies)
+        results = {}
+        
+        async def finish(filename: str) -> str:
+            code = await started[filename]
+            if on_file is not None:
+                on_file(filename, code)
+            return code
+        
+        started_results = asyncio.gather(*(finish(filename) for filename in started), return_exceptions=True)
+        
+        pending = [filename for filename in descriptions if filename not in started]
+        for wave in topological_waves(pending, dependencies):
+            wave_results = await asyncio.gather(
+                *(self._awrite_file(
+                    filename,
+                    descriptions[filename],
+                    user_prompt,
+                    tech_stack,
+                    dependency_context(filename, dependencies, summaries),
+                    semaphore,
+                    writer,
+                    stream_tokens,
+                    on_file
+                ) for filename in wave),
+                return_exceptions=True
+            )
+            for filename, result in zip(wave, wave_results):
+                results[filename] = result
+                if not isinstance(result, Exception):
+                    summaries[filename] = summarize_interface(filename, result)
+        
+        results.update(zip(started, await started_results))
+        return self._collect_files(descriptions, results)
+    
+    async def _awrite_file(
+        self,
+        filename: str,
+        description: str,
+        user_prompt: str,
+        tech_stack: str,
+        context: str,
+        semaphore: asyncio.Semaphore,
+        writer: Callable[[dict], None],
+        stream_tokens: bool,
+        on_file: Optional[Callable[[str, str], None]] = None
+    ) -> str:
+        """Write one file under the semaphore, reporting progress events to writer."""
+        async with semaphore:
+            writer({"event": "file_start", "filename": filename})
+            on_token = None
+            if stream_tokens:
+                on_token = lambda delta: writer({"event": "file_delta", "filename": filename, "delta": delta})
+            try:
+                code = await self.engineer.awrite_file(
+                    filename,
+                    description,
+                    user_prompt,
+                    tech_stack,
+                    context=context,
+                    on_token=on_token,
+                    llm=self.engineer_llm
+                )
+            except Exception as e:
+                writer({"event": "file_error", "filename": filename, "error": str(e)})
+                raise
+            writer({"event": "file_complete", "filename": filename, "content": code})
+            if on_file is not None:
+                on_file(filename, code)
+            return code
+    
+    def _claim_early_writes(self, plan: dict, writer: Callable[[dict], None]) -> dict:
+        """
+        Take the writes the streaming architect started, keeping only files the
+        final plan still has with the same description and tech stack (a
+        malformed plan falls back to the default plan). Others are cancelled.
+        """
+        early, self._early_writes = self._early_writes, {}
+        files = plan.get("files", {})
+        tech_stack = plan.get("tech_stack", "HTML/CSS/JS")
+        
+        started = {}
+        for filename, (description, early_tech_stack, task) in early.items():
+            if files.get(filename) == description and early_tech_stack == tech_stack:
+                started[filename] = task
+            else:
+                task.cancel()
+                writer({"event": "file_dropped", "filename": filename})
+        return started
+    
+    def _completed_files(self, plan: dict) -> tuple:
+        """(files, test fragments) a resumed engineer node already wrote for this plan."""
+        if generation_checkpoints is None:
+            return {}, {}
+        return generation_checkpoints.completed_files(
+            self.project_id,
+            plan.get("files", {}),
+            plan.get("tech_stack", "HTML/CSS/JS")
         )
+    
+    def _checkpointing_files(
+        self,
+        plan: dict,
+        on_file: Optional[Callable[[str, str], None]] = None
+    ) -> Optional[Callable[[str, str], None]]:
+        """Wrap on_file so each written file is checkpointed before anything else sees it."""
+        if generation_checkpoints is None:
+            return on_file
+        descriptions = plan.get("files", {})
+        tech_stack = plan.get("tech_stack", "HTML/CSS/JS")
+        
+        def save(filename: str, code: str) -> None:
+            generation_checkpoints.save_file(self.project_id, filename, descriptions[filename], tech_stack, code)
+            if on_file is not None:
+                on_file(filename, code)
+        return save
+    
+    def _acheckpointing_files(
+        self,
+        plan: dict,
+        on_file: Optional[Callable[[str, str], None]],
+        saves: list
+    ) -> Optional[Callable[[str, str], None]]:
+        """
+        Async version of _checkpointing_files(). Each file is saved on a worker
+        thread and then passed to on_file; the save tasks are appended to saves
+        for the caller to await.
+        """
+        if generation_checkpoints is None:
+            return on_file
+        save_file = self._checkpointing_files(plan)
+        
+        async def save(filename: str, code: str) -> None:
+            await asyncio.to_thread(save_file, filename, code)
+            if on_file is not None:
+                on_file(filename, code)
+        return lambda filename, code: saves.append(asyncio.create_task(save(filename, code)))
+    
+    def _checkpoint_fragment(self, filename: str, fragment: str) -> None:
+        if generation_checkpoints is not None:
+            generation_checkpoints.save_fragment(self.project_id, filename, fragment)
+    
+    def _with_completed(self, plan: dict, completed: dict, files: dict) -> dict:
+        """Newly written and previously completed files together, in plan order."""
+        if not completed:
+            return files
+        for filename, code in completed.items():
+            self.vfs.write_file(filename, code)
+        return {
+            filename: completed.get(filename, files.get(filename))
+            for filename in plan.get("files", {})
+            if filename in completed or filename in files
+        }
+    
+    @staticmethod
+    def _existing_summaries(existing: Optional[dict], dependencies: dict) -> dict:
+        """Interface summaries of already-written files that something depends on."""
+        needed = {need for needs in dependencies.values() for need in needs}
+        return {
+            filename: summarize_interface(filename, code)
+            for filename, code in (existing or {}).items()
+            if filename in needed
+        }
+    
+    def _collect_files(self, descriptions: dict, results: dict) -> tuple:
+        """Split per-file results into (files, errors) in entry order, writing files to the VFS."""
+        files = {}
+        errors = {}
+        for filename in descriptions:
+            result = results[filename]
+            if isinstance(result, Exception):
+                print(f"Engineer failed on {filename}: {result}")
+                errors[filename] = str(result)
+                continue
+            files[filename] = result
+            self.vfs.write_file(filename, result)
+        return files, errors
+    
+    def _testsprite_node(self, state: CodeGenState, config: RunnableConfig) -> CodeGenState:
+        """TestSprite QA node. Pipelined fragments are merged without another LLM call."""
+        if state["test_fragments"]:
+            test_code = merge_test_fragments(state["test_fragments"])
+        else:
+            test_code = self.testsprite.generate_tests(
+                state["generated_files"],
+                state["user_prompt"],
+                llm=self.testsprite_llm
+            )
+        state["test_script"] = test_code
+        self.vfs.write_file("tests/app.test.js", test_code)
+        state["status"] = "Tests generated"
+        return state
+    
+    async def _atestsprite_node(self, state: CodeGenState, config: RunnableConfig) -> CodeGenState:
+        """Async TestSprite QA node."""
+        if state["test_fragments"]:
+            test_code = merge_test_fragments(state["test_fragments"])
+        else:
+            on_token = None
+            if config.get("configurable", {}).get("stream_tokens", False):
+                writer = get_stream_writer()
+                on_token = lambda delta: writer({"event": "test_delta", "delta": delta})
+            
+            test_code = await self.testsprite.agenerate_tests(
+                state["generated_files"],
+                state["user_prompt"],
+                on_token=on_token,
+                llm=self.testsprite_llm
+            )
         state["test_script"] = test_code
         self.vfs.write_file("tests/app.test.js", test_code)
         state["status"] = "Tests generated"
         return state
     
     def generate_app(self, user_prompt: str) -> dict:
-        """Main entry point to generate an app."""
-        initial_state: CodeGenState = {
+        """
+        Main entry point to generate an app.
+        
+        An unfinished checkpointed generation with this project ID (a retried
+        job) is resumed instead of starting over.
+        
+        Raises:
+            GenerationFailed: If a checkpointed run stops on an error
+        """
+        with generations_in_flight.track(kind="generate"):
+            snapshot = self.workflow.get_state(self._run_config()) if generation_checkpoints is not None else None
+            final_state = self._run(self._graph_input(user_prompt, snapshot))
+        return self._build_result(final_state)
+    
+    async def agenerate_app(self, user_prompt: str) -> dict:
+        """Async entry point to generate an app without blocking the event loop."""
+        with generations_in_flight.track(kind="generate"), hedging.budget(self.hedge):
+            snapshot = await self.workflow.aget_state(self._run_config()) if generation_checkpoints is not None else None
+            final_state = await self._arun(self._graph_input(user_prompt, snapshot))
+        return self._build_result(final_state)
+    
+    async def aresume_app(self) -> Optional[dict]:
+        """
+        Continue a checkpointed generation from its last completed step.
+        
+        Finished nodes are not run again and the engineer only writes files
+        missing from the checkpoint. A generation that finished with file
+        errors goes back to the engineer for just those files, then the tests.
+        
+        Returns:
+            The generation result, or None if project_id has no checkpoint
+            
+        Raises:
+            GenerationFailed: If the run stops on an error again
+        """
+        if generation_checkpoints is None:
+            return None
+        config = self._run_config()
+        snapshot = await self.workflow.aget_state(config)
+        if not snapshot.values:
+            return None
+        
+        for filename, code in snapshot.values.get("generated_files", {}).items():
+            self.vfs.write_file(filename, code)
+        with generations_in_flight.track(kind="resume"), hedging.budget(self.hedge):
+            if not snapshot.next:
+                await self.workflow.aupdate_state(config, {"status": "Resuming"}, as_node="architect")
+            final_state = await self._arun(None)
+        return self._build_result(final_state)
+    
+    def _graph_input(self, user_prompt: str, snapshot) -> Optional[CodeGenState]:
+        """Initial state for a new run, or None to continue an unfinished checkpoint."""
+        return None if snapshot is not None and snapshot.next else self._initial_state(user_prompt)
+    
+    def _run(self, graph_input: Optional[CodeGenState]) -> CodeGenState:
+        """Run the workflow, checkpointing after every node."""
+        self._touch_checkpoint()
+        try:
+            final_state = self.workflow.invoke(graph_input, config=self._run_config())
+        except Exception as e:
+            if generation_checkpoints is None:
+                raise
+            raise GenerationFailed(self.project_id, e) from e
+        self._release_checkpoint(final_state)
+        return final_state
+    
+    async def _arun(self, graph_input: Optional[CodeGenState]) -> CodeGenState:
+        """Async version of _run(); checkpoint bookkeeping runs on a worker thread."""
+        await asyncio.to_thread(self._touch_checkpoint)
+        try:
+            final_state = await self.workflow.ainvoke(graph_input, config=self._run_config())
+        except Exception as e:
+            if generation_checkpoints is None:
+                raise
+            raise GenerationFailed(self.project_id, e) from e
+        await asyncio.to_thread(self._release_checkpoint, final_state)
+        return final_state
+    
+    def _touch_checkpoint(self) -> None:
+        if generation_checkpoints is not None:
+            generation_checkpoints.touch(self.project_id)
+    
+    def _release_checkpoint(self, final_state: CodeGenState) -> None:
+        """Drop the checkpoint once nothing is left to resume (kept while files failed)."""
+        if generation_checkpoints is not None and not final_state["file_errors"]:
+            generation_checkpoints.delete(self.project_id)
+    
+    def regenerate_app(
+        self,
+        user_prompt: str,
+        previous_plan: dict,
+        previous_files: dict,
+        previous_tests: str = "",
+        file_plan: Optional[dict] = None
+    ) -> dict:
+        """
+        Regenerate only the files whose plan entries were added or changed.
+        
+        Args:
+            user_prompt: The (possibly edited) prompt
+            previous_plan: Plan returned by the previous generation
+            previous_files: Files returned by the previous generation
+            previous_tests: Test script returned by the previous generation
+            file_plan: Edited plan to use as-is; if omitted the architect re-plans
+        """
+        with generations_in_flight.track(kind="regenerate"):
+            plan = file_plan or self.architect.plan(user_prompt, llm=self.architect_llm)
+            diff = diff_plans(previous_plan, plan, previous_files)
+            files, errors = self._write_files(
+                [(filename, plan["files"][filename]) for filename in diff["changed"]],
+                user_prompt,
+                plan.get("tech_stack", "HTML/CSS/JS"),
+                dependencies=plan_dependencies(plan),
+                existing={filename: previous_files[filename] for filename in diff["unchanged"]}
+            )
+        
+            merged = self._carry_over(plan, diff, files, previous_files)
+            tests_stale = self._tests_stale(diff, files, previous_tests)
+            tests = self.testsprite.generate_tests(merged, user_prompt, llm=self.testsprite_llm) if tests_stale else previous_tests
+        
+        return self._build_regenerate_result(plan, diff, merged, errors, tests, tests_stale)
+    
+    async def aregenerate_app(
+        self,
+        user_prompt: str,
+        previous_plan: dict,
+        previous_files: dict,
+        previous_tests: str = "",
+        file_plan: Optional[dict] = None
+    ) -> dict:
+        """Async version of regenerate_app()."""
+        with generations_in_flight.track(kind="regenerate"), hedging.budget(self.hedge):
+            plan = file_plan or await self.architect.aplan(user_prompt, llm=self.architect_llm)
+            diff = diff_plans(previous_plan, plan, previous_files)
+            files, errors = await self._awrite_files(
+                [(filename, plan["files"][filename]) for filename in diff["changed"]],
+                user_prompt,
+                plan.get("tech_stack", "HTML/CSS/JS"),
+                dependencies=plan_dependencies(plan),
+                existing={filename: previous_files[filename] for filename in diff["unchanged"]}
+            )
+        
+            merged = self._carry_over(plan, diff, files, previous_files)
+            tests_stale = self._tests_stale(diff, files, previous_tests)
+            tests = await self.testsprite.agenerate_tests(merged, user_prompt, llm=self.testsprite_llm) if tests_stale else previous_tests
+        
+        return self._build_regenerate_result(plan, diff, merged, errors, tests, tests_stale)
+    
+    def _carry_over(self, plan: dict, diff: dict, files: dict, previous_files: dict) -> dict:
+        """Merge regenerated files with unchanged ones, in plan order."""
+        merged = {}
+        for filename in plan.get("files", {}):
+            if filename in files:
+                merged[filename] = files[filename]
+            elif filename in diff["unchanged"]:
+                merged[filename] = previous_files[filename]
+                self.vfs.write_file(filename, merged[filename])
+        return merged
+    
+    @staticmethod
+    def _tests_stale(diff: dict, files: dict, previous_tests: str) -> bool:
+        """Tests only need regenerating when the file set actually changed."""
+        return bool(files or diff["removed"] or not previous_tests)
+    
+    def _build_regenerate_result(
+        self,
+        plan: dict,
+        diff: dict,
+        files: dict,
+        errors: dict,
+        tests: str,
+        tests_regenerated: bool
+    ) -> dict:
+        """Shape a regeneration into the /api/generate response plus diff details."""
+        self.vfs.write_file("tests/app.test.js", tests)
+        projects.register(self.project_id, self.vfs)
+        return {
+            "project_id": self.project_id,
+            "files": files,
+            "tests": tests,
+            "plan": plan,
+            "errors": errors,
+            "status": "Regeneration complete",
+            "regenerated": [filename for filename in diff["changed"] if filename in files],
+            "carried_over": diff["unchanged"],
+            "removed": diff["removed"],
+            "tests_regenerated": tests_regenerated
+        }
+    
+    async def astream_app(self, user_prompt: str) -> AsyncIterator[dict]:
+        """
+        Generate an app while yielding progress events as they happen.
+        
+        Yields dicts with an "event" key: "status" for every CodeGenState.status
+        transition, "plan" once the architect finishes, "file_start",
+        "file_delta", "file_complete" and "file_error" per file ("file_dropped"
+        for an early file the final plan discarded), "test_fragment"
+        per file in pipelined mode or "test_delta" for the test script otherwise,
+        and a final "done" carrying the full result.
+        """
+        with generations_in_flight.track(kind="stream"), hedging.budget(self.hedge):
+            state = self._initial_state(user_prompt)
+            await asyncio.to_thread(self._touch_checkpoint)
+            yield {"event": "status", "status": state["status"], "project_id": self.project_id}
+        
+            async for mode, chunk in self.workflow.astream(
+                state,
+                config=self._run_config(stream_tokens=True),
+                stream_mode=["updates", "custom"]
+            ):
+                if mode == "custom":
+                    yield chunk
+                    continue
+            
+                for node, update in chunk.items():
+                    state.update(update)
+                    if node == "architect":
+                        yield {"event": "plan", "plan": update["file_plan"]}
+                    yield {"event": "status", "node": node, "status": update["status"]}
+        
+        await asyncio.to_thread(self._release_checkpoint, state)
+        yield {"event": "done", "result": self._build_result(state)}
+    
+    def _initial_state(self, user_prompt: str) -> CodeGenState:
+        """Build the initial workflow state."""
+        return {
             "user_prompt": user_prompt,
             "file_plan": {},
             "generated_files": {},
+            "file_errors": {},
+            "test_fragments": {},
             "test_script": "",
             "status": "Starting"
         }
-        
-        # Run the workflow
-        final_state = self.workflow.invoke(initial_state)
-        
+    
+    def _build_result(self, final_state: CodeGenState) -> dict:
+        """Shape the final workflow state into the API response."""
+        projects.register(self.project_id, self.vfs)
         return {
+            "project_id": self.project_id,
             "files": final_state["generated_files"],
             "tests": final_state["test_script"],
             "plan": final_state["file_plan"],
+            "errors": final_state["file_errors"],
             "status": final_state["status"]
         }
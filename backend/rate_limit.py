@@ -0,0 +1,402 @@
+"""
+Rate Limiting for CodeGenesis
+Per-provider, per-key token buckets with AIMD concurrency and 429-aware retries
+"""
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+# Sustained requests per second and burst size of each provider key's token bucket
+DEFAULT_RATE = float(os.getenv("RATE_LIMIT_RPS", "10"))
+DEFAULT_BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+# AIMD concurrency window: starting size and bounds
+DEFAULT_INITIAL_CONCURRENCY = int(os.getenv("RATE_LIMIT_INITIAL_CONCURRENCY", "8"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "32"))
+# Retries after a 429, 408/409, 5xx or connection error
+DEFAULT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "4"))
+# Shrink the window while smoothed call latency exceeds this many seconds (0 = 429s only)
+DEFAULT_LATENCY_TARGET = float(os.getenv("RATE_LIMIT_LATENCY_TARGET", "0"))
+
+# Exponential backoff bounds (seconds); delays are drawn uniformly below the bound (full jitter)
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+# Window multipliers on a 429 and on latency above target
+RATE_LIMITED_DECREASE = 0.5
+LATENCY_DECREASE = 0.9
+# Weight of the newest sample in the latency EWMA
+LATENCY_SMOOTHING = 0.2
+
+# Filled in by the next limited call of the current task (see call_timing())
+_call_timing: ContextVar[Optional[dict]] = ContextVar("call_timing", default=None)
+
+
+@contextmanager
+def call_timing() -> Iterator[dict]:
+    """
+    Report how the limited call made inside the block went.
+
+    Yields a dict the limiter fills in on success: "latency" (seconds the
+    successful attempt took, excluding admission and backoff) and "delayed"
+    (True if the call waited for admission or was retried). Stays empty for
+    LLMs that run unlimited.
+    """
+    timing: dict = {}
+    token = _call_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _call_timing.reset(token)
+
+
+def _report_timing(latency: float, delayed: bool) -> None:
+    timing = _call_timing.get()
+    if timing is not None:
+        timing.update(latency=latency, delayed=delayed)
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """"rate_limited" for 429s, "transient" for errors worth retrying, else None."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status in (408, 409) or (isinstance(status, int) and status >= 500):
+        return "transient"
+    # openai's connection and timeout errors, matched by name to keep the SDK out of startup
+    if isinstance(error, httpx.TransportError) or any(
+        cls.__name__ == "APIConnectionError" for cls in type(error).__mro__
+    ):
+        return "transient"
+    return None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay requested by the provider's Retry-After (or retry-after-ms) header, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    try:
+        milliseconds = headers.get("retry-after-ms")
+        if milliseconds is not None:
+            return max(0.0, float(milliseconds) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Admission control for one provider key.
+
+    - A token bucket caps the request rate (rate per second, burst deep)
+    - An AIMD window caps calls in flight: it grows by one per window of
+      successful calls that used it fully, halves on a 429 and shrinks by 10%
+      while smoothed latency is above latency_target, at most once per round trip
+    - Retry-After pauses every caller of the key, not just the one that got the 429
+    - run()/arun() retry 429s and transient errors with jittered exponential
+      backoff, waiting at least Retry-After
+
+    Works from threads and event loops alike.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        initial_concurrency: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        min_concurrency: int = 1,
+        max_retries: Optional[int] = None,
+        latency_target: Optional[float] = None
+    ):
+        self.rate = rate or DEFAULT_RATE
+        self.burst = burst or DEFAULT_BURST
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.min_concurrency = max(1, min_concurrency)
+        self.limit = float(min(max(initial_concurrency or DEFAULT_INITIAL_CONCURRENCY, self.min_concurrency), self.max_concurrency))
+        self.max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+        self.latency_target = DEFAULT_LATENCY_TARGET if latency_target is None else latency_target
+
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._async_waiters: deque = deque()  # (loop, future)
+
+        self.calls = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.failures = 0
+
+    def acquire(self) -> bool:
+        """Block until a slot in the window and a token are available; returns True if that meant waiting."""
+        waited = False
+        with self._lock:
+            while not self._try_enter():
+                waited = True
+                self._slot_freed.wait()
+            delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return waited or delay > 0
+
+    async def aacquire(self) -> bool:
+        """Async version of acquire()."""
+        loop = asyncio.get_running_loop()
+        waited = False
+        while True:
+            with self._lock:
+                if self._try_enter():
+                    delay = self._reserve()
+                    break
+                waited = True
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+                    else:
+                        # Already woken for a free slot: hand it to the next waiter
+                        self._wake()
+                raise
+
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.release()
+                raise
+        return waited or delay > 0
+
+    def release(self, latency: Optional[float] = None) -> None:
+        """Free a slot; pass the call's latency when it succeeded."""
+        with self._lock:
+            window_full = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if latency is not None:
+                self._on_success(latency, window_full)
+            self._wake()
+
+    def run(self, call: Callable[[], T], can_retry: Callable[[], bool] = lambda: True) -> T:
+        """
+        Run call() under the limiter, retrying retryable errors.
+
+        Args:
+            call: The provider call
+            can_retry: Checked before each retry (e.g. False once output was streamed)
+        """
+        attempt = 0
+        while True:
+            waited = self.acquire()
+            start = time.monotonic()
+            try:
+                result = call()
+            except Exception as e:
+                delay = self._failed(e, attempt, can_retry)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.release()
+                raise
+            latency = time.monotonic() - start
+            self.release(latency)
+            _report_timing(latency, waited or attempt > 0)
+            return result
+
+    async def arun(self, call: Callable[[], Awaitable[T]], can_retry: Callable[[], bool] = lambda: True) -> T:
+        """Async version of run()."""
+        attempt = 0
+        while True:
+            waited = await self.aacquire()
+            start = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                delay = self._failed(e, attempt, can_retry)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.release()
+                raise
+            latency = time.monotonic() - start
+            self.release(latency)
+            _report_timing(latency, waited or attempt > 0)
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "waiting": len(self._async_waiters),
+                "rate": self.rate,
+                "tokens": round(tokens, 2),
+                "paused_for": round(max(0.0, self._paused_until - now), 3),
+                "latency_ewma": round(self.latency, 3) if self.latency is not None else None,
+                "calls": self.calls,
+                "rate_limited": self.rate_limited,
+                "retries": self.retries,
+                "failures": self.failures
+            }
+
+    def _try_enter(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self.calls += 1
+            return True
+        return False
+
+    def _reserve(self) -> float:
+        """Take a token (the balance may go negative) and return how long to wait for it."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        self._tokens -= 1
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        return max(wait, self._paused_until - now)
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            loop.call_soon_threadsafe(_resolve, waiter)
+            free -= 1
+        if free > 0:
+            self._slot_freed.notify(free)
+
+    def _on_success(self, latency: float, window_full: bool) -> None:
+        self.latency = latency if self.latency is None else (
+            LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+        )
+        if self.latency_target and self.latency > self.latency_target:
+            self._decrease(LATENCY_DECREASE)
+        elif window_full:
+            # Additive increase: about +1 per window's worth of successes
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        # Calls already in flight saw the same congestion; react once per round trip
+        if now - self._last_decrease < (self.latency or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * factor)
+
+    def _failed(self, error: Exception, attempt: int, can_retry: Callable[[], bool]) -> Optional[float]:
+        """Release the failed call's slot and return the delay before retrying, or None to give up."""
+        kind = classify_error(error)
+        retry_after = retry_after_seconds(error) if kind == "rate_limited" else None
+        with self._lock:
+            self.in_flight -= 1
+            if kind == "rate_limited":
+                self.rate_limited += 1
+                if retry_after:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                self._decrease(RATE_LIMITED_DECREASE)
+            self._wake()
+
+            if kind is None or attempt >= self.max_retries or not can_retry():
+                # Every call that gives up counts, not only those out of retries
+                self.failures += 1
+                return None
+            self.retries += 1
+
+        backoff = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt)
+        # Jitter on top of Retry-After so paused callers do not all retry at the same instant
+        return (retry_after or 0.0) + random.uniform(0, backoff)
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RateLimiterRegistry:
+    """
+    One RateLimiter per provider key, looked up through the LLM's metadata.
+
+    LLMs without a "rate_limit_key" in their metadata run unlimited. Bounded
+    to max_size limiters; the least recently used idle ones are dropped.
+    """
+
+    def __init__(self, max_size: int = 1024, **limiter_options):
+        self.max_size = max_size
+        self.limiter_options = limiter_options
+        self._limiters: "OrderedDict[str, RateLimiter]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> RateLimiter:
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = RateLimiter(**self.limiter_options)
+                self._evict()
+            self._limiters.move_to_end(key)
+            return limiter
+
+    def for_llm(self, llm) -> Optional[RateLimiter]:
+        metadata = getattr(llm, "metadata", None)
+        key = metadata.get("rate_limit_key") if isinstance(metadata, dict) else None
+        return self.get(key) if key else None
+
+    def run(self, llm, call: Callable[[], T], can_retry: Callable[[], bool] = lambda: True) -> T:
+        """Run call() under llm's limiter (see RateLimiter.run)."""
+        limiter = self.for_llm(llm)
+        return limiter.run(call, can_retry) if limiter else call()
+
+    async def arun(self, llm, call: Callable[[], Awaitable[T]], can_retry: Callable[[], bool] = lambda: True) -> T:
+        """Async version of run()."""
+        limiter = self.for_llm(llm)
+        return await (limiter.arun(call, can_retry) if limiter else call())
+
+    def stats(self) -> dict:
+        """Limiter state by key (keys hold a fingerprint of the API key, never the key)."""
+        with self._lock:
+            limiters = list(self._limiters.items())
+        return {key: limiter.stats() for key, limiter in limiters}
+
+    def _evict(self) -> None:
+        for key in list(self._limiters):
+            if len(self._limiters) <= self.max_size:
+                return
+            if self._limiters[key].in_flight == 0:
+                del self._limiters[key]
+
+
+# Shared limiters (one per provider key, process-wide)
+rate_limits = RateLimiterRegistry()
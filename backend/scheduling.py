@@ -0,0 +1,136 @@
+"""
+Dependency Scheduling for CodeGenesis
+Orders file generation into parallel waves and summarizes finished files for their dependents
+"""
+import os
+import re
+from typing import Dict, List
+
+# Upper bound on each interface summary passed to a dependent file's prompt
+MAX_SUMMARY_CHARS = 600
+
+_JS_EXPORT = re.compile(
+    r"export\s+(?:default\s+)?(?:async\s+)?(?:function\*?|class|const|let|var|interface|type|enum)\s+([A-Za-z_$][\w$]*)"
+)
+_JS_EXPORT_LIST = re.compile(r"export\s*\{([^}]*)\}")
+_JS_EXPORT_DEFAULT = re.compile(r"export\s+default\s+([A-Za-z_$][\w$]*)\s*;?\s*$", re.MULTILINE)
+_CJS_EXPORT = re.compile(r"(?:module\.)?exports\.([A-Za-z_$][\w$]*)\s*=")
+_CJS_EXPORT_OBJECT = re.compile(r"module\.exports\s*=\s*\{([^}]*)\}")
+_COMPONENT = re.compile(
+    r"(?:function|class)\s+([A-Z][\w$]*)|(?:const|let)\s+([A-Z][\w$]*)\s*=\s*(?:\([^)]*\)|[A-Za-z_$][\w$]*)\s*=>"
+)
+_FUNCTION = re.compile(r"^(?:async\s+)?function\s+([a-z_$][\w$]*)", re.MULTILINE)
+_CSS_CLASS = re.compile(r"\.(-?[_a-zA-Z][\w-]*)(?=[^{}]*\{)")
+_CSS_ID = re.compile(r"#(-?[_a-zA-Z][\w-]*)(?=[^{}]*\{)")
+_CSS_VAR = re.compile(r"(--[\w-]+)\s*:")
+_HTML_ID = re.compile(r"\bid\s*=\s*[\"']([^\"']+)[\"']")
+_HTML_CLASS = re.compile(r"\bclass(?:Name)?\s*=\s*[\"']([^\"']+)[\"']")
+_HTML_ASSET = re.compile(r"(?:src|href)\s*=\s*[\"']([^\"':]+\.(?:js|jsx|ts|tsx|css))[\"']")
+
+_SCRIPT_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
+_STYLE_EXTENSIONS = (".css", ".scss", ".sass", ".less")
+_MARKUP_EXTENSIONS = (".html", ".htm", ".vue", ".svelte")
+
+
+def plan_dependencies(plan: dict) -> Dict[str, List[str]]:
+    """
+    Read the optional "dependencies" map ({file: [files it uses]}) from a plan.
+
+    Unknown files and self-references are dropped, so a sloppy plan can only
+    lose ordering constraints, never add ones that cannot be met.
+    """
+    files = plan.get("files", {})
+    declared = plan.get("dependencies")
+    if not isinstance(declared, dict):
+        return {}
+
+    dependencies = {}
+    for filename, needs in declared.items():
+        if filename not in files or not isinstance(needs, list):
+            continue
+        # Only filenames count; objects or nested lists from the LLM are skipped
+        needs = [need for need in needs if isinstance(need, str)]
+        needs = [need for need in dict.fromkeys(needs) if need in files and need != filename]
+        if needs:
+            dependencies[filename] = needs
+    return dependencies
+
+
+def topological_waves(filenames: List[str], dependencies: Dict[str, List[str]]) -> List[List[str]]:
+    """
+    Group files into waves that can each be generated in parallel (Kahn's algorithm).
+
+    A file lands in the first wave after all of its dependencies; dependencies
+    outside filenames count as already available. Files are kept in plan order
+    within a wave. Files on a dependency cycle are generated together in a
+    final wave rather than never.
+    """
+    pending = set(filenames)
+    remaining = {
+        filename: {need for need in dependencies.get(filename, []) if need in pending}
+        for filename in filenames
+    }
+
+    waves = []
+    while pending:
+        wave = [filename for filename in filenames if filename in pending and not remaining[filename]]
+        if not wave:
+            waves.append([filename for filename in filenames if filename in pending])
+            break
+
+        waves.append(wave)
+        pending.difference_update(wave)
+        for filename in pending:
+            remaining[filename].difference_update(wave)
+
+    return waves
+
+
+def summarize_interface(filename: str, code: str) -> str:
+    """
+    Compact description of what a generated file exposes to other files.
+
+    Scripts report their exports, components and top-level functions;
+    stylesheets their classes, IDs and custom properties; markup its IDs,
+    classes and referenced assets. Never returns the source itself.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    sections = []
+
+    if extension in _SCRIPT_EXTENSIONS:
+        exports = _JS_EXPORT.findall(code) + _JS_EXPORT_DEFAULT.findall(code) + _CJS_EXPORT.findall(code)
+        for names in _JS_EXPORT_LIST.findall(code) + _CJS_EXPORT_OBJECT.findall(code):
+            exports += [name.split(":")[0].split(" as ")[-1].strip() for name in names.split(",")]
+        sections.append(("exports", exports))
+        sections.append(("components", [a or b for a, b in _COMPONENT.findall(code)]))
+        sections.append(("functions", _FUNCTION.findall(code)))
+        if extension == ".jsx" or extension == ".tsx":
+            sections.append(("classes", _split_classes(_HTML_CLASS.findall(code))))
+    elif extension in _STYLE_EXTENSIONS:
+        sections.append(("classes", _CSS_CLASS.findall(code)))
+        sections.append(("ids", _CSS_ID.findall(code)))
+        sections.append(("variables", _CSS_VAR.findall(code)))
+    elif extension in _MARKUP_EXTENSIONS:
+        sections.append(("ids", _HTML_ID.findall(code)))
+        sections.append(("classes", _split_classes(_HTML_CLASS.findall(code))))
+        sections.append(("assets", _HTML_ASSET.findall(code)))
+
+    lines = []
+    for label, names in sections:
+        names = [name for name in dict.fromkeys(names) if name]
+        if names:
+            lines.append(f"  {label}: {', '.join(names)}")
+
+    summary = "\n".join([f"{filename}:"] + (lines or ["  (no public interface detected)"]))
+    if len(summary) > MAX_SUMMARY_CHARS:
+        summary = summary[:MAX_SUMMARY_CHARS - 3] + "..."
+    return summary
+
+
+def dependency_context(filename: str, dependencies: Dict[str, List[str]], summaries: Dict[str, str]) -> str:
+    """Join the interface summaries of a file's finished dependencies ("" if none)."""
+    return "\n".join(summaries[need] for need in dependencies.get(filename, []) if need in summaries)
+
+
+def _split_classes(attributes: List[str]) -> List[str]:
+    return [name for attribute in attributes for name in attribute.split()]
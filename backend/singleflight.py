@@ -0,0 +1,140 @@
+"""
+Single-Flight Coalescing for CodeGenesis
+Concurrent identical calls share one in-flight execution and all receive its result
+"""
+import asyncio
+import threading
+from typing import Awaitable, Callable, Hashable, TypeVar
+from metrics import coalesced_calls, count_llm_calls, llm_calls_saved
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """One in-progress sync execution that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.llm_calls = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    Only calls that overlap in time are merged; nothing is remembered once the
+    execution finishes (that is the caches' job). Followers get the leader's
+    result or exception. Each follower is credited with the LLM calls the
+    shared execution made, as codegenesis_llm_calls_saved_total{operation}.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._lock = threading.Lock()
+        self._flights: dict = {}  # key -> _Flight (sync callers)
+        self._tasks: dict = {}  # (loop, key) -> [task, waiting callers, LLM calls made] (async callers)
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Run fn(), or wait for the identical call already running in another thread."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+
+        if not leader:
+            flight.done.wait()
+            self._credit(flight.llm_calls)
+            if isinstance(flight.error, Exception):
+                raise flight.error
+            if flight.error is not None:
+                # The leader was interrupted; that is not this caller's KeyboardInterrupt to raise
+                raise RuntimeError(f"Shared {self.operation} call was interrupted") from flight.error
+            return flight.result
+
+        try:
+            with count_llm_calls() as calls:
+                flight.result = fn()
+        except BaseException as e:
+            # Also KeyboardInterrupt, SystemExit and cancellations, so followers never get None
+            flight.error = e
+            raise
+        finally:
+            flight.llm_calls = calls[0]
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await fn(), or the identical call already running on this event loop.
+
+        The shared execution runs as its own task: a caller that is cancelled
+        only stops waiting, and the task is cancelled once no caller is left.
+        """
+        flight_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            flight = self._tasks.get(flight_key)
+            if flight is None:
+                flight = self._tasks[flight_key] = [None, 0, 0]
+                flight[0] = asyncio.ensure_future(self._run(fn, flight))
+                flight[0].add_done_callback(lambda task: self._forget(flight_key, task))
+                self.executions += 1
+                follower = False
+            else:
+                follower = True
+            flight[1] += 1
+
+        task = flight[0]
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            with self._lock:
+                flight[1] -= 1
+                abandoned = flight[1] == 0
+            if abandoned and not task.done():
+                task.cancel()
+            raise
+        finally:
+            if follower and task.done():
+                self._credit(flight[2])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights) + len(self._tasks),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "llm_calls_saved": llm_calls_saved.value(operation=self.operation)
+            }
+
+    async def _run(self, fn: Callable[[], Awaitable[T]], flight: list) -> T:
+        with count_llm_calls() as calls:
+            try:
+                return await fn()
+            finally:
+                flight[2] = calls[0]
+
+    def _forget(self, flight_key: tuple, task: asyncio.Task) -> None:
+        with self._lock:
+            flight = self._tasks.get(flight_key)
+            if flight is not None and flight[0] is task:
+                del self._tasks[flight_key]
+
+    def _credit(self, llm_calls: int) -> None:
+        with self._lock:
+            self.coalesced += 1
+        coalesced_calls.inc(operation=self.operation)
+        llm_calls_saved.inc(llm_calls, operation=self.operation)
+
+
+# Shared coalescing groups
+generation_flights = SingleFlight("generate")
+plan_flights = SingleFlight("plan")
+file_flights = SingleFlight("write_file")
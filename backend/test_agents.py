@@ -3,24 +3,24 @@ Unit tests for individual agents
 """
 import pytest
 import os
-from unittest.mock import patch, MagicMock
-from agents.architect import ArchitectAgent
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
+from agents.architect import ArchitectAgent, PlanStreamParser
 from agents.engineer import EngineerAgent
-from agents.testsprite import TestSpriteAgent
+from agents.testsprite import TestSpriteAgent, merge_test_fragments
+from cache import DiskCache, MemoryCache, SQLiteCache, TieredCache
 
 # Mock API config for all tests
 @pytest.fixture(autouse=True)
-def mock_api_config():
-    with patch("agents.architect.api_config") as mock_config1, \
-         patch("agents.engineer.api_config") as mock_config2, \
-         patch("agents.testsprite.api_config") as mock_config3:
+def mock_api_config(tmp_path):
+    with patch("agents.base.api_config") as mock_config, \
+         patch("agents.engineer.file_cache", DiskCache(str(tmp_path / "file_cache"))), \
+         patch("agents.architect.plan_cache", TieredCache(MemoryCache(), SQLiteCache(str(tmp_path / "plans.db")))):
         
         mock_llm = MagicMock()
         mock_llm.invoke.return_value.content = "Mocked response"
         
-        mock_config1.get_llm.return_value = mock_llm
-        mock_config2.get_llm.return_value = mock_llm
-        mock_config3.get_llm.return_value = mock_llm
+        mock_config.get_llm.return_value = mock_llm
         
         yield
 
@@ -36,6 +36,17 @@ class TestArchitectAgent:
         assert self.agent is not None
         assert self.agent.llm is not None
     
+    def test_shared_agent_uses_the_callers_llm(self):
+        """Test that an agent without credentials works with a per-call llm"""
+        agent = ArchitectAgent(use_cache=False)
+        llm = MagicMock()
+        llm.invoke.return_value.content = '{"tech_stack": "Vue", "files": {"App.vue": "Root"}}'
+        
+        assert agent.llm is None
+        assert agent.plan("Create a todo app", llm=llm)["files"] == {"App.vue": "Root"}
+        with pytest.raises(ValueError):
+            agent.plan("Create a todo app")
+    
     def test_plan_returns_structure(self):
         """Test that plan method returns correct structure"""
         # Mock the LLM response to return valid JSON for planning
@@ -46,6 +57,115 @@ class TestArchitectAgent:
         assert isinstance(result, dict)
         assert "tech_stack" in result
         assert "files" in result
+    
+    def test_aplan_returns_structure(self):
+        """Test that the async plan uses ainvoke and parses the same structure"""
+        self.agent.llm.ainvoke = AsyncMock(
+            return_value=MagicMock(content='```json\n{"tech_stack": "React", "files": {"App.tsx": "Root"}}\n```')
+        )
+        
+        result = asyncio.run(self.agent.aplan("Create a simple calculator"))
+        
+        assert result == {"tech_stack": "React", "files": {"App.tsx": "Root"}}
+    
+    def test_async_cache_io_runs_off_the_event_loop(self):
+        """Test that aplan reads and writes the SQLite-backed plan cache on a worker thread"""
+        import threading
+        
+        self.agent.llm.ainvoke = AsyncMock(return_value=MagicMock(content='{"tech_stack": "React", "files": {"App.tsx": "Root"}}'))
+        cache, threads = self.agent.cache, []
+        self.agent.cache = MagicMock(wraps=cache)
+        self.agent.cache.get.side_effect = lambda *a: threads.append(threading.get_ident()) or cache.get(*a)
+        self.agent.cache.set.side_effect = lambda *a: threads.append(threading.get_ident()) or cache.set(*a)
+        
+        async def plan_twice():
+            await self.agent.aplan("Create a simple calculator")
+            return threading.get_ident(), await self.agent.aplan("Create a simple calculator")
+        
+        loop_thread, second = asyncio.run(plan_twice())
+        
+        assert second["cached"] is True
+        assert len(threads) == 3 and loop_thread not in threads
+    
+    def test_plan_cache_normalizes_prompt(self):
+        """Test that a repeated prompt differing only in case/whitespace is a marked cache hit"""
+        self.agent.llm.invoke.return_value.content = '{"tech_stack": "React", "files": {"App.tsx": "Root"}}'
+        
+        first = self.agent.plan("Create a  simple calculator")
+        second = self.agent.plan("  create a simple\nCALCULATOR ")
+        
+        assert "cached" not in first
+        assert second["cached"] is True
+        assert second["files"] == first["files"]
+        assert self.agent.llm.invoke.call_count == 1
+    
+    def test_fallback_plan_is_not_cached(self):
+        """Test that an unparseable response falls back without poisoning the cache"""
+        self.agent.llm.invoke.return_value.content = "not json"
+        
+        result = self.agent.plan("Create a todo app")
+        
+        assert "index.html" in result["files"]
+        assert self.agent.cache.stats()["persistent"]["entries"] == 0
+    
+    def test_plan_surrounded_by_prose(self):
+        """Test that the plan is found inside fences and explanations"""
+        self.agent.llm.invoke.return_value.content = 'Here you go:\n```json\n{"tech_stack": "Vue", "files": {"App.vue": "Root"}}\n```\nEnjoy!'
+        
+        assert self.agent.plan("Create a todo app")["files"] == {"App.vue": "Root"}
+    
+    def test_astream_plan_dispatches_entries_early(self):
+        """Test that each files entry is dispatched while the plan is still streaming"""
+        content = '```json\n{"tech_stack": "React", "files": {"index.html": "Entry", "App.tsx": "Root {App}"}, "dependencies": {}}\n```'
+        dispatched = []
+        
+        async def astream(messages):
+            for i in range(0, len(content), 5):
+                dispatched.append(("chunk", i))
+                yield MagicMock(content=content[i:i + 5])
+        
+        self.agent.llm.astream = astream
+        plan = asyncio.run(self.agent.astream_plan("Create a site", lambda *entry: dispatched.append(entry)))
+        
+        entries = [event for event in dispatched if event[0] != "chunk"]
+        assert entries == [("index.html", "Entry", "React"), ("App.tsx", "Root {App}", "React")]
+        assert dispatched.index(entries[0]) < len(dispatched) - 5
+        assert plan["files"] == {"index.html": "Entry", "App.tsx": "Root {App}"}
+        
+        # The cached plan is dispatched in full without calling the model
+        self.agent.llm.astream = None
+        replay = []
+        asyncio.run(self.agent.astream_plan("create a site", lambda *entry: replay.append(entry)))
+        assert replay == entries
+    
+    def test_astream_plan_malformed_output_falls_back(self):
+        """Test that truncated output dispatches what it can and returns the default plan"""
+        async def astream(messages):
+            yield MagicMock(content='{"tech_stack": "React", "files": {"App.tsx": "Root", "Nav.tsx": "Na')
+        
+        self.agent.llm.astream = astream
+        dispatched = []
+        plan = asyncio.run(self.agent.astream_plan("Create a site", lambda *entry: dispatched.append(entry)))
+        
+        assert dispatched == [("App.tsx", "Root", "React")]
+        assert plan == self.agent._default_plan()
+
+class TestPlanStreamParser:
+    """Test the incremental plan scanner"""
+    
+    def test_entries_complete_across_chunks(self):
+        """Test that entries come out exactly once, as soon as their value closes"""
+        parser = PlanStreamParser()
+        content = '{"files": {"a.js": "Say \\"hi\\", use {}", "nested": {"x": "y"}, "b.css": "B"}, "tech_stack": "JS"}'
+        entries = [entry for char in content for entry in parser.feed(char)]
+        
+        assert entries == [("a.js", 'Say "hi", use {}'), ("b.css", "B")]
+        assert parser.values == {"tech_stack": "JS"}
+    
+    def test_stops_after_the_plan(self):
+        """Test that text after the closing brace is ignored"""
+        parser = PlanStreamParser()
+        assert parser.feed('{"files": {}}\n{"files": {"x": "y"}}') == []
 
 class TestEngineerAgent:
     """Test the Engineer Agent"""
@@ -72,10 +192,95 @@ class TestEngineerAgent:
         
         assert isinstance(code, str)
         assert len(code) > 0
+    
+    def test_awrite_file_strips_fences(self):
+        """Test that the async write_file cleans markdown fences"""
+        self.agent.llm.ainvoke = AsyncMock(return_value=MagicMock(content="```html\n<html>Hello</html>\n```"))
+        
+        code = asyncio.run(self.agent.awrite_file("index.html", "Main HTML file", "Create a simple webpage", "HTML/CSS"))
+        
+        assert code == "<html>Hello</html>"
+    
+    def test_write_file_cache_hit_skips_llm(self):
+        """Test that an identical file request is served from the cache"""
+        self.agent.llm.invoke.return_value.content = "body { color: red; }"
+        args = ("styles.css", "Global styles", "Create a simple webpage", "HTML/CSS")
+        
+        first = self.agent.write_file(*args)
+        second = asyncio.run(self.agent.awrite_file(*args, on_token=lambda delta: None))
+        
+        assert first == second == "body { color: red; }"
+        assert self.agent.llm.invoke.call_count == 1
+        assert self.agent.cache.stats()["hits"] == 1
+    
+    def test_async_file_cache_io_runs_off_the_event_loop(self):
+        """Test that awrite_file reads and writes the file cache on a worker thread"""
+        import threading
+        
+        self.agent.llm.ainvoke = AsyncMock(return_value=MagicMock(content="body {}"))
+        cache, threads = self.agent.cache, []
+        self.agent.cache = MagicMock(wraps=cache)
+        self.agent.cache.get.side_effect = lambda *a: threads.append(threading.get_ident()) or cache.get(*a)
+        self.agent.cache.set.side_effect = lambda *a: threads.append(threading.get_ident()) or cache.set(*a)
+        
+        async def write():
+            await self.agent.awrite_file("styles.css", "Global styles", "Create a simple webpage", "HTML/CSS")
+            return threading.get_ident()
+        
+        loop_thread = asyncio.run(write())
+        
+        assert len(threads) == 2 and loop_thread not in threads
+        assert cache.stats()["entries"] == 1
+    
+    def test_write_file_cache_opt_out(self):
+        """Test that use_cache=False always calls the LLM"""
+        agent = EngineerAgent(user_api_key="test", user_provider="openai", use_cache=False)
+        agent.llm.invoke.return_value.content = "body {}"
+        
+        agent.write_file("styles.css", "Global styles", "Create a simple webpage", "HTML/CSS")
+        agent.write_file("styles.css", "Global styles", "Create a simple webpage", "HTML/CSS")
+        
+        assert agent.cache is None
+        assert agent.llm.invoke.call_count == 2
+    
+    def test_dependency_context_in_prompt_and_cache_key(self):
+        """Test that dependency summaries reach the prompt and key the cache"""
+        self.agent.llm.invoke.return_value.content = "<html></html>"
+        args = ("index.html", "Main page", "Create a simple webpage", "HTML/CSS")
+        
+        self.agent.write_file(*args)
+        self.agent.write_file(*args, context="style.css:\n  classes: card")
+        
+        messages = self.agent.llm.invoke.call_args.args[0]
+        assert "classes: card" in messages[0].content
+        assert self.agent.llm.invoke.call_count == 2
 
 class TestTestSpriteAgent:
     """Test the TestSprite Agent"""
     
+    def test_generate_file_tests(self):
+        """Test that a per-file fragment prompt includes the file and strips fences"""
+        agent = TestSpriteAgent(user_api_key="test", user_provider="openai")
+        agent.llm.invoke.return_value.content = "```js\ntest('loads', async () => {});\n```"
+        
+        fragment = agent.generate_file_tests("index.html", "<h1>Hi</h1>", "A landing page")
+        
+        assert fragment == "test('loads', async () => {});"
+        assert "<h1>Hi</h1>" in agent.llm.invoke.call_args.args[0][1].content
+    
+    def test_merge_test_fragments(self):
+        """Test that fragments merge into one script with a single import"""
+        merged = merge_test_fragments({
+            "index.html": "import { test, expect } from '@playwright/test';\ntest('a', () => {});",
+            "style.css": "",
+            "app.js": "test('b', () => {});"
+        })
+        
+        assert merged.count("@playwright/test") == 1
+        assert merged.index('test.describe("index.html"') < merged.index('test.describe("app.js"')
+        assert "style.css" not in merged
+        assert merged == merge_test_fragments({"index.html": "test('a', () => {});", "app.js": "test('b', () => {});"})
+    
     def setup_method(self):
         """Setup test fixtures"""
         self.agent = TestSpriteAgent(user_api_key="test", user_provider="openai")
@@ -1,24 +1,30 @@
 """
 Test suite for CodeGenesis backend API
 """
+import time
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from main import app
+from checkpoints import GenerationCheckpoints
 
 client = TestClient(app)
 
-# Mock API config to avoid actual API calls and validation errors
+# Mock API config to avoid actual API calls and validation errors; checkpoints go to tmp_path
 @pytest.fixture(autouse=True)
-def mock_api_config():
-    with patch("main.api_config") as mock_config:
+def mock_api_config(tmp_path):
+    with patch("main.api_config") as mock_config, \
+         patch("orchestrator.generation_checkpoints", GenerationCheckpoints(str(tmp_path / "checkpoints.db"))), \
+         patch("orchestrator._workflow", None):
         # Mock get_llm to return a mock LLM
         mock_llm = MagicMock()
         mock_llm.invoke.return_value.content = "Mocked response"
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content="Mocked response"))
         mock_config.get_llm.return_value = mock_llm
         
         # Mock validate_user_api_key
         mock_config.validate_user_api_key.return_value = True
+        mock_config.avalidate_user_api_key = AsyncMock(return_value=True)
         yield mock_config
 
 class TestHealthEndpoints:
@@ -56,7 +62,7 @@ class TestGenerateEndpoint:
     
     def test_generate_with_auth(self):
         """Test code generation with API key"""
-        with patch("orchestrator.CodeGenesisOrchestrator.generate_app") as mock_generate:
+        with patch("orchestrator.CodeGenesisOrchestrator.agenerate_app") as mock_generate:
             mock_generate.return_value = {
                 "files": {"index.html": "<html></html>"},
                 "tests": "test code",
@@ -77,6 +83,279 @@ class TestGenerateEndpoint:
             assert "files" in data
             assert data["status"] == "Completed"
 
+    def test_identical_concurrent_generations_coalesce(self):
+        """Test that identical in-flight requests share one generation"""
+        import asyncio
+        import httpx
+
+        async def slow_generate(prompt):
+            await asyncio.sleep(0.05)
+            return {"files": {}, "status": "Completed"}
+
+        body = {"prompt": "Create a simple app", "user_api_key": "test-key", "user_provider": "openai"}
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+                return await asyncio.gather(*(http.post("/api/generate", json=body) for _ in range(3)))
+
+        with patch("orchestrator.CodeGenesisOrchestrator.agenerate_app", AsyncMock(side_effect=slow_generate)) as mock_generate:
+            responses = asyncio.run(run())
+
+        assert [r.json()["status"] for r in responses] == ["Completed"] * 3
+        assert mock_generate.await_count == 1
+        assert client.get("/api/stats").json()["single_flight"]["generate"]["coalesced"] >= 2
+
+class TestBatchEndpoint:
+    """Test batch generation streamed as NDJSON"""
+    
+    def test_batch_streams_projects_then_summary(self):
+        """Test one line per prompt and a final summary"""
+        import json
+        
+        async def fake_generate(self, prompt):
+            if prompt == "broken":
+                raise RuntimeError("provider down")
+            return {"files": {"index.html": prompt}, "errors": {}, "status": "Completed"}
+        
+        with patch("orchestrator.CodeGenesisOrchestrator.agenerate_app", fake_generate):
+            response = client.post(
+                "/api/generate/batch",
+                json={
+                    "prompts": ["todo app", "broken", "blog"],
+                    "user_api_key": "test-key",
+                    "user_provider": "openai"
+                }
+            )
+        
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        projects = {line["index"]: line for line in lines[:-1]}
+        assert projects[0]["result"]["files"] == {"index.html": "todo app"}
+        assert projects[1]["status"] == "failed"
+        assert lines[-1]["event"] == "summary"
+        assert lines[-1]["completed"] == 2 and lines[-1]["failed"] == 1
+    
+    def test_batch_validation(self):
+        """Test missing credentials and empty batches"""
+        response = client.post("/api/generate/batch", json={"prompts": ["app"]})
+        assert response.json()["error"] == "API_KEY_REQUIRED"
+        
+        response = client.post(
+            "/api/generate/batch",
+            json={"prompts": [], "user_api_key": "test-key", "user_provider": "openai"}
+        )
+        assert response.json()["error"] == "INVALID_BATCH"
+
+class TestResumeEndpoint:
+    """Test resuming checkpointed generations"""
+    
+    def test_resume_unknown_generation(self):
+        """Test that a project without checkpoints cannot be resumed"""
+        response = client.post(
+            "/api/generate/missing-project/resume",
+            json={"user_api_key": "test-key", "user_provider": "openai"}
+        )
+        assert response.json()["error"] == "CHECKPOINT_NOT_FOUND"
+    
+    def test_failed_generation_returns_its_project_id(self):
+        """Test that a failed run reports the ID to resume it with"""
+        from orchestrator import GenerationFailed
+        
+        with patch(
+            "orchestrator.CodeGenesisOrchestrator.agenerate_app",
+            AsyncMock(side_effect=GenerationFailed("abc123", RuntimeError("provider down")))
+        ):
+            response = client.post(
+                "/api/generate",
+                json={"prompt": "Create a failing app", "user_api_key": "test-key", "user_provider": "openai"}
+            )
+        
+        data = response.json()
+        assert data["error"] == "GENERATION_FAILED"
+        assert data["project_id"] == "abc123"
+        
+        with patch("orchestrator.CodeGenesisOrchestrator.aresume_app", AsyncMock(return_value={"files": {}, "status": "Tests generated"})):
+            response = client.post(
+                "/api/generate/abc123/resume",
+                json={"user_api_key": "test-key", "user_provider": "openai"}
+            )
+        assert response.json()["status"] == "Tests generated"
+
+    def test_concurrent_resumes_share_one_run(self):
+        """Test that resuming a project twice at once continues it only once"""
+        import asyncio
+        import httpx
+
+        async def slow_resume(self):
+            await asyncio.sleep(0.05)
+            return {"files": {}, "status": "Tests generated"}
+
+        body = {"user_api_key": "test-key", "user_provider": "openai"}
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+                return await asyncio.gather(*(http.post("/api/generate/abc123/resume", json=body) for _ in range(3)))
+
+        with patch("orchestrator.CodeGenesisOrchestrator.aresume_app", autospec=True, side_effect=slow_resume) as mock_resume:
+            responses = asyncio.run(run())
+
+        assert [r.json()["status"] for r in responses] == ["Tests generated"] * 3
+        assert mock_resume.await_count == 1
+
+class TestArchiveEndpoint:
+    """Test streaming project export"""
+    
+    def test_archive_streams_project_files(self):
+        """Test that a registered project downloads as a zip"""
+        import io
+        import zipfile
+        from vfs import VirtualFileSystem, projects
+        
+        vfs = VirtualFileSystem()
+        vfs.write_file("index.html", "<html></html>")
+        vfs.write_file("tests/app.test.js", "test code")
+        projects.register("archive-test", vfs)
+        
+        response = client.get("/api/projects/archive-test/archive")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        assert 'filename="archive-test.zip"' in response.headers["content-disposition"]
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert archive.namelist() == ["index.html", "tests/app.test.js"]
+    
+    def test_archive_unknown_project(self):
+        """Test exporting a project that does not exist"""
+        response = client.get("/api/projects/missing/archive?format=tar.gz")
+        assert response.json()["error"] == "PROJECT_NOT_FOUND"
+
+class TestRegenerateEndpoint:
+    """Test incremental regeneration endpoint"""
+    
+    def test_regenerate_passes_previous_output(self):
+        """Test that the previous plan and files reach the orchestrator"""
+        with patch("orchestrator.CodeGenesisOrchestrator.aregenerate_app") as mock_regenerate:
+            mock_regenerate.return_value = {"files": {}, "regenerated": [], "status": "Regeneration complete"}
+            
+            response = client.post(
+                "/api/regenerate",
+                json={
+                    "prompt": "Create a simple app",
+                    "user_api_key": "test-key",
+                    "user_provider": "openai",
+                    "previous_plan": {"files": {"index.html": "Main"}},
+                    "previous_files": {"index.html": "<html></html>"}
+                }
+            )
+        
+        assert response.json()["status"] == "Regeneration complete"
+        mock_regenerate.assert_awaited_once_with(
+            "Create a simple app",
+            {"files": {"index.html": "Main"}},
+            {"index.html": "<html></html>"},
+            "",
+            None
+        )
+
+    def test_regenerate_only_offers_options_it_honours(self):
+        """Test that generate-only options are not part of the regenerate request"""
+        from main import RegenerateRequest
+        
+        assert {"background", "pipeline_tests", "stream_plan"}.isdisjoint(RegenerateRequest.model_fields)
+        assert {"use_cache", "hedge"} <= set(RegenerateRequest.model_fields)
+
+class TestBackgroundJobs:
+    """Test background generation through the job queue"""
+    
+    def test_background_generate_returns_job_id(self, tmp_path):
+        """Test that background=true queues a job that can be polled to completion"""
+        from jobs import JobQueue, JobStore
+        
+        async def runner(request, user_api_key):
+            assert "user_api_key" not in request
+            return {"files": {"index.html": "<html></html>"}, "status": "Tests generated"}
+        
+        queue = JobQueue(JobStore(str(tmp_path / "jobs.db")), runner, concurrency=1)
+        with patch("main.job_queue", queue), patch("main.job_store", queue.store), TestClient(app) as local_client:
+            response = local_client.post(
+                "/api/generate",
+                json={
+                    "prompt": "Create a simple app",
+                    "user_api_key": "test-key",
+                    "user_provider": "openai",
+                    "background": True
+                }
+            )
+            data = response.json()
+            assert data["status"] == "queued"
+            assert data["project_id"]
+            
+            for _ in range(100):
+                job = local_client.get(f"/api/jobs/{data['job_id']}").json()
+                if job["status"] == "completed":
+                    break
+                time.sleep(0.01)
+            
+            assert job["status"] == "completed"
+            assert job["result"]["files"] == {"index.html": "<html></html>"}
+            assert job["project_id"] == data["project_id"]
+    
+    def test_unknown_job(self):
+        """Test polling a job that does not exist"""
+        response = client.get("/api/jobs/does-not-exist")
+        assert response.json()["error"] == "JOB_NOT_FOUND"
+
+class TestGenerateStreamEndpoint:
+    """Test the SSE generation endpoint"""
+    
+    def test_stream_requires_auth(self):
+        """Test that a missing API key is reported as an SSE error event"""
+        response = client.post("/api/generate/stream", json={"prompt": "Create a simple app"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.text.startswith("event: error\n")
+        assert "API_KEY_REQUIRED" in response.text
+    
+    def test_stream_emits_events(self):
+        """Test that orchestrator events are forwarded as SSE messages"""
+        async def fake_stream(self, prompt):
+            yield {"event": "status", "status": "Starting"}
+            yield {"event": "file_delta", "filename": "index.html", "delta": "<html>"}
+            yield {"event": "done", "result": {"files": {"index.html": "<html>"}}}
+        
+        with patch("orchestrator.CodeGenesisOrchestrator.astream_app", fake_stream):
+            response = client.post(
+                "/api/generate/stream",
+                json={
+                    "prompt": "Create a simple app",
+                    "user_api_key": "test-key",
+                    "user_provider": "openai"
+                }
+            )
+        
+        assert response.status_code == 200
+        messages = response.text.strip().split("\n\n")
+        assert messages[0] == 'event: status\ndata: {"status": "Starting"}'
+        assert messages[1] == 'event: file_delta\ndata: {"filename": "index.html", "delta": "<html>"}'
+        assert messages[2].startswith("event: done\n")
+
+class TestValidateKeyEndpoint:
+    """Test API key validation endpoint"""
+    
+    def test_validate_key(self, mock_api_config):
+        """Test that validation is awaited with the request's credentials"""
+        response = client.post(
+            "/api/validate-key",
+            json={
+                "prompt": "test",
+                "user_api_key": "test-key",
+                "user_provider": "openrouter"
+            }
+        )
+        assert response.status_code == 200
+        assert response.json()["valid"] is True
+        mock_api_config.avalidate_user_api_key.assert_awaited_once_with("test-key", "openrouter", None)
+
 class TestChatEndpoint:
     """Test chatbot endpoint"""
     
@@ -89,6 +368,24 @@ class TestChatEndpoint:
         assert response.status_code == 200
         data = response.json()
         assert "response" in data
+    
+    def test_chat_is_retried_and_tracked(self, mock_api_config):
+        """Test that chat goes through the platform limiter and reaches /metrics"""
+        import httpx
+        from rate_limit import RateLimiterRegistry
+        
+        llm = MagicMock()
+        llm.metadata = {"provider": "platform", "rate_limit_key": "platform:test"}
+        llm.ainvoke = AsyncMock(side_effect=[httpx.ConnectError("reset"), MagicMock(content="Hi", usage_metadata=None)])
+        mock_api_config.get_llm.return_value = llm
+        registry = RateLimiterRegistry()
+        
+        with patch("main.rate_limits", registry), patch("rate_limit.BASE_BACKOFF", 0):
+            response = client.post("/api/chat", json={"message": "Hello"})
+        
+        assert response.json() == {"response": "Hi"}
+        assert registry.stats()["platform:test"]["retries"] == 1
+        assert 'agent="chat"' in client.get("/metrics").text
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,253 @@
+"""
+Tests for API configuration and pooled LLM clients
+"""
+import pytest
+import asyncio
+import httpx
+from unittest.mock import patch, MagicMock, AsyncMock
+from api_config import APIConfigManager
+from llm_pool import LLMClientPool, hash_api_key
+
+class TestLLMClientPool:
+    """Test the LRU client registry"""
+
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.pool = LLMClientPool(max_size=2, idle_ttl=60)
+        self.factory = MagicMock(side_effect=lambda http_client, http_async_client: object())
+
+    def test_reuses_client_for_same_key(self):
+        """Test that a warm request gets the pooled client back"""
+        first = self.pool.get("openai", "sk-1", None, 0.3, self.factory)
+        second = self.pool.get("openai", "sk-1", None, 0.3, self.factory)
+
+        assert first is second
+        assert self.factory.call_count == 1
+        assert self.pool.stats()["hits"] == 1
+
+    def test_temperature_and_key_are_part_of_the_key(self):
+        """Test that different settings get different clients"""
+        a = self.pool.get("openai", "sk-1", None, 0.3, self.factory)
+        b = self.pool.get("openai", "sk-1", None, 0.7, self.factory)
+        c = self.pool.get("openai", "sk-2", None, 0.3, self.factory)
+
+        assert a is not b
+        assert a is not c
+
+    def test_clients_share_http_pool_per_host(self):
+        """Test that clients for one host share the same httpx clients"""
+        self.pool.get("openai", "sk-1", None, 0.3, self.factory)
+        self.pool.get("openai", "sk-2", None, 0.3, self.factory)
+
+        (http_1, async_1), (http_2, async_2) = [call.args for call in self.factory.call_args_list]
+        assert http_1 is http_2
+        assert async_1 is async_2
+        assert self.pool.stats()["hosts"]["api.openai.com"]["clients"] == 2
+
+    def test_lru_eviction(self):
+        """Test that the least recently used client is evicted over max_size"""
+        a = self.pool.get("openai", "sk-1", None, 0.1, self.factory)
+        self.pool.get("openai", "sk-1", None, 0.2, self.factory)
+        self.pool.get("openai", "sk-1", None, 0.1, self.factory)  # touch a
+        self.pool.get("a4f", "sk-1", "https://api.a4f.co/v1", 0.1, self.factory)
+
+        stats = self.pool.stats()
+        assert stats["size"] == 2
+        assert stats["evictions"] == 1
+        assert self.pool.get("openai", "sk-1", None, 0.1, self.factory) is a
+
+    def test_idle_eviction_releases_host(self):
+        """Test that idle clients and their host pools are dropped"""
+        with patch("llm_pool.time.monotonic", return_value=0):
+            self.pool.get("a4f", "sk-1", "https://api.a4f.co/v1", 0.1, self.factory)
+        with patch("llm_pool.time.monotonic", return_value=120):
+            self.pool.get("openai", "sk-1", None, 0.1, self.factory)
+
+        stats = self.pool.stats()
+        assert stats["size"] == 1
+        assert "api.a4f.co" not in stats["hosts"]
+
+    def test_evicted_client_keeps_working(self):
+        """Test that eviction does not close the HTTP client an in-flight LLM still uses"""
+        pool = LLMClientPool(max_size=1, idle_ttl=60)
+        factory = MagicMock(side_effect=lambda http_client, http_async_client: http_client)
+        held = pool.get("a4f", "sk-1", "https://api.a4f.co/v1", 0.1, factory)
+        pool.get("openai", "sk-1", None, 0.1, factory)
+
+        assert "api.a4f.co" not in pool.stats()["hosts"]
+        assert not held.is_closed
+
+        pool.clear()
+        assert pool.stats()["hosts"] == {}
+
+    def test_stats_never_contain_keys(self):
+        """Test that raw API keys do not leak into metrics"""
+        self.pool.get("openai", "sk-secret", None, 0.3, self.factory)
+        assert "sk-secret" not in str(self.pool.stats())
+        assert hash_api_key("sk-secret") != "sk-secret"
+
+class TestAPIConfigManager:
+    """Test LLM construction through the pool"""
+
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.manager = APIConfigManager()
+
+    def test_user_llm_is_pooled(self):
+        """Test that repeated get_llm calls reuse one ChatOpenAI"""
+        llm_1 = self.manager.get_llm("user_project", "sk-test", "openrouter", temperature=0.3)
+        llm_2 = self.manager.get_llm("user_project", "sk-test", "openrouter", temperature=0.3)
+
+        assert llm_1 is llm_2
+        assert llm_1.model_name == "anthropic/claude-3.5-sonnet"
+        assert llm_1.openai_api_base == "https://openrouter.ai/api/v1"
+
+    def test_custom_base_url(self):
+        """Test that a custom base URL overrides the provider defaults"""
+        llm = self.manager.get_llm("user_project", "sk-test", "custom", "http://localhost:9000/v1")
+
+        assert llm.model_name == "default"
+        assert llm.openai_api_base == "http://localhost:9000/v1"
+
+    def test_platform_llm(self):
+        """Test that the platform context builds the A4F client"""
+        self.manager.platform_api_key = "sk-platform"
+        llm = self.manager.get_llm("platform", temperature=0.7)
+
+        assert llm.openai_api_base == self.manager.platform_base_url
+        assert llm is self.manager.get_llm("platform", temperature=0.7)
+
+    def test_secondary_hedge_provider(self, monkeypatch):
+        """Test that a configured secondary provider gets hedges at the caller's temperature"""
+        from hedging import HedgePolicy
+
+        monkeypatch.setenv("HEDGE_SECONDARY_PROVIDER", "openrouter")
+        monkeypatch.setenv("HEDGE_SECONDARY_API_KEY", "sk-secondary")
+        with patch("api_config.hedging", HedgePolicy()):
+            manager = APIConfigManager()
+        llm = manager.get_llm("user_project", "sk-test", "openai", temperature=0.3)
+
+        secondary = manager.hedging.secondary(llm)
+        assert secondary.openai_api_base == "https://openrouter.ai/api/v1"
+        assert secondary.temperature == 0.3
+        assert self.manager.hedging.secondary is None
+
+    def test_unsupported_provider(self):
+        """Test that unknown providers are rejected"""
+        with pytest.raises(ValueError):
+            self.manager.get_llm("user_project", "sk-test", "nope")
+
+class TestKeyValidation:
+    """Test cached, probe-first API key validation"""
+
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.manager = APIConfigManager()
+        self.requests = []
+
+    def use_probe(self, status_code):
+        """Route probe requests to a mock transport returning status_code."""
+        def handler(request):
+            self.requests.append(request)
+            return httpx.Response(status_code, json={"data": []})
+
+        self.manager._probe_client = httpx.Client(transport=httpx.MockTransport(handler))
+        self.manager._aprobe_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def test_probe_success_skips_completion(self):
+        """Test that a 200 from the models list validates without a completion"""
+        self.use_probe(200)
+        with patch.object(self.manager, "_get_user_llm") as get_llm:
+            assert self.manager.validate_user_api_key("sk-good", "openai") is True
+            get_llm.assert_not_called()
+
+        assert str(self.requests[0].url) == "https://api.openai.com/v1/models"
+        assert self.requests[0].headers["Authorization"] == "Bearer sk-good"
+
+    def test_results_are_cached(self):
+        """Test that repeated checks within the TTL do not hit the provider"""
+        self.use_probe(200)
+        self.manager.validate_user_api_key("sk-good", "openrouter")
+        assert asyncio.run(self.manager.avalidate_user_api_key("sk-good", "openrouter")) is True
+
+        assert len(self.requests) == 1
+        assert self.manager.validation_cache.stats()["hits"] == 1
+
+    def test_rejected_key_is_negatively_cached(self):
+        """Test that a 401 is cached as invalid"""
+        self.use_probe(401)
+        assert self.manager.validate_user_api_key("sk-bad", "a4f") is False
+        assert self.manager.validate_user_api_key("sk-bad", "a4f") is False
+
+        assert len(self.requests) == 1
+
+    def test_inconclusive_probe_falls_back_to_completion(self):
+        """Test that an unsupported models endpoint falls back to a test call"""
+        self.use_probe(404)
+        llm = MagicMock()
+        llm.ainvoke = AsyncMock()
+        with patch.object(self.manager, "_get_user_llm", return_value=llm):
+            assert asyncio.run(self.manager.avalidate_user_api_key("sk-good", "custom", "http://localhost:9000/v1")) is True
+
+        llm.ainvoke.assert_awaited_once()
+        assert str(self.requests[0].url) == "http://localhost:9000/v1/models"
+
+    def test_public_models_list_is_not_trusted(self):
+        """Test that OpenRouter is probed on its key endpoint and custom servers fall back on a 200"""
+        self.use_probe(200)
+        self.manager.validate_user_api_key("sk-any", "openrouter")
+        assert str(self.requests[0].url) == "https://openrouter.ai/api/v1/key"
+
+        llm = MagicMock()
+        llm.ainvoke = AsyncMock(side_effect=ConnectionError("no such model"))
+        with patch.object(self.manager, "_get_user_llm", return_value=llm):
+            assert asyncio.run(self.manager.avalidate_user_api_key("sk-any", "custom", "http://localhost:9000/v1")) is False
+
+        llm.ainvoke.assert_awaited_once()
+
+    def test_fallback_completion_is_retried(self):
+        """Test that a transient error on the test completion is retried by the limiter, not taken for a bad key"""
+        from rate_limit import RateLimiterRegistry
+
+        self.use_probe(404)
+        self.manager.rate_limits = RateLimiterRegistry()
+        llm = MagicMock()
+        llm.metadata = {"rate_limit_key": "custom:test"}
+        llm.ainvoke = AsyncMock(side_effect=[httpx.ConnectError("reset"), MagicMock()])
+        with patch.object(self.manager, "_get_user_llm", return_value=llm), patch("rate_limit.BASE_BACKOFF", 0):
+            assert asyncio.run(self.manager.avalidate_user_api_key("sk-good", "custom", "http://localhost:9000/v1")) is True
+
+        assert llm.ainvoke.await_count == 2
+        assert self.manager.rate_limits.stats()["custom:test"]["retries"] == 1
+
+    def test_provider_specific_probe_auth(self):
+        """Test that providers with native auth headers get them on the probe"""
+        self.use_probe(200)
+        self.manager.validate_user_api_key("sk-ant", "anthropic")
+
+        headers = self.requests[0].headers
+        assert headers["x-api-key"] == "sk-ant"
+        assert "Authorization" not in headers
+
+    def test_transient_failure_is_not_cached(self):
+        """Test that a network error is reported invalid but retried next time"""
+        self.use_probe(500)
+        llm = MagicMock()
+        llm.invoke.side_effect = ConnectionError("network down")
+        with patch.object(self.manager, "_get_user_llm", return_value=llm):
+            assert self.manager.validate_user_api_key("sk-good", "openai") is False
+            assert self.manager.validate_user_api_key("sk-good", "openai") is False
+
+        assert llm.invoke.call_count == 2
+
+    def test_keys_are_not_stored_in_plaintext(self):
+        """Test that the cache key is a salted hash, not the raw key"""
+        self.use_probe(200)
+        self.manager.validate_user_api_key("sk-plaintext", "openai")
+
+        keys = list(self.manager.validation_cache._entries.keys())
+        assert keys and all("sk-plaintext" not in key for key in keys)
+        assert keys[0] != APIConfigManager()._validation_cache_key("sk-plaintext", "openai", None)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,61 @@
+"""
+Tests for streaming project archives
+"""
+import io
+import tarfile
+import zipfile
+import pytest
+from archive import CHUNK_SIZE, stream_archive, stream_tar_gz, stream_zip
+
+FILES = {
+    "index.html": "<html><body>Héllo</body></html>",
+    "src/app.js": "console.log('hi');\n" * 10,
+    "tests/app.test.js": "test('loads', () => {});"
+}
+
+class TestStreamingArchives:
+    """Test zip and tar.gz generators"""
+
+    def test_zip_roundtrip(self):
+        """Test that the streamed zip contains every file intact"""
+        data = b"".join(stream_zip(FILES))
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.namelist() == list(FILES)
+            assert archive.read("index.html").decode("utf-8") == FILES["index.html"]
+            assert archive.testzip() is None
+
+    def test_tar_gz_roundtrip(self):
+        """Test that the streamed tar.gz contains every file intact"""
+        data = b"".join(stream_tar_gz(FILES))
+
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+            assert archive.getnames() == list(FILES)
+            assert archive.extractfile("src/app.js").read().decode("utf-8") == FILES["src/app.js"]
+
+    @pytest.mark.parametrize("archive_format", ["zip", "tar.gz"])
+    def test_large_files_are_streamed_in_chunks(self, archive_format):
+        """Test that output is produced while a large file is still being written"""
+        big = {"bundle.js": b"x" * (CHUNK_SIZE * 4), "small.txt": b"ok"}
+        chunks = list(stream_archive(big, archive_format, compression_level=0))
+
+        assert len(chunks) > 4
+        assert max(len(chunk) for chunk in chunks) < CHUNK_SIZE * 2
+
+    def test_compression_level(self):
+        """Test that level 0 stores and a higher level compresses"""
+        content = {"a.txt": "a" * 10000}
+        stored = b"".join(stream_zip(content, compression_level=0))
+        compressed = b"".join(stream_zip(content, compression_level=9))
+
+        assert len(compressed) < len(stored)
+
+    def test_invalid_options(self):
+        """Test that unsupported formats and levels are rejected"""
+        with pytest.raises(ValueError):
+            stream_archive(FILES, "rar")
+        with pytest.raises(ValueError):
+            stream_archive(FILES, "zip", compression_level=12)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
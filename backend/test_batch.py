@@ -0,0 +1,147 @@
+"""
+Tests for batch generation through the shared executor
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from batch import BatchExecutor, percentile, run_batch, summarize_batch
+from metrics import track_llm_call
+
+
+def collect(prompts, generate, **options) -> list:
+    async def run():
+        return [event async for event in run_batch(prompts, generate, **options)]
+    return asyncio.run(run())
+
+class TestRunBatch:
+    """Test per-project events and the batch summary"""
+
+    def test_projects_stream_in_completion_order(self):
+        """Test that fast projects are reported before slow ones, then the summary"""
+        delays = {"slow": 0.05, "fast": 0.0}
+
+        async def generate(prompt):
+            await asyncio.sleep(delays[prompt])
+            return {"files": {"index.html": prompt}, "errors": {}, "status": "Tests generated"}
+
+        events = collect(["slow", "fast"], generate, executor=BatchExecutor(4))
+
+        assert [(event["event"], event.get("index")) for event in events] == [
+            ("project", 1), ("project", 0), ("summary", None)
+        ]
+        assert events[0]["result"]["files"] == {"index.html": "fast"}
+        assert events[-1]["completed"] == 2 and events[-1]["failed"] == 0
+
+    def test_failures_and_tokens_are_summarized(self):
+        """Test error results, exceptions and per-project token usage"""
+        llm = MagicMock(metadata={"provider": "openai"})
+
+        async def generate(prompt):
+            if prompt == "bad key":
+                return {"error": "INVALID_API_CONFIG", "message": "rejected", "status": "error"}
+            if prompt == "crash":
+                raise RuntimeError("provider down")
+            for _ in range(2):
+                with track_llm_call(llm, "engineer") as usage:
+                    usage.append({"input_tokens": 100, "output_tokens": 50})
+            return {"files": {}, "errors": {"app.js": "timeout"}, "status": "Tests generated"}
+
+        events = collect(["ok", "bad key", "crash"], generate, executor=BatchExecutor(4))
+        projects = {event["index"]: event for event in events if event["event"] == "project"}
+        summary = events[-1]
+
+        assert projects[0]["llm_calls"] == 2
+        assert projects[0]["tokens"] == {"prompt": 200, "completion": 100}
+        assert projects[1]["error"] == "INVALID_API_CONFIG" and "result" not in projects[1]
+        assert projects[2]["error"] == "GENERATION_FAILED"
+        assert summary["failures"] == {"INVALID_API_CONFIG": 1, "GENERATION_FAILED": 1}
+        assert summary["file_errors"] == 1
+        assert summary["tokens"] == {"prompt": 200, "completion": 100, "total": 300}
+
+    def test_shared_executor_caps_concurrency(self):
+        """Test that two batches share the executor's slots"""
+        executor = BatchExecutor(2)
+        running, peak = [0], [0]
+
+        async def generate(prompt):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+            return {"files": {}}
+
+        async def run():
+            async def drain(prompts):
+                return [event async for event in run_batch(prompts, generate, executor=executor)]
+            return await asyncio.gather(drain(["a", "b", "c"]), drain(["d", "e", "f"]))
+
+        first, second = asyncio.run(run())
+        assert first[-1]["completed"] == second[-1]["completed"] == 3
+        assert peak[0] == 2
+        assert executor.stats() == {"concurrency": 2, "queued": 0, "running": 0}
+
+    def test_batch_cap_below_executor(self):
+        """Test the per-batch max_concurrency"""
+        running, peak = [0], [0]
+
+        async def generate(prompt):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+            return {"files": {}}
+
+        collect(list("abcdef"), generate, executor=BatchExecutor(8), max_concurrency=1)
+        assert peak[0] == 1
+
+    def test_prompts_are_started_as_slots_free(self):
+        """Test that a large batch does not create a task per prompt up front"""
+        tasks = []
+
+        async def generate(prompt):
+            tasks.append(len(asyncio.all_tasks()))
+            await asyncio.sleep(0)
+            return {"files": {}}
+
+        events = collect([str(i) for i in range(50)], generate, executor=BatchExecutor(3))
+
+        assert events[-1]["completed"] == 50
+        # The three generations in flight plus the task driving the batch
+        assert max(tasks) <= 4
+
+    def test_leaving_early_cancels_the_rest(self):
+        """Test that a disconnected client does not keep generations running"""
+        cancelled = []
+
+        async def generate(prompt):
+            try:
+                await asyncio.sleep(0 if prompt == "fast" else 1)
+            except asyncio.CancelledError:
+                cancelled.append(prompt)
+                raise
+            return {"files": {}}
+
+        async def run():
+            events = run_batch(["fast", "slow"], generate, executor=BatchExecutor(4))
+            first = await events.__anext__()
+            await events.aclose()
+            await asyncio.sleep(0)
+            return first
+
+        assert asyncio.run(run())["index"] == 0
+        assert cancelled == ["slow"]
+
+class TestSummary:
+    """Test the summary helpers"""
+
+    def test_percentile_interpolates(self):
+        """Test linear interpolation and empty input"""
+        assert percentile([1, 2, 3, 4], 50) == 2.5
+        assert percentile([], 95) is None
+
+    def test_empty_batch(self):
+        """Test a summary with no projects"""
+        summary = summarize_batch([], 0.0)
+        assert summary["projects"] == 0
+        assert summary["latency"]["p95"] is None
+        assert summary["throughput"] is None
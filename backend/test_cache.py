@@ -0,0 +1,127 @@
+"""
+Tests for CodeGenesis caches
+"""
+import os
+import time
+import pytest
+from unittest.mock import patch
+from cache import DiskCache, MemoryCache, SQLiteCache, TieredCache, make_cache_key, normalize_prompt
+
+class TestDiskCache:
+    """Test the size-bounded on-disk cache"""
+
+    def test_roundtrip_and_counters(self, tmp_path):
+        """Test set/get and hit/miss counters"""
+        cache = DiskCache(str(tmp_path))
+        key = make_cache_key("index.html", "Main HTML file")
+
+        assert cache.get(key) is None
+        cache.set(key, "<html></html>")
+
+        assert cache.get(key) == "<html></html>"
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+        assert stats["hit_ratio"] == 0.5
+
+    def test_key_depends_on_every_part(self):
+        """Test that changing any input changes the key"""
+        base = make_cache_key("a.js", "desc", "prompt", "React", "gpt-4o-mini", 0.3)
+        assert base == make_cache_key("a.js", "desc", "prompt", "React", "gpt-4o-mini", 0.3)
+        assert base != make_cache_key("a.js", "desc", "prompt", "React", "gpt-4o-mini", 0.7)
+
+    def test_ttl_expiry(self, tmp_path):
+        """Test that expired entries are treated as misses and removed"""
+        cache = DiskCache(str(tmp_path))
+        with patch("cache.time.time", return_value=1000):
+            cache.set("k" * 64, "value", ttl=10)
+        with patch("cache.time.time", return_value=1011):
+            assert cache.get("k" * 64) is None
+        assert cache.stats()["entries"] == 0
+
+    def test_lru_eviction_by_size(self, tmp_path):
+        """Test that least recently used entries are evicted over max_bytes"""
+        cache = DiskCache(str(tmp_path), max_bytes=250)
+        cache.set("a" * 64, "x" * 60)
+        cache.set("b" * 64, "x" * 60)
+        cache.get("a" * 64)
+        cache.set("c" * 64, "x" * 60)
+
+        assert cache.get("b" * 64) is None
+        assert cache.get("a" * 64) == "x" * 60
+        assert cache.stats()["evictions"] == 1
+
+    def test_index_survives_restart(self, tmp_path):
+        """Test that a new instance picks up entries already on disk"""
+        DiskCache(str(tmp_path)).set("d" * 64, "persisted")
+        cache = DiskCache(str(tmp_path))
+
+        assert cache.get("d" * 64) == "persisted"
+        assert cache.stats()["size_bytes"] == os.path.getsize(tmp_path / "dd" / f"{'d' * 64}.json")
+
+class TestPlanCacheTiers:
+    """Test the memory and SQLite tiers used for plans"""
+
+    def test_normalize_prompt(self):
+        """Test whitespace and case folding"""
+        assert normalize_prompt("  Build a\tTODO   app\n") == "build a todo app"
+
+    def test_memory_cache_lru(self):
+        """Test that the memory tier is bounded"""
+        cache = MemoryCache(max_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+
+    def test_sqlite_cache_shared_between_instances(self, tmp_path):
+        """Test that a second connection (another worker or a restart) sees entries"""
+        path = str(tmp_path / "plans.db")
+        SQLiteCache(path).set("key", '{"files": {}}')
+
+        assert SQLiteCache(path).get("key") == '{"files": {}}'
+
+    def test_sqlite_cache_ttl_and_bound(self, tmp_path):
+        """Test TTL expiry and max_entries eviction"""
+        cache = SQLiteCache(str(tmp_path / "plans.db"), max_entries=2)
+        with patch("cache.time.time", return_value=1000):
+            cache.set("old", "1", ttl=5)
+        with patch("cache.time.time", return_value=1010):
+            assert cache.get("old") is None
+            cache.set("a", "1")
+            cache.set("b", "2")
+            cache.set("c", "3")
+
+        assert cache.stats()["entries"] == 2
+
+    def test_tiered_cache_promotes_persistent_hits(self, tmp_path):
+        """Test that a persistent-tier hit is promoted into memory"""
+        persistent = SQLiteCache(str(tmp_path / "plans.db"))
+        persistent.set("key", "plan")
+        cache = TieredCache(MemoryCache(), persistent)
+
+        assert cache.get("key") == "plan"
+        assert cache.get("key") == "plan"
+        stats = cache.stats()
+        assert stats["memory"]["hits"] == 1
+        assert stats["persistent"]["hits"] == 1
+        assert stats["hit_ratio"] == 1.0
+
+    def test_promoted_entry_keeps_remaining_ttl(self, tmp_path):
+        """Test that promotion neither extends nor shortens the persistent entry's lifetime"""
+        persistent = SQLiteCache(str(tmp_path / "plans.db"))
+        persistent.set("short", "plan", ttl=60)
+        persistent.set("long", "plan", ttl=7200)
+        memory = MemoryCache(default_ttl=3600)
+        cache = TieredCache(memory, persistent)
+        cache.get("short")
+        cache.get("long")
+
+        now = time.time()
+        assert memory._entries["short"][0] - now == pytest.approx(60, abs=1)
+        assert memory._entries["long"][0] - now == pytest.approx(7200, abs=1)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,72 @@
+"""
+Tests for the generation checkpoint store
+"""
+import asyncio
+import time
+from unittest.mock import patch
+from checkpoints import GenerationCheckpoints
+
+PLAN_FILES = {"index.html": "Main page", "app.js": "Logic"}
+
+
+class TestFileLedger:
+    """Test per-file checkpoints used by a resumed engineer node"""
+
+    def test_only_unchanged_entries_are_reused(self, tmp_path):
+        """Test that a changed description or tech stack invalidates a saved file"""
+        store = GenerationCheckpoints(str(tmp_path / "checkpoints.db"))
+        store.save_file("p1", "index.html", "Main page", "HTML/CSS/JS", "<html></html>")
+        store.save_file("p1", "app.js", "Old logic", "HTML/CSS/JS", "// old")
+        store.save_fragment("p1", "index.html", "test('page')")
+
+        files, fragments = store.completed_files("p1", PLAN_FILES, "HTML/CSS/JS")
+        assert files == {"index.html": "<html></html>"}
+        assert fragments == {"index.html": "test('page')"}
+        assert store.completed_files("p1", PLAN_FILES, "React") == ({}, {})
+        assert store.completed_files("p2", PLAN_FILES, "HTML/CSS/JS") == ({}, {})
+
+    def test_survives_restart(self, tmp_path):
+        """Test that a new process sees files saved by the last one"""
+        path = str(tmp_path / "checkpoints.db")
+        GenerationCheckpoints(path).save_file("p1", "app.js", "Logic", "JS", "// app")
+        assert GenerationCheckpoints(path).completed_files("p1", PLAN_FILES, "JS")[0] == {"app.js": "// app"}
+
+    def test_delete_and_prune(self, tmp_path):
+        """Test that finished and stale generations are dropped"""
+        store = GenerationCheckpoints(str(tmp_path / "checkpoints.db"))
+        for project_id in ("done", "stale", "active"):
+            store.save_file(project_id, "app.js", "Logic", "JS", "// app")
+        with patch("checkpoints.time.time", return_value=time.time() - 3600):
+            store.touch("stale")
+        store.touch("active")
+
+        store.delete("done")
+        assert store.prune(max_age=60) == 1
+
+        assert store.completed_files("done", PLAN_FILES, "JS")[0] == {}
+        assert store.completed_files("stale", PLAN_FILES, "JS")[0] == {}
+        assert store.completed_files("active", PLAN_FILES, "JS")[0] == {"app.js": "// app"}
+
+class TestSaver:
+    """Test the LangGraph checkpointer from sync and async code"""
+
+    def test_async_methods_use_the_sqlite_store(self, tmp_path):
+        """Test that an async graph run checkpoints and can be read back"""
+        from typing import TypedDict
+        from langgraph.graph import StateGraph, END
+
+        class State(TypedDict):
+            count: int
+
+        graph = StateGraph(State)
+        graph.add_node("step", lambda state: {"count": state["count"] + 1})
+        graph.set_entry_point("step")
+        graph.add_edge("step", END)
+        store = GenerationCheckpoints(str(tmp_path / "checkpoints.db"))
+        workflow = graph.compile(checkpointer=store.saver)
+        config = {"configurable": {"thread_id": "p1"}}
+
+        assert asyncio.run(workflow.ainvoke({"count": 1}, config))["count"] == 2
+        assert workflow.get_state(config).values == {"count": 2}
+        store.delete("p1")
+        assert workflow.get_state(config).values == {}
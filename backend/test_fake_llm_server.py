@@ -0,0 +1,179 @@
+"""
+Tests for the local fake LLM server
+"""
+import asyncio
+import json
+import random
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from langchain_openai import ChatOpenAI
+from agents.architect import ArchitectAgent
+from agents.engineer import EngineerAgent
+from fake_llm_server import FakeLLMConfig, create_app, parse_latency
+
+AUTH = {"Authorization": "Bearer sk-fake"}
+
+ARCHITECT_MESSAGES = ArchitectAgent(use_cache=False)._build_messages("Todo app")
+ENGINEER_MESSAGES = EngineerAgent(use_cache=False)._build_messages("script.js", "Logic", "Todo app", "JS")
+
+
+def as_openai(messages: list) -> list:
+    return [{"role": "system" if m.type == "system" else "user", "content": m.content} for m in messages]
+
+
+def fake_llm(app) -> ChatOpenAI:
+    """ChatOpenAI talking to the fake server in-process through the real OpenAI client."""
+    return ChatOpenAI(
+        model="fake-gpt",
+        openai_api_key="sk-fake",
+        openai_api_base="http://fake-llm/v1",
+        stream_usage=True,
+        max_retries=0,
+        http_async_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    )
+
+class TestLatencySpecs:
+    """Test latency distribution parsing"""
+
+    def test_distributions(self):
+        """Test that every distribution samples non-negative seconds"""
+        rng = random.Random(1)
+        assert parse_latency("fixed:0.25")(rng) == 0.25
+        assert 0.1 <= parse_latency("uniform:0.1,0.2")(rng) <= 0.2
+        assert parse_latency("normal:0,10")(rng) >= 0
+        assert parse_latency("lognormal:0.5,0.3")(rng) > 0
+        assert parse_latency("exponential:0.1")(rng) >= 0
+
+    def test_invalid_specs(self):
+        """Test that bad specs are rejected up front"""
+        for spec in ("gamma:1", "fixed", "uniform:1", "fixed:fast"):
+            with pytest.raises(ValueError):
+                parse_latency(spec)
+
+class TestFakeServer:
+    """Test the OpenAI-compatible endpoints"""
+
+    def test_models_and_auth(self):
+        """Test the models list used by key validation"""
+        client = TestClient(create_app(FakeLLMConfig()))
+
+        response = client.get("/v1/models", headers=AUTH)
+        assert response.status_code == 200
+        assert "fake-gpt" in [model["id"] for model in response.json()["data"]]
+        assert client.get("/v1/models", headers={"Authorization": "Bearer sk-invalid-1"}).status_code == 401
+
+    def test_architect_gets_a_plan(self):
+        """Test that architect prompts get parseable plan JSON"""
+        client = TestClient(create_app(FakeLLMConfig(plan_files=5)))
+
+        response = client.post("/v1/chat/completions", headers=AUTH, json={
+            "model": "fake-gpt", "messages": as_openai(ARCHITECT_MESSAGES)
+        })
+
+        body = response.json()
+        plan = json.loads(body["choices"][0]["message"]["content"])
+        assert len(plan["files"]) == 5
+        assert plan["dependencies"]["index.html"] == ["style.css", "script.js", "module1.js", "module2.js"]
+        assert body["usage"]["completion_tokens"] > 0
+
+    def test_engineer_output_size(self):
+        """Test that generated files are roughly file_tokens long"""
+        client = TestClient(create_app(FakeLLMConfig(file_tokens=300)))
+
+        response = client.post("/v1/chat/completions", headers=AUTH, json={"messages": as_openai(ENGINEER_MESSAGES)})
+
+        usage = response.json()["usage"]
+        assert 300 <= usage["completion_tokens"] < 330
+
+    def test_streaming_with_usage(self):
+        """Test SSE chunks, the usage chunk and the [DONE] terminator"""
+        client = TestClient(create_app(FakeLLMConfig()))
+
+        response = client.post("/v1/chat/completions", headers=AUTH, json={
+            "messages": as_openai(ENGINEER_MESSAGES),
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        })
+
+        events = [line[len("data: "):] for line in response.text.split("\n\n") if line]
+        assert events[-1] == "[DONE]"
+        chunks = [json.loads(event) for event in events[:-1]]
+        content = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+        assert content.startswith("/* script.js")
+        assert chunks[-1]["usage"]["completion_tokens"] > 0
+
+    def test_abandoned_stream_frees_its_slot(self):
+        """Test that a stream the client leaves before the first chunk does not leak in_flight"""
+        from starlette.requests import Request
+
+        app = create_app(FakeLLMConfig(max_concurrency=1))
+        endpoint = next(route.endpoint for route in app.routes if getattr(route, "path", None) == "/v1/chat/completions")
+        body = json.dumps({"messages": as_openai(ENGINEER_MESSAGES), "stream": True}).encode()
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def abandon():
+            request = Request({
+                "type": "http",
+                "method": "POST",
+                "path": "/v1/chat/completions",
+                "headers": [(b"authorization", b"Bearer sk-fake")]
+            }, receive)
+            response = await endpoint(request)
+            await response.body_iterator.aclose()
+
+        for _ in range(3):
+            asyncio.run(abandon())
+        assert app.state.stats["in_flight"] == 0
+
+    def test_rate_limit_injection(self):
+        """Test injected 429s carry Retry-After"""
+        client = TestClient(create_app(FakeLLMConfig(rate_limit_rate=1.0, retry_after=2.5)))
+
+        response = client.post("/v1/chat/completions", headers=AUTH, json={"messages": []})
+
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "2.5"
+        assert response.json()["error"]["type"] == "rate_limit_error"
+
+    def test_error_injection(self):
+        """Test injected server errors"""
+        app = create_app(FakeLLMConfig(error_rate=1.0))
+        response = TestClient(app).post("/v1/chat/completions", headers=AUTH, json={"messages": []})
+
+        assert response.status_code == 500
+        assert app.state.stats["errors"] == 1
+
+class TestRealClient:
+    """Test the fake server through ChatOpenAI and the agents"""
+
+    def test_concurrency_cap_returns_429(self):
+        """Test that requests beyond max_concurrency are rate limited"""
+        app = create_app(FakeLLMConfig(latency="fixed:0.2", max_concurrency=2))
+        llm = fake_llm(app)
+
+        async def run():
+            return await asyncio.gather(*(llm.ainvoke("hi") for _ in range(4)), return_exceptions=True)
+
+        results = asyncio.run(run())
+        assert sum(isinstance(result, Exception) for result in results) == 2
+        assert app.state.stats["rate_limited"] == 2
+
+    def test_agents_run_against_fake_server(self):
+        """Test plan and streamed file generation over the OpenAI protocol"""
+        llm = fake_llm(create_app(FakeLLMConfig(plan_files=4, tokens_per_second=10000)))
+        deltas = []
+
+        async def run():
+            plan = await ArchitectAgent(use_cache=False).aplan("Todo app", llm=llm)
+            code = await EngineerAgent(use_cache=False).awrite_file(
+                "script.js", plan["files"]["script.js"], "Todo app", plan["tech_stack"],
+                on_token=deltas.append, llm=llm
+            )
+            return plan, code
+
+        plan, code = asyncio.run(run())
+        assert list(plan["files"]) == ["index.html", "style.css", "script.js", "module1.js"]
+        assert code.startswith("/* script.js") and len(deltas) > 1
@@ -0,0 +1,217 @@
+"""
+Tests for hedged LLM calls and cross-provider failover
+"""
+import asyncio
+import httpx
+import pytest
+from unittest.mock import MagicMock, patch
+from agents.engineer import EngineerAgent
+from hedging import HedgeBudget, HedgePolicy
+
+
+class StatusError(Exception):
+    """Provider error carrying an HTTP response, like openai.APIStatusError."""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = httpx.Response(status)
+
+def make_llm(provider: str) -> MagicMock:
+    return MagicMock(metadata={"provider": provider}, temperature=0.2)
+
+def warmed_policy(**options) -> HedgePolicy:
+    """A policy that hedges any call slower than 50ms."""
+    policy = HedgePolicy(percentile=0.5, min_delay=0.05, min_samples=1, **options)
+    policy.record("engineer", "primary", 0.01)
+    return policy
+
+class TestThresholdAndBudget:
+    """Test the adaptive threshold and the per-generation budget"""
+
+    def test_threshold_needs_samples_and_has_a_floor(self):
+        """Test percentile, warm-up and min_delay"""
+        policy = HedgePolicy(percentile=0.9, min_delay=0.5, min_samples=10)
+        for latency in range(1, 10):
+            policy.record("engineer", "openai", latency)
+        assert policy.threshold("engineer", "openai") is None
+
+        policy.record("engineer", "openai", 10)
+        assert policy.threshold("engineer", "openai") == 9
+        assert policy.threshold("architect", "openai") is None
+
+        fast = HedgePolicy(percentile=0.5, min_delay=0.5, min_samples=1)
+        fast.record("engineer", "openai", 0.1)
+        assert fast.threshold("engineer", "openai") == 0.5
+
+    def test_budget_grows_with_calls(self):
+        """Test minimum plus ratio per call"""
+        budget = HedgeBudget(minimum=1, ratio=0.5)
+        assert budget.try_spend()
+        assert not budget.try_spend()
+        budget.record_call()
+        budget.record_call()
+        assert budget.try_spend()
+        assert not budget.try_spend()
+
+class TestHedgedCalls:
+    """Test racing, cancellation and failover"""
+
+    def test_no_hedging_outside_a_budget(self):
+        """Test that calls outside a generation that opted in run once"""
+        policy = warmed_policy()
+        calls = []
+
+        async def call(llm):
+            calls.append(llm)
+            await asyncio.sleep(0.1)
+            return "slow"
+
+        assert asyncio.run(policy.arun(make_llm("primary"), call, "engineer")) == "slow"
+        assert len(calls) == 1
+
+    def test_slow_call_is_hedged_and_loser_cancelled(self):
+        """Test that the duplicate wins and the slow primary is cancelled"""
+        primary, secondary = make_llm("primary"), make_llm("secondary")
+        policy = warmed_policy(secondary=lambda llm: secondary)
+        cancelled = []
+
+        async def call(llm):
+            try:
+                await asyncio.sleep(1.0 if llm is primary else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(llm)
+                raise
+            return llm.metadata["provider"]
+
+        async def run():
+            with policy.budget():
+                result = await policy.arun(primary, call, "engineer")
+            await asyncio.sleep(0)
+            return result
+
+        assert asyncio.run(run()) == "secondary"
+        assert cancelled == [primary]
+        stats = policy.stats()
+        assert stats["hedged"] == 1 and stats["hedges_won"] == 1
+
+    def test_latency_is_recorded_per_attempt(self):
+        """Test that a winning hedge records its own latency and a queued call records none"""
+        from rate_limit import RateLimiter
+
+        primary, secondary = make_llm("primary"), make_llm("secondary")
+        policy = warmed_policy(secondary=lambda llm: secondary)
+        limiter = RateLimiter(rate=1000, burst=100, initial_concurrency=1)
+
+        async def call(llm):
+            await asyncio.sleep(1.0 if llm is primary else 0.01)
+            return "done"
+
+        async def limited(llm):
+            return await limiter.arun(lambda: asyncio.sleep(0.01))
+
+        async def run():
+            with policy.budget():
+                await policy.arun(primary, call, "engineer")
+                # The second call queues behind the first for the limiter's only slot
+                await asyncio.gather(*(policy.arun(make_llm("limited"), limited, "engineer") for _ in range(2)))
+
+        asyncio.run(run())
+        warmup, hedge = policy._latencies[("engineer", "primary")]
+        assert hedge < 0.5
+        assert len(policy._latencies[("engineer", "limited")]) == 1
+
+    def test_fast_call_is_not_hedged(self):
+        """Test that calls under the threshold make one request"""
+        policy = warmed_policy()
+        calls = []
+
+        async def call(llm):
+            calls.append(llm)
+            return "fast"
+
+        async def run():
+            with policy.budget():
+                return await policy.arun(make_llm("primary"), call, "engineer")
+
+        assert asyncio.run(run()) == "fast"
+        assert len(calls) == 1
+
+    def test_budget_caps_hedges(self):
+        """Test that one generation cannot double its calls"""
+        policy = warmed_policy(budget_min=1, budget_ratio=0)
+        calls = []
+
+        async def call(llm):
+            calls.append(llm)
+            await asyncio.sleep(0.1)
+            return "done"
+
+        async def run():
+            with policy.budget():
+                return await asyncio.gather(*(policy.arun(make_llm("primary"), call, "engineer") for _ in range(3)))
+
+        assert asyncio.run(run()) == ["done"] * 3
+        assert len(calls) == 4
+        assert policy.stats()["skipped"] == 2
+
+    def test_no_hedge_into_a_full_window(self):
+        """Test that a saturated provider key gets no duplicate"""
+        policy = warmed_policy()
+        limiter = MagicMock(in_flight=4, limit=4.0)
+
+        async def call(llm):
+            await asyncio.sleep(0.1)
+            return "done"
+
+        async def run():
+            with policy.budget():
+                return await policy.arun(make_llm("primary"), call, "engineer")
+
+        with patch("hedging.rate_limits.for_llm", return_value=limiter):
+            assert asyncio.run(run()) == "done"
+        assert policy.stats()["hedged"] == 0
+
+    def test_retryable_failure_fails_over(self):
+        """Test failover to the secondary after a 5xx, but not after a 4xx"""
+        primary, secondary = make_llm("primary"), make_llm("secondary")
+        policy = HedgePolicy(secondary=lambda llm: secondary)
+
+        async def call(llm):
+            if llm is primary:
+                raise StatusError(503)
+            return "from secondary"
+
+        async def run(call):
+            with policy.budget():
+                return await policy.arun(primary, call, "engineer")
+
+        assert asyncio.run(run(call)) == "from secondary"
+        assert policy.stats()["failovers"] == 1
+
+        async def unauthorized(llm):
+            raise StatusError(401)
+
+        with pytest.raises(StatusError):
+            asyncio.run(run(unauthorized))
+
+    def test_agent_calls_are_hedged_in_a_budget(self):
+        """Test the engineer's unstreamed call through the shared policy"""
+        agent = EngineerAgent(use_cache=False)
+        llm = MagicMock(metadata={"provider": "primary"})
+        replies = iter([1.0, 0.01])
+
+        async def ainvoke(messages):
+            await asyncio.sleep(next(replies))
+            return MagicMock(content="print(1)", usage_metadata=None)
+
+        llm.ainvoke = ainvoke
+        policy = warmed_policy()
+
+        async def run():
+            with policy.budget():
+                return await agent.awrite_file("main.py", "Entry", "app", "Python", llm=llm)
+
+        with patch("agents.base.hedging", policy):
+            assert asyncio.run(run()) == "print(1)"
+        assert policy.stats()["hedges_won"] == 1
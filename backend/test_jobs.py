@@ -0,0 +1,181 @@
+"""
+Tests for background generation jobs
+"""
+import asyncio
+import time
+import pytest
+from unittest.mock import patch
+from jobs import JobQueue, JobStore
+
+class TestJobStore:
+    """Test the SQLite job store"""
+
+    def test_lifecycle_never_stores_api_key(self, tmp_path):
+        """Test queued -> running -> completed without the key touching the database"""
+        store = JobStore(str(tmp_path / "jobs.db"))
+        job_id = store.create({"prompt": "todo app"}, has_key=True)
+
+        request, has_key, attempts = store.claim(job_id)
+        assert (request, has_key, attempts) == ({"prompt": "todo app"}, True, 1)
+        assert store.claim(job_id) is None
+
+        store.complete(job_id, {"files": {"index.html": "<html></html>"}})
+        job = store.get(job_id)
+        assert job["status"] == "completed"
+        assert job["result"]["files"] == {"index.html": "<html></html>"}
+        columns = {row[1] for row in store._conn.execute("PRAGMA table_info(jobs)")}
+        assert "api_key" not in columns
+
+    def test_recover_adopts_only_expired_leases(self, tmp_path):
+        """Test that a second worker leaves live jobs alone and adopts a crashed worker's"""
+        path = str(tmp_path / "jobs.db")
+        store = JobStore(path)
+        first = store.create({"prompt": "a"})
+        second = store.create({"prompt": "b"})
+        store.claim(first)
+
+        other = JobStore(path)
+        assert other.recover() == []
+        assert other.claim(second) is None
+
+        with patch("jobs.time.time", return_value=time.time() + store.lease + 1):
+            assert other.recover() == [first, second]
+        assert store.get(first)["status"] == "queued"
+        assert store.claim(second) is None
+        assert other.claim(second) is not None
+
+    def test_legacy_keys_are_erased(self, tmp_path):
+        """Test that keys stored by the old schema are wiped on open"""
+        import sqlite3
+
+        path = str(tmp_path / "jobs.db")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, api_key TEXT, "
+            "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO jobs VALUES ('old', 'queued', '{}', 'sk-secret', NULL, NULL, 0, 0, 0)")
+        conn.commit()
+        conn.close()
+
+        store = JobStore(path)
+        assert store._conn.execute("SELECT api_key, has_key FROM jobs").fetchone() == (None, 1)
+        assert store.recover() == ["old"]
+
+class TestJobQueue:
+    """Test the worker pool"""
+
+    def test_runs_jobs_with_bounded_concurrency(self, tmp_path):
+        """Test that jobs complete and at most `concurrency` run at once"""
+        store = JobStore(str(tmp_path / "jobs.db"))
+        in_flight = {"now": 0, "peak": 0}
+
+        async def runner(request, api_key):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            if request["prompt"] == "boom":
+                raise RuntimeError("provider error")
+            return {"prompt": request["prompt"], "key_seen": api_key == "sk"}
+
+        async def scenario():
+            queue = JobQueue(store, runner, concurrency=2)
+            ids = [await queue.submit({"prompt": p}, "sk") for p in ["a", "b", "boom", "c"]]
+            while any(store.get(job_id)["status"] in ("queued", "running") for job_id in ids):
+                await asyncio.sleep(0.01)
+            await queue.shutdown()
+            return ids
+
+        ids = asyncio.run(scenario())
+        jobs = [store.get(job_id) for job_id in ids]
+
+        assert in_flight["peak"] <= 2
+        assert [job["status"] for job in jobs] == ["completed", "completed", "failed", "completed"]
+        assert jobs[0]["result"] == {"prompt": "a", "key_seen": True}
+        assert jobs[2]["error"] == "provider error"
+
+    def test_shutdown_drains_in_flight_jobs(self, tmp_path):
+        """Test that shutdown waits for running jobs to finish"""
+        store = JobStore(str(tmp_path / "jobs.db"))
+
+        async def runner(request, api_key):
+            await asyncio.sleep(0.05)
+            return {"ok": True}
+
+        async def scenario():
+            queue = JobQueue(store, runner, concurrency=1)
+            job_id = await queue.submit({"prompt": "a"}, "sk")
+            await asyncio.sleep(0.01)
+            await queue.shutdown(drain_timeout=5)
+            return job_id
+
+        job_id = asyncio.run(scenario())
+        assert store.get(job_id)["status"] == "completed"
+
+    def test_unfinished_jobs_are_requeued_on_restart(self, tmp_path):
+        """Test that a job cut off by the drain timeout runs again after restart, once its key is resent"""
+        store = JobStore(str(tmp_path / "jobs.db"))
+        calls = []
+
+        async def slow_runner(request, api_key):
+            calls.append("slow")
+            await asyncio.sleep(10)
+
+        async def fast_runner(request, api_key):
+            calls.append("fast")
+            return {"ok": True}
+
+        async def first_process():
+            queue = JobQueue(store, slow_runner, concurrency=1)
+            keyless = await queue.submit({"prompt": "a"}, None)
+            keyed = await queue.submit({"prompt": "b", "project_id": "p1"}, "sk")
+            await asyncio.sleep(0.01)
+            await queue.shutdown(drain_timeout=0.01)
+            return keyless, keyed
+
+        async def second_process():
+            queue = JobQueue(JobStore(store.path), fast_runner, concurrency=1)
+            await queue.start()
+            await asyncio.sleep(0.02)
+            await queue.shutdown()
+
+        keyless, keyed = asyncio.run(first_process())
+        assert store.get(keyless)["status"] == "queued"
+
+        asyncio.run(second_process())
+        assert calls == ["slow", "fast"]
+        assert store.get(keyless)["status"] == "completed"
+        # The key stayed in the first process's memory only
+        failed = store.get(keyed)
+        assert failed["status"] == "failed"
+        assert "submit the job again or resume project p1" in failed["error"]
+
+    def test_failed_generation_keeps_its_project_id(self, tmp_path):
+        """Test that a job stopped by a checkpointed failure reports the project to resume"""
+        store = JobStore(str(tmp_path / "jobs.db"))
+
+        class GenerationFailed(Exception):
+            def __init__(self, project_id, error):
+                super().__init__(str(error))
+                self.project_id = project_id
+
+        async def runner(request, api_key):
+            raise GenerationFailed(request["project_id"], RuntimeError("provider down"))
+
+        async def run():
+            queue = JobQueue(store, runner, concurrency=1)
+            job_id = await queue.submit({"prompt": "a", "project_id": "p1"}, "sk")
+            assert store.get(job_id)["project_id"] == "p1"
+            await asyncio.sleep(0.02)
+            await queue.shutdown()
+            return job_id
+
+        job = store.get(asyncio.run(run()))
+        assert job["status"] == "failed"
+        assert job["error"] == "provider down"
+        assert job["project_id"] == "p1"
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
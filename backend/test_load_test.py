@@ -0,0 +1,104 @@
+"""
+Tests for the load generator in scripts/load_test.py
+"""
+import asyncio
+import json
+import os
+import sys
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import load_test
+
+
+def backend_transport() -> httpx.MockTransport:
+    """Stand-in backend answering the three scenarios; every third key check reports invalid."""
+    checks = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/chat":
+            return httpx.Response(200, json={"response": "Hi"})
+        if request.url.path == "/api/validate-key":
+            checks.append(1)
+            return httpx.Response(200, json={"valid": len(checks) % 3 != 0})
+        if request.url.path == "/api/generate/stream":
+            events = (
+                'event: file_complete\ndata: {"filename": "index.html"}\n\n'
+                'event: done\ndata: {"result": {}}\n\n'
+            )
+            return httpx.Response(200, text=events, headers={"content-type": "text/event-stream"})
+        return httpx.Response(404)
+
+    return httpx.MockTransport(handler)
+
+class TestStatistics:
+    """Test percentiles and scenario summaries"""
+
+    def test_percentile_interpolates(self):
+        """Test linear interpolation between ranks"""
+        assert load_test.percentile([1, 2, 3, 4], 50) == 2.5
+        assert load_test.percentile([5], 99) == 5
+        assert load_test.percentile([], 95) is None
+
+    def test_summarize(self):
+        """Test success, error and time-to-first-file figures"""
+        samples = [
+            {"ok": True, "latency": 1.0, "first_file": 0.5},
+            {"ok": True, "latency": 3.0, "first_file": None},
+            {"ok": False, "latency": 9.0, "error": "timeout"}
+        ]
+        summary = load_test.summarize(samples, elapsed=2.0)
+
+        assert summary["requests"] == 3 and summary["succeeded"] == 2
+        assert summary["errors"] == {"timeout": 1}
+        assert summary["error_rate"] == pytest.approx(1 / 3)
+        assert summary["throughput_rps"] == 1.0
+        assert summary["latency_seconds"]["p50"] == 2.0
+        assert summary["time_to_first_file_seconds"]["max"] == 0.5
+
+class TestRun:
+    """Test a full run in-process through the transport"""
+
+    def test_closed_loop_run_and_report(self, capsys):
+        """Test that every scenario is driven and reported"""
+        args = load_test.parse_args(["--requests", "30", "--duration", "0", "--concurrency", "3", "--seed", "1"])
+        results = asyncio.run(load_test.run(args, transport=backend_transport()))
+
+        assert results["overall"]["requests"] == 30
+        assert set(results["scenarios"]) == {"generate", "chat", "validate"}
+        assert results["scenarios"]["chat"]["error_rate"] == 0.0
+        assert results["scenarios"]["generate"]["time_to_first_file_seconds"]["p50"] is not None
+        assert results["scenarios"]["validate"]["errors"].get("KEY_INVALID")
+        json.dumps(results)
+
+        load_test.print_report(results)
+        report = capsys.readouterr().out.splitlines()
+        assert report[1].split()[:1] == ["scenario"]
+        assert [line.split()[0] for line in report[2:] if line.split() and not line.split()[0].isdigit()] == [
+            "generate", "chat", "validate", "overall"
+        ]
+
+    def test_open_loop_counts_time_queued_behind_the_cap(self, capsys):
+        """Test that open-loop latency runs from the scheduled start and that runs are uncapped by default"""
+        async def slow_chat(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, json={"response": "Hi"})
+
+        def run(argv):
+            args = load_test.parse_args(["--rps", "100", "--requests", "5", "--duration", "0", "--mix", "chat=1", *argv])
+            return asyncio.run(load_test.run(args, transport=httpx.MockTransport(slow_chat)))
+
+        # One slot: the fifth request waits behind four 50ms calls
+        capped = run(["--concurrency", "1"])
+        assert capped["overall"]["latency_seconds"]["max"] > 0.15
+        assert run([])["overall"]["latency_seconds"]["max"] < 0.15
+        assert load_test.parse_args(["--rps", "5"]).concurrency is None
+
+        load_test.print_report(capped)
+        assert f"Target 100 rps, achieved {capped['achieved_rps']:.2f} rps" in capsys.readouterr().out
+
+    def test_invalid_mix(self):
+        """Test that unknown scenarios are rejected"""
+        with pytest.raises(ValueError):
+            load_test.parse_mix("generate=1,upload=2")
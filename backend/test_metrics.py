@@ -0,0 +1,173 @@
+"""
+Tests for metrics and the /metrics endpoint
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+from fastapi.testclient import TestClient
+from metrics import (
+    Counter, Gauge, Histogram, MetricsRegistry, cache_collector, llm_latency, llm_tokens,
+    metrics_registry, request_latency, track_llm_call
+)
+from agents.engineer import EngineerAgent
+
+class TestMetricTypes:
+    """Test counters, gauges, histograms and the text format"""
+
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.registry = MetricsRegistry()
+
+    def test_counter_renders_per_label_set(self):
+        """Test that counters accumulate per label set"""
+        counter = Counter("test_calls_total", "Calls.", ("agent",), registry=self.registry)
+        counter.inc(agent="architect")
+        counter.inc(2, agent="architect")
+        counter.inc(agent="engineer")
+
+        text = self.registry.render()
+        assert "# TYPE test_calls_total counter" in text
+        assert 'test_calls_total{agent="architect"} 3.0' in text
+        assert 'test_calls_total{agent="engineer"} 1.0' in text
+
+    def test_counter_rejects_decrease_and_wrong_labels(self):
+        """Test that counters only go up and labels must match"""
+        counter = Counter("test_total", "Calls.", ("agent",), registry=self.registry)
+        with pytest.raises(ValueError):
+            counter.inc(-1, agent="architect")
+        with pytest.raises(ValueError):
+            counter.inc(agent="architect", provider="openai")
+
+    def test_duplicate_names_are_rejected(self):
+        """Test that a name can only be registered once"""
+        Counter("test_total", "Calls.", registry=self.registry)
+        with pytest.raises(ValueError):
+            Gauge("test_total", "Calls.", registry=self.registry)
+
+    def test_gauge_track(self):
+        """Test that track() counts a block as in progress, even when it raises"""
+        gauge = Gauge("test_in_flight", "Running.", ("kind",), registry=self.registry)
+        with gauge.track(kind="generate"):
+            assert gauge.value(kind="generate") == 1
+        with pytest.raises(RuntimeError):
+            with gauge.track(kind="generate"):
+                raise RuntimeError("boom")
+        assert gauge.value(kind="generate") == 0
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test bucket counts, sum and count in the exposition"""
+        histogram = Histogram("test_seconds", "Latency.", buckets=(0.1, 1.0), registry=self.registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        text = self.registry.render()
+        assert 'test_seconds_bucket{le="0.1"} 2' in text
+        assert 'test_seconds_bucket{le="1.0"} 3' in text
+        assert 'test_seconds_bucket{le="+Inf"} 4' in text
+        assert "test_seconds_sum 3.65" in text
+        assert "test_seconds_count 4" in text
+
+    def test_label_values_are_escaped(self):
+        """Test that quotes, backslashes and newlines cannot break the format"""
+        counter = Counter("test_total", "Calls.", ("route",), registry=self.registry)
+        counter.inc(route='a"b\\c\nd')
+        assert 'test_total{route="a\\"b\\\\c\\nd"} 1.0' in self.registry.render()
+
+    def test_cache_collector(self):
+        """Test hit ratios computed from cache stats at scrape time"""
+        self.registry.register_collector(cache_collector(lambda: {
+            "file": {"hits": 3, "misses": 1},
+            "plan": {"hits": 0, "misses": 0}
+        }))
+
+        text = self.registry.render()
+        assert 'codegenesis_cache_hit_ratio{cache="file"} 0.75' in text
+        assert 'codegenesis_cache_hit_ratio{cache="plan"} 0.0' in text
+        assert 'codegenesis_cache_hits_total{cache="file"} 3' in text
+
+    def test_failing_collector_is_skipped(self):
+        """Test that one broken collector does not break the scrape"""
+        self.registry.register_collector(MagicMock(side_effect=RuntimeError("down")))
+        Counter("test_total", "Calls.", registry=self.registry).inc()
+        assert "test_total 1.0" in self.registry.render()
+
+class TestLLMCallTracking:
+    """Test LLM latency and token accounting"""
+
+    def test_usage_is_counted_by_provider_and_agent(self):
+        """Test prompt and completion tokens from usage_metadata"""
+        llm = MagicMock(metadata={"provider": "test-usage"})
+        before = llm_latency.value(provider="test-usage", agent="engineer", outcome="ok")["count"]
+
+        with track_llm_call(llm, "engineer") as usage:
+            usage.append({"input_tokens": 120, "output_tokens": 30, "total_tokens": 150})
+            usage.append(None)
+
+        assert llm_tokens.value(provider="test-usage", agent="engineer", type="prompt") == 120
+        assert llm_tokens.value(provider="test-usage", agent="engineer", type="completion") == 30
+        assert llm_latency.value(provider="test-usage", agent="engineer", outcome="ok")["count"] == before + 1
+
+    def test_failures_and_cancellations_are_labelled(self):
+        """Test the outcome label for errors and cancelled calls"""
+        llm = MagicMock(metadata={"provider": "test-outcome"})
+        with pytest.raises(RuntimeError):
+            with track_llm_call(llm, "architect"):
+                raise RuntimeError("provider down")
+        with pytest.raises(asyncio.CancelledError):
+            with track_llm_call(llm, "architect"):
+                raise asyncio.CancelledError()
+
+        assert llm_latency.value(provider="test-outcome", agent="architect", outcome="error")["count"] == 1
+        assert llm_latency.value(provider="test-outcome", agent="architect", outcome="cancelled")["count"] == 1
+
+    def test_agents_report_streamed_usage(self):
+        """Test that the agents' streaming path counts the usage chunk"""
+        async def stream(messages):
+            yield MagicMock(content="<div>", usage_metadata=None)
+            yield MagicMock(content="", usage_metadata={"input_tokens": 40, "output_tokens": 7})
+
+        llm = MagicMock(metadata={"provider": "test-stream"}, model_name="m", temperature=0.3, openai_api_base=None)
+        llm.astream = stream
+        agent = EngineerAgent(use_cache=False)
+
+        code = asyncio.run(agent.awrite_file("index.html", "Main", "App", "HTML", on_token=lambda delta: None, llm=llm))
+
+        assert code == "<div>"
+        assert llm_tokens.value(provider="test-stream", agent="engineer", type="prompt") == 40
+        assert llm_tokens.value(provider="test-stream", agent="engineer", type="completion") == 7
+
+    def test_unknown_provider(self):
+        """Test LLMs without provider metadata"""
+        llm = MagicMock()
+        llm.invoke.return_value = MagicMock(content="code", usage_metadata={"input_tokens": 5, "output_tokens": 2})
+        EngineerAgent(use_cache=False).write_file("a.js", "A", "App", "JS", llm=llm)
+
+        assert llm_tokens.value(provider="unknown", agent="engineer", type="prompt") >= 5
+
+class TestMetricsEndpoint:
+    """Test the /metrics endpoint"""
+
+    def test_exposes_request_latency_by_route(self):
+        """Test that requests are recorded under their route template"""
+        from main import app
+        client = TestClient(app)
+        before = request_latency.value(method="GET", route="/api/jobs/{job_id}", status="200")["count"]
+
+        client.get("/api/health")
+        client.get("/api/jobs/missing")
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'route="/api/health"' in response.text
+        assert request_latency.value(method="GET", route="/api/jobs/{job_id}", status="200")["count"] == before + 1
+        assert "codegenesis_cache_hit_ratio" in response.text
+        assert "codegenesis_jobs_in_flight" in response.text
+
+    def test_unmatched_routes_share_a_label(self):
+        """Test that unknown paths cannot blow up label cardinality"""
+        from main import app
+        TestClient(app).get("/no/such/path")
+
+        assert request_latency.value(method="GET", route="unmatched", status="404")["count"] >= 1
+        assert "/no/such/path" not in metrics_registry.render()
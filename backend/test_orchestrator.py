@@ -0,0 +1,529 @@
+"""
+Tests for the CodeGenesis orchestrator workflow
+"""
+import time
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+from agents.architect import ArchitectAgent
+from agents.engineer import EngineerAgent
+from agents import testsprite
+from checkpoints import GenerationCheckpoints
+from orchestrator import CodeGenesisOrchestrator, GenerationFailed, diff_plans, get_workflow
+from vfs import projects
+
+PLAN = {
+    "tech_stack": "HTML/CSS/JS",
+    "files": {
+        "index.html": "Main HTML file",
+        "style.css": "Styling",
+        "script.js": "JavaScript logic",
+        "about.html": "About page"
+    }
+}
+
+# Mock API config for all tests; checkpoints go to tmp_path, on a graph compiled for them
+@pytest.fixture(autouse=True)
+def mock_api_config(tmp_path):
+    with patch("agents.base.api_config") as mock_config, \
+         patch("orchestrator.generation_checkpoints", GenerationCheckpoints(str(tmp_path / "checkpoints.db"))), \
+         patch("orchestrator._workflow", None):
+
+        mock_config.get_llm.side_effect = lambda **kwargs: MagicMock()
+
+        yield
+
+def make_orchestrator(**kwargs):
+    """Build an orchestrator with a stubbed architect and testsprite (on private agents, not the shared ones)."""
+    kwargs.setdefault("use_cache", False)
+    orchestrator = CodeGenesisOrchestrator(user_api_key="test", user_provider="openai", **kwargs)
+    orchestrator.architect = ArchitectAgent(use_cache=False)
+    orchestrator.engineer = EngineerAgent(use_cache=False)
+    orchestrator.testsprite = testsprite.TestSpriteAgent()
+    orchestrator.architect.plan = MagicMock(return_value=PLAN)
+    orchestrator.architect.aplan = AsyncMock(return_value=PLAN)
+    orchestrator.testsprite.generate_tests = MagicMock(return_value="test code")
+    orchestrator.testsprite.agenerate_tests = AsyncMock(return_value="test code")
+    return orchestrator
+
+class TestSharedWorkflow:
+    """Test that the graph and agents are shared while each run keeps its own context"""
+
+    def test_graph_and_agents_are_built_once(self):
+        """Test that orchestrators reuse one compiled graph and one set of agents"""
+        first = CodeGenesisOrchestrator(user_api_key="a", user_provider="openai", use_cache=False)
+        second = CodeGenesisOrchestrator(user_api_key="b", user_provider="openai", use_cache=False)
+
+        assert first.workflow is second.workflow is get_workflow()
+        assert first.engineer is second.engineer
+        assert first.engineer_llm is not second.engineer_llm
+        assert first.vfs is not second.vfs
+
+    def test_concurrent_runs_keep_their_own_llms_and_files(self):
+        """Test that two requests on the shared graph never see each other's context"""
+        def make_llm(name):
+            llm = MagicMock()
+
+            async def ainvoke(messages):
+                if "software architect" in messages[0].content:
+                    return MagicMock(content='{"tech_stack": "JS", "files": {"app.js": "App"}}')
+                await asyncio.sleep(0.01)
+                return MagicMock(content=f"// {name}")
+
+            llm.ainvoke = ainvoke
+            return llm
+
+        orchestrators = []
+        for name in ("alice", "bob"):
+            orchestrator = CodeGenesisOrchestrator(user_api_key=name, user_provider="openai", use_cache=False)
+            orchestrator.architect_llm = orchestrator.engineer_llm = orchestrator.testsprite_llm = make_llm(name)
+            orchestrators.append(orchestrator)
+
+        async def run_both():
+            return await asyncio.gather(*(o.agenerate_app("Build an app") for o in orchestrators))
+
+        alice, bob = asyncio.run(run_both())
+
+        assert alice["files"] == {"app.js": "// alice"}
+        assert bob["files"] == {"app.js": "// bob"}
+        assert orchestrators[1].vfs.read_file("app.js") == "// bob"
+
+class TestEngineerFanOut:
+    """Test concurrent per-file generation in the engineer node"""
+
+    def test_files_are_generated_concurrently(self):
+        """Test that engineer calls overlap up to max_concurrency"""
+        orchestrator = make_orchestrator(max_concurrency=4)
+        lock = threading.Lock()
+        in_flight = {"now": 0, "peak": 0}
+
+        def write_file(filename, description, user_prompt, tech_stack, context="", llm=None):
+            with lock:
+                in_flight["now"] += 1
+                in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            time.sleep(0.05)
+            with lock:
+                in_flight["now"] -= 1
+            return f"// {filename}"
+
+        orchestrator.engineer.write_file = write_file
+        result = orchestrator.generate_app("Build a site")
+
+        assert in_flight["peak"] == 4
+        assert list(result["files"].keys()) == list(PLAN["files"].keys())
+        assert orchestrator.vfs.read_file("style.css") == "// style.css"
+        assert projects.get(result["project_id"]) is orchestrator.vfs
+
+    def test_sequential_mode(self):
+        """Test that max_concurrency=1 keeps one call in flight"""
+        orchestrator = make_orchestrator(max_concurrency=1)
+        active = []
+
+        def write_file(filename, description, user_prompt, tech_stack, context="", llm=None):
+            active.append(filename)
+            assert len(active) == 1
+            time.sleep(0.01)
+            active.remove(filename)
+            return "code"
+
+        orchestrator.engineer.write_file = write_file
+        result = orchestrator.generate_app("Build a site")
+
+        assert len(result["files"]) == len(PLAN["files"])
+
+    def test_failed_file_does_not_abort_others(self):
+        """Test that one failing file is reported and the rest still complete"""
+        orchestrator = make_orchestrator(max_concurrency=3)
+
+        def write_file(filename, description, user_prompt, tech_stack, context="", llm=None):
+            if filename == "style.css":
+                raise RuntimeError("provider timeout")
+            return f"// {filename}"
+
+        orchestrator.engineer.write_file = write_file
+        result = orchestrator.generate_app("Build a site")
+
+        assert list(result["files"].keys()) == ["index.html", "script.js", "about.html"]
+        assert result["errors"] == {"style.css": "provider timeout"}
+        assert result["tests"] == "test code"
+
+class TestAsyncGeneration:
+    """Test the async generation path"""
+
+    def test_agenerate_app_bounds_concurrency(self):
+        """Test that async engineer calls overlap up to max_concurrency, in plan order"""
+        orchestrator = make_orchestrator(max_concurrency=2)
+        in_flight = {"now": 0, "peak": 0}
+
+        async def awrite_file(filename, description, user_prompt, tech_stack, context="", on_token=None, llm=None):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            if filename == "script.js":
+                raise RuntimeError("rate limited")
+            return f"// {filename}"
+
+        orchestrator.engineer.awrite_file = awrite_file
+        result = asyncio.run(orchestrator.agenerate_app("Build a site"))
+
+        assert in_flight["peak"] == 2
+        assert list(result["files"].keys()) == ["index.html", "style.css", "about.html"]
+        assert result["errors"] == {"script.js": "rate limited"}
+        assert result["status"] == "Tests generated"
+        orchestrator.architect.aplan.assert_awaited_once_with("Build a site", llm=orchestrator.architect_llm)
+
+class TestDependencyWaves:
+    """Test dependency-aware wave scheduling in the engineer node"""
+
+    PLAN = {
+        "tech_stack": "HTML/CSS/JS",
+        "files": {"index.html": "Page", "app.js": "Logic", "style.css": "Styles"},
+        "dependencies": {"index.html": ["app.js", "style.css"], "app.js": ["style.css"]}
+    }
+
+    def test_waves_run_in_order_with_interface_context(self):
+        """Test that dependents start after their dependencies and see their summaries"""
+        orchestrator = make_orchestrator(max_concurrency=4)
+        orchestrator.architect.aplan = AsyncMock(return_value=self.PLAN)
+        order = []
+        contexts = {}
+        sources = {
+            "style.css": ".card { padding: 0; }",
+            "app.js": "export function renderCards() {}",
+            "index.html": "<div id=\"root\"></div>"
+        }
+
+        async def awrite_file(filename, description, user_prompt, tech_stack, context="", on_token=None, llm=None):
+            order.append(filename)
+            contexts[filename] = context
+            await asyncio.sleep(0.01)
+            return sources[filename]
+
+        orchestrator.engineer.awrite_file = awrite_file
+        result = asyncio.run(orchestrator.agenerate_app("Build a site"))
+
+        assert order == ["style.css", "app.js", "index.html"]
+        assert contexts["style.css"] == ""
+        assert "classes: card" in contexts["app.js"]
+        assert "exports: renderCards" in contexts["index.html"]
+        assert ".card { padding" not in contexts["index.html"]
+        assert list(result["files"]) == ["index.html", "app.js", "style.css"]
+
+    def test_sync_waves_and_failed_dependency(self):
+        """Test that a failed dependency is reported and its dependents still run"""
+        orchestrator = make_orchestrator(max_concurrency=4)
+        orchestrator.architect.plan = MagicMock(return_value=self.PLAN)
+        contexts = {}
+
+        def write_file(filename, description, user_prompt, tech_stack, context="", llm=None):
+            contexts[filename] = context
+            if filename == "app.js":
+                raise RuntimeError("provider timeout")
+            return ".card {}" if filename == "style.css" else "<html></html>"
+
+        orchestrator.engineer.write_file = write_file
+        result = orchestrator.generate_app("Build a site")
+
+        assert result["errors"] == {"app.js": "provider timeout"}
+        assert "app.js" not in contexts["index.html"]
+        assert "style.css" in contexts["index.html"]
+
+    def test_regeneration_uses_carried_over_dependencies(self):
+        """Test that a regenerated file sees summaries of unchanged files it depends on"""
+        orchestrator = make_orchestrator()
+        orchestrator.engineer.write_file = MagicMock(return_value="<html></html>")
+        previous_files = {"index.html": "<html></html>", "app.js": "export const start = 1;", "style.css": ".card {}"}
+        edited = dict(self.PLAN, files=dict(self.PLAN["files"], **{"index.html": "New page"}))
+
+        orchestrator.regenerate_app("Build a site", self.PLAN, previous_files, "old tests", file_plan=edited)
+
+        context = orchestrator.engineer.write_file.call_args.kwargs["context"]
+        assert "exports: start" in context and "classes: card" in context
+
+class TestPipelinedTests:
+    """Test per-file test fragments generated alongside engineering"""
+
+    def test_fragments_overlap_with_engineering(self):
+        """Test that fragments start before the last file finishes and are merged in plan order"""
+        orchestrator = make_orchestrator(max_concurrency=1, pipeline_tests=True)
+        timeline = []
+
+        async def awrite_file(filename, description, user_prompt, tech_stack, context="", on_token=None, llm=None):
+            timeline.append(("file", filename))
+            await asyncio.sleep(0.01)
+            return f"// {filename}"
+
+        async def agenerate_file_tests(filename, code, user_prompt, llm=None):
+            timeline.append(("test", filename))
+            await asyncio.sleep(0.005 if filename == "index.html" else 0)
+            return f"test('{filename}', async () => {{}});"
+
+        orchestrator.engineer.awrite_file = awrite_file
+        orchestrator.testsprite.agenerate_file_tests = agenerate_file_tests
+        result = asyncio.run(orchestrator.agenerate_app("Build a site"))
+
+        assert timeline.index(("test", "index.html")) < timeline.index(("file", "about.html"))
+        orchestrator.testsprite.agenerate_tests.assert_not_awaited()
+        assert result["tests"].startswith("const { test, expect } = require('@playwright/test');")
+        described = [line for line in result["tests"].splitlines() if line.startswith("test.describe(")]
+        assert described == [f'test.describe("{filename}", () => {{' for filename in PLAN["files"]]
+        assert orchestrator.vfs.read_file("tests/app.test.js") == result["tests"]
+
+    def test_sync_pipeline_skips_failed_fragments(self):
+        """Test that a failed fragment is left out instead of failing the generation"""
+        orchestrator = make_orchestrator(pipeline_tests=True)
+        orchestrator.engineer.write_file = MagicMock(side_effect=lambda filename, *args, **kwargs: f"// {filename}")
+
+        def generate_file_tests(filename, code, user_prompt, llm=None):
+            if filename == "style.css":
+                raise RuntimeError("rate limited")
+            return f"test('{filename}', () => {{}});"
+
+        orchestrator.testsprite.generate_file_tests = generate_file_tests
+        result = orchestrator.generate_app("Build a site")
+
+        orchestrator.testsprite.generate_tests.assert_not_called()
+        assert "test('index.html'" in result["tests"]
+        assert '"style.css"' not in result["tests"]
+
+class TestStreamingPlan:
+    """Test starting files while the architect plan is still streaming"""
+
+    def make_streaming_orchestrator(self, content):
+        """Orchestrator whose architect streams content in small chunks."""
+        orchestrator = make_orchestrator(max_concurrency=4, stream_plan=True)
+        timeline = []
+
+        async def astream(messages):
+            for i in range(0, len(content), 8):
+                await asyncio.sleep(0.002)
+                yield MagicMock(content=content[i:i + 8])
+            timeline.append("plan complete")
+
+        async def awrite_file(filename, description, user_prompt, tech_stack, context="", on_token=None, llm=None):
+            timeline.append(f"start {filename}")
+            await asyncio.sleep(0.01)
+            return f"// {filename} ({tech_stack})"
+
+        orchestrator.architect_llm.astream = astream
+        orchestrator.engineer.awrite_file = awrite_file
+        return orchestrator, timeline
+
+    def test_first_file_starts_before_plan_completes(self):
+        """Test that engineering overlaps with planning and no file is written twice"""
+        content = '{"tech_stack": "React", "files": {"index.html": "Entry", "App.tsx": "Root", "app.css": "Styles"}}'
+        orchestrator, timeline = self.make_streaming_orchestrator(content)
+
+        result = asyncio.run(orchestrator.agenerate_app("Build a site"))
+
+        assert timeline.index("start index.html") < timeline.index("plan complete")
+        assert sorted(event for event in timeline if event.startswith("start")) == [
+            "start App.tsx", "start app.css", "start index.html"
+        ]
+        assert list(result["files"]) == ["index.html", "App.tsx", "app.css"]
+        assert result["files"]["App.tsx"] == "// App.tsx (React)"
+
+    def test_malformed_plan_drops_files_outside_default_plan(self):
+        """Test that a broken plan falls back and discards early files it does not contain"""
+        content = '{"tech_stack": "HTML + CSS + JS", "files": {"index.html": "Main HTML file", "extra.js": "Extra"} oops'
+        orchestrator, timeline = self.make_streaming_orchestrator(content)
+
+        async def collect():
+            return [event async for event in orchestrator.astream_app("Build a site")]
+
+        events = asyncio.run(collect())
+        result = events[-1]["result"]
+
+        assert [e["filename"] for e in events if e["event"] == "file_dropped"] == ["extra.js"]
+        assert list(result["files"]) == ["index.html", "style.css", "script.js"]
+        assert timeline.count("start index.html") == 1
+
+class TestStreaming:
+    """Test progress events from astream_app"""
+
+    def test_astream_app_emits_progress_events(self):
+        """Test that plan, per-file token deltas, statuses and the result are streamed"""
+        orchestrator = make_orchestrator(max_concurrency=1)
+
+        async def astream(messages):
+            for delta in ["<p>", "hi", "</p>"]:
+                yield MagicMock(content=delta)
+
+        orchestrator.engineer_llm.astream = astream
+
+        async def collect():
+            return [event async for event in orchestrator.astream_app("Build a site")]
+
+        events = asyncio.run(collect())
+        names = [event["event"] for event in events]
+
+        assert names[0] == "status"
+        assert names.index("plan") < names.index("file_start")
+        assert names[-1] == "done"
+
+        deltas = [e["delta"] for e in events if e["event"] == "file_delta" and e["filename"] == "index.html"]
+        assert deltas == ["<p>", "hi", "</p>"]
+
+        completed = [e["filename"] for e in events if e["event"] == "file_complete"]
+        assert completed == list(PLAN["files"].keys())
+
+        statuses = [e["status"] for e in events if e["event"] == "status"]
+        assert statuses == ["Starting", "Planning complete", "Code generation complete", "Tests generated"]
+
+        result = events[-1]["result"]
+        assert result["files"]["style.css"] == "<p>hi</p>"
+        assert result["tests"] == "test code"
+
+PREVIOUS_FILES = {
+    "index.html": "<html>old</html>",
+    "style.css": "body {}",
+    "script.js": "// old",
+    "about.html": "<p>about</p>"
+}
+
+class TestIncrementalRegeneration:
+    """Test regenerating only changed plan entries"""
+
+    def test_diff_plans(self):
+        """Test added, changed, unchanged and removed entries"""
+        new_plan = {
+            "tech_stack": "HTML/CSS/JS",
+            "files": {
+                "index.html": "Main HTML file",
+                "style.css": "Dark theme styling",
+                "script.js": "JavaScript logic",
+                "contact.html": "Contact page"
+            }
+        }
+        diff = diff_plans(PLAN, new_plan, PREVIOUS_FILES)
+
+        assert diff == {
+            "changed": ["style.css", "contact.html"],
+            "unchanged": ["index.html", "script.js"],
+            "removed": ["about.html"]
+        }
+
+    def test_tech_stack_change_rebuilds_everything(self):
+        """Test that a new tech stack invalidates every file"""
+        new_plan = dict(PLAN, tech_stack="React")
+        assert diff_plans(PLAN, new_plan, PREVIOUS_FILES)["changed"] == list(PLAN["files"])
+
+    def test_only_changed_files_are_regenerated(self):
+        """Test that one edited description costs one engineer call and a test rerun"""
+        orchestrator = make_orchestrator()
+        orchestrator.engineer.write_file = MagicMock(return_value="body { color: black; }")
+        edited = {"tech_stack": PLAN["tech_stack"], "files": dict(PLAN["files"], **{"style.css": "Dark theme"})}
+
+        result = orchestrator.regenerate_app("Build a site", PLAN, PREVIOUS_FILES, "old tests", file_plan=edited)
+
+        orchestrator.engineer.write_file.assert_called_once_with(
+            "style.css", "Dark theme", "Build a site", "HTML/CSS/JS", context="", llm=orchestrator.engineer_llm
+        )
+        orchestrator.architect.plan.assert_not_called()
+        assert result["regenerated"] == ["style.css"]
+        assert result["carried_over"] == ["index.html", "script.js", "about.html"]
+        assert result["files"]["index.html"] == "<html>old</html>"
+        assert result["files"]["style.css"] == "body { color: black; }"
+        assert result["tests_regenerated"] is True
+        assert orchestrator.vfs.read_file("script.js") == "// old"
+
+    def test_unchanged_plan_reuses_tests(self):
+        """Test that an identical re-plan makes no engineer or TestSprite calls"""
+        orchestrator = make_orchestrator()
+        orchestrator.engineer.awrite_file = AsyncMock()
+
+        result = asyncio.run(orchestrator.aregenerate_app("Build a site!", PLAN, PREVIOUS_FILES, "old tests"))
+
+        orchestrator.architect.aplan.assert_awaited_once_with("Build a site!", llm=orchestrator.architect_llm)
+        orchestrator.engineer.awrite_file.assert_not_awaited()
+        orchestrator.testsprite.agenerate_tests.assert_not_awaited()
+        assert result["files"] == PREVIOUS_FILES
+        assert result["tests"] == "old tests"
+        assert result["tests_regenerated"] is False
+
+class TestCheckpointing:
+    """Test checkpointed, resumable generations"""
+
+    def test_failed_run_resumes_without_repeating_work(self):
+        """Test that a run failing in TestSprite resumes with no architect or engineer calls"""
+        orchestrator = make_orchestrator()
+        orchestrator.engineer.awrite_file = AsyncMock(side_effect=lambda filename, *args, **kwargs: f"// {filename}")
+        orchestrator.testsprite.agenerate_tests = AsyncMock(side_effect=RuntimeError("provider down"))
+
+        with pytest.raises(GenerationFailed) as failure:
+            asyncio.run(orchestrator.agenerate_app("Build a site"))
+        assert failure.value.project_id == orchestrator.project_id
+
+        resumed = make_orchestrator(project_id=orchestrator.project_id)
+        resumed.engineer.awrite_file = AsyncMock()
+        result = asyncio.run(resumed.aresume_app())
+
+        resumed.architect.aplan.assert_not_awaited()
+        resumed.engineer.awrite_file.assert_not_awaited()
+        assert result["tests"] == "test code"
+        assert list(result["files"]) == list(PLAN["files"])
+        assert resumed.vfs.read_file("index.html") == "// index.html"
+        # Finished cleanly, so nothing is left to resume
+        assert asyncio.run(make_orchestrator(project_id=orchestrator.project_id).aresume_app()) is None
+
+    def test_interrupted_engineer_resumes_missing_files_only(self):
+        """Test that files checkpointed before a crash are not written again"""
+        orchestrator = make_orchestrator(max_concurrency=4)
+
+        async def awrite_file(filename, description, user_prompt, tech_stack, context="", on_token=None, llm=None):
+            if filename in ("script.js", "about.html"):
+                await asyncio.sleep(10)
+            return f"// {filename}"
+
+        orchestrator.engineer.awrite_file = awrite_file
+
+        async def crash():
+            run = asyncio.create_task(orchestrator.agenerate_app("Build a site"))
+            await asyncio.sleep(0.2)
+            run.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await run
+
+        asyncio.run(crash())
+
+        resumed = make_orchestrator(project_id=orchestrator.project_id)
+        resumed.engineer.awrite_file = AsyncMock(side_effect=lambda filename, *args, **kwargs: f"// new {filename}")
+        result = asyncio.run(resumed.aresume_app())
+
+        rewritten = sorted(call.args[0] for call in resumed.engineer.awrite_file.await_args_list)
+        assert rewritten == ["about.html", "script.js"]
+        assert result["files"]["index.html"] == "// index.html"
+        assert result["files"]["script.js"] == "// new script.js"
+        assert list(result["files"]) == list(PLAN["files"])
+
+    def test_file_errors_are_retried_on_resume(self):
+        """Test that a run that finished with failed files re-writes only those"""
+        orchestrator = make_orchestrator()
+
+        def write_file(filename, description, user_prompt, tech_stack, context="", llm=None):
+            if filename == "style.css":
+                raise RuntimeError("timeout")
+            return f"// {filename}"
+
+        orchestrator.engineer.write_file = write_file
+        result = orchestrator.generate_app("Build a site")
+        assert result["errors"] == {"style.css": "timeout"}
+
+        resumed = make_orchestrator(project_id=orchestrator.project_id)
+        resumed.engineer.awrite_file = AsyncMock(return_value="body {}")
+        result = asyncio.run(resumed.aresume_app())
+
+        resumed.engineer.awrite_file.assert_awaited_once()
+        assert resumed.engineer.awrite_file.await_args.args[0] == "style.css"
+        assert result["errors"] == {}
+        assert result["files"]["style.css"] == "body {}"
+        resumed.testsprite.agenerate_tests.assert_awaited_once()
+
+    def test_unknown_project_has_nothing_to_resume(self):
+        """Test resuming a project ID without checkpoints"""
+        assert asyncio.run(make_orchestrator(project_id="missing").aresume_app()) is None
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,219 @@
+"""
+Tests for per-provider rate limiting, AIMD concurrency and retries
+"""
+import asyncio
+import threading
+import time
+import httpx
+import pytest
+from unittest.mock import MagicMock, patch
+from langchain_openai import ChatOpenAI
+from api_config import APIConfigManager
+from fake_llm_server import FakeLLMConfig, create_app
+from rate_limit import RateLimiter, RateLimiterRegistry, classify_error, retry_after_seconds
+
+
+class StatusError(Exception):
+    """Provider error carrying an HTTP response, like openai.APIStatusError."""
+
+    def __init__(self, status: int, headers: dict = None):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = httpx.Response(status, headers=headers or {})
+
+class APIConnectionError(Exception):
+    """Stand-in matched by name, like openai.APIConnectionError."""
+
+class TestErrorClassification:
+    """Test which errors are retried and how long to wait"""
+
+    def test_classify(self):
+        """Test 429s, transient errors and permanent errors"""
+        assert classify_error(StatusError(429)) == "rate_limited"
+        assert classify_error(StatusError(503)) == "transient"
+        assert classify_error(StatusError(408)) == "transient"
+        assert classify_error(APIConnectionError()) == "transient"
+        assert classify_error(httpx.ConnectError("refused")) == "transient"
+        assert classify_error(StatusError(401)) is None
+        assert classify_error(ValueError("bad plan")) is None
+
+    def test_retry_after(self):
+        """Test seconds, milliseconds and HTTP-date Retry-After values"""
+        assert retry_after_seconds(StatusError(429, {"Retry-After": "2"})) == 2.0
+        assert retry_after_seconds(StatusError(429, {"retry-after-ms": "250"})) == 0.25
+        assert retry_after_seconds(StatusError(429, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+        assert retry_after_seconds(StatusError(429)) is None
+        assert retry_after_seconds(ValueError()) is None
+
+class TestRateLimiter:
+    """Test the token bucket, AIMD window and retries"""
+
+    def test_token_bucket_paces_after_burst(self):
+        """Test that calls beyond the burst wait for tokens"""
+        limiter = RateLimiter(rate=20, burst=2, initial_concurrency=10)
+        start = time.monotonic()
+        for _ in range(4):
+            limiter.run(lambda: None)
+        # Two tokens up front, then one every 50ms
+        assert time.monotonic() - start >= 0.09
+
+    def test_window_caps_threads_in_flight(self):
+        """Test that the concurrency window holds threads back"""
+        limiter = RateLimiter(rate=1000, burst=100, initial_concurrency=2, max_concurrency=2)
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                peak.append(limiter.in_flight)
+            time.sleep(0.02)
+
+        threads = [threading.Thread(target=limiter.run, args=(call,)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert max(peak) == 2
+        assert limiter.in_flight == 0
+
+    def test_window_caps_async_calls(self):
+        """Test the window on the event loop, including cancelled waiters"""
+        limiter = RateLimiter(rate=1000, burst=100, initial_concurrency=2, max_concurrency=2)
+        peak = []
+
+        async def call():
+            peak.append(limiter.in_flight)
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        async def run():
+            waiting = asyncio.create_task(limiter.arun(call))
+            results = asyncio.gather(*(limiter.arun(call) for _ in range(5)))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            return await results
+
+        assert asyncio.run(run()) == ["ok"] * 5
+        assert max(peak) == 2
+        assert limiter.in_flight == 0
+
+    def test_additive_increase_only_when_window_is_used(self):
+        """Test that the window grows only while it is the bottleneck"""
+        limiter = RateLimiter(rate=1000, burst=100, initial_concurrency=1, max_concurrency=4)
+        for _ in range(3):
+            limiter.run(lambda: None)
+        # 1 -> 2 on the first full-window success; sequential calls never fill a window of 2
+        assert limiter.limit == 2
+
+        idle = RateLimiter(rate=1000, burst=100, initial_concurrency=4, max_concurrency=8)
+        idle.run(lambda: None)
+        assert idle.limit == 4
+
+    def test_rate_limit_halves_window_and_retries_after_pause(self):
+        """Test multiplicative decrease and that Retry-After is honoured"""
+        limiter = RateLimiter(rate=1000, burst=100, initial_concurrency=8, max_retries=2)
+        call = MagicMock(side_effect=[StatusError(429, {"Retry-After": "0.1"}), "done"])
+
+        start = time.monotonic()
+        assert limiter.run(call) == "done"
+
+        assert time.monotonic() - start >= 0.1
+        assert limiter.limit == 4
+        stats = limiter.stats()
+        assert stats["rate_limited"] == 1 and stats["retries"] == 1
+
+    def test_concurrent_429s_decrease_once(self):
+        """Test that one burst of 429s does not collapse the window"""
+        limiter = RateLimiter(rate=1000, burst=100, initial_concurrency=16, max_retries=0)
+        for _ in range(4):
+            with pytest.raises(StatusError):
+                limiter.run(MagicMock(side_effect=StatusError(429)))
+        assert limiter.limit == 8
+
+    def test_latency_above_target_shrinks_window(self):
+        """Test the latency signal"""
+        limiter = RateLimiter(rate=1000, burst=100, initial_concurrency=10, latency_target=0.01)
+        limiter.run(lambda: time.sleep(0.03))
+        assert limiter.limit == 9
+
+    def test_gives_up_after_max_retries(self):
+        """Test that retries are bounded and permanent errors are not retried"""
+        limiter = RateLimiter(rate=1000, burst=100, max_retries=2)
+        failing = MagicMock(side_effect=StatusError(503))
+        with patch("rate_limit.time.sleep"):
+            with pytest.raises(StatusError):
+                limiter.run(failing)
+        assert failing.call_count == 3
+
+        permanent = MagicMock(side_effect=StatusError(401))
+        with pytest.raises(StatusError):
+            limiter.run(permanent)
+        assert permanent.call_count == 1
+        assert limiter.in_flight == 0
+        # Both calls failed, whether or not they were retried
+        assert limiter.stats()["failures"] == 2
+
+    def test_can_retry_stops_retries(self):
+        """Test that a partially streamed call is not retried"""
+        limiter = RateLimiter(rate=1000, burst=100)
+        call = MagicMock(side_effect=StatusError(503))
+        with pytest.raises(StatusError):
+            limiter.run(call, can_retry=lambda: False)
+        assert call.call_count == 1
+
+class TestRegistry:
+    """Test per-provider-key limiter lookup"""
+
+    def test_limiters_are_per_key(self):
+        """Test lookup through LLM metadata"""
+        registry = RateLimiterRegistry()
+        llm_a = MagicMock(metadata={"rate_limit_key": "openai:api.openai.com:aaa"})
+        llm_b = MagicMock(metadata={"rate_limit_key": "openai:api.openai.com:bbb"})
+
+        assert registry.for_llm(llm_a) is registry.for_llm(llm_a)
+        assert registry.for_llm(llm_a) is not registry.for_llm(llm_b)
+        assert registry.for_llm(MagicMock()) is None
+        assert registry.run(MagicMock(), lambda: "unlimited") == "unlimited"
+
+    def test_idle_limiters_are_evicted(self):
+        """Test the registry bound"""
+        registry = RateLimiterRegistry(max_size=2)
+        for key in ("a", "b", "c"):
+            registry.get(key)
+        assert list(registry.stats()) == ["b", "c"]
+
+    def test_api_config_tags_llms(self):
+        """Test that pooled LLMs carry their limiter key and leave retries to it"""
+        manager = APIConfigManager()
+        llm = manager.get_llm("user_project", "sk-secret-key", "openrouter", temperature=0.3)
+
+        key = llm.metadata["rate_limit_key"]
+        assert key.startswith("openrouter:openrouter.ai:")
+        assert "sk-secret-key" not in key
+        assert llm.max_retries == 0
+        assert key != manager.get_llm("user_project", "sk-other-key", "openrouter", temperature=0.3).metadata["rate_limit_key"]
+
+class TestAgainstFakeServer:
+    """Test the limiter against a provider that enforces a concurrency ceiling"""
+
+    def test_burst_beyond_provider_ceiling_completes(self):
+        """Test that 429s shrink the window and every call eventually succeeds"""
+        app = create_app(FakeLLMConfig(latency="fixed:0.05", max_concurrency=2, retry_after=0.05))
+        llm = ChatOpenAI(
+            model="fake-gpt",
+            openai_api_key="sk-fake",
+            openai_api_base="http://fake-llm/v1",
+            max_retries=0,
+            http_async_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+        )
+        limiter = RateLimiter(rate=1000, burst=100, initial_concurrency=8, max_retries=8)
+
+        async def run():
+            return await asyncio.gather(*(limiter.arun(lambda: llm.ainvoke("hi")) for _ in range(12)))
+
+        results = asyncio.run(run())
+
+        assert len(results) == 12
+        assert app.state.stats["rate_limited"] > 0
+        assert limiter.limit < 8
@@ -0,0 +1,114 @@
+"""
+Tests for dependency-aware wave scheduling
+"""
+import pytest
+from scheduling import (
+    MAX_SUMMARY_CHARS,
+    dependency_context,
+    plan_dependencies,
+    summarize_interface,
+    topological_waves
+)
+
+class TestTopologicalWaves:
+    """Test grouping files into parallel waves"""
+
+    def test_independent_files_form_one_wave(self):
+        """Test that a plan without dependencies is fully parallel"""
+        assert topological_waves(["a", "b", "c"], {}) == [["a", "b", "c"]]
+
+    def test_dependencies_are_generated_first(self):
+        """Test that each file waits for the files it uses, keeping plan order"""
+        dependencies = {"index.html": ["app.js", "style.css"], "app.js": ["utils.js"]}
+        waves = topological_waves(["index.html", "app.js", "style.css", "utils.js"], dependencies)
+
+        assert waves == [["style.css", "utils.js"], ["app.js"], ["index.html"]]
+
+    def test_outside_dependencies_are_satisfied(self):
+        """Test that dependencies not being generated do not block"""
+        assert topological_waves(["app.js"], {"app.js": ["utils.js"]}) == [["app.js"]]
+
+    def test_cycles_are_generated_together(self):
+        """Test that a cycle does not stall generation"""
+        waves = topological_waves(["a", "b", "c"], {"a": ["b"], "b": ["a"], "c": []})
+        assert waves == [["c"], ["a", "b"]]
+
+class TestPlanDependencies:
+    """Test reading the optional dependencies map"""
+
+    def test_invalid_entries_are_dropped(self):
+        """Test that unknown files, self-references and bad shapes are ignored"""
+        plan = {
+            "files": {"index.html": "Page", "app.js": "Logic"},
+            "dependencies": {
+                "index.html": ["app.js", {"file": "app.js"}, ["app.js"], "missing.js", "index.html"],
+                "app.js": "index.html",
+                "x.js": ["app.js"]
+            }
+        }
+        assert plan_dependencies(plan) == {"index.html": ["app.js"]}
+
+    def test_missing_dependencies(self):
+        """Test that plans without dependencies still work"""
+        assert plan_dependencies({"files": {"a.js": "A"}}) == {}
+        assert plan_dependencies({"files": {"a.js": "A"}, "dependencies": ["a.js"]}) == {}
+
+class TestInterfaceSummaries:
+    """Test compact interface extraction"""
+
+    def test_script_exports_and_components(self):
+        """Test that exports and component names are listed, not the source"""
+        code = """
+import React from 'react';
+export const API_URL = '/api';
+export function formatDate(date) { return date.toISOString(); }
+function Header() { return <header className="site-header dark" />; }
+const TodoList = ({ items }) => items.map(item => <li>{item}</li>);
+export default TodoList;
+"""
+        summary = summarize_interface("App.jsx", code)
+
+        assert summary.startswith("App.jsx:")
+        assert "exports: API_URL, formatDate, TodoList" in summary
+        assert "components: Header, TodoList" in summary
+        assert "site-header" in summary
+        assert "toISOString" not in summary
+
+    def test_commonjs_exports(self):
+        """Test module.exports objects and assignments"""
+        summary = summarize_interface("utils.js", "exports.add = (a, b) => a + b;\nmodule.exports = { sub, mul: multiply };")
+        assert "exports: add, sub, mul" in summary
+
+    def test_stylesheet(self):
+        """Test that CSS classes, IDs and variables are listed"""
+        code = ":root { --primary: #333; }\n.btn, .btn-primary:hover { color: var(--primary); }\n#app { margin: 0; }"
+        summary = summarize_interface("style.css", code)
+
+        assert "classes: btn, btn-primary" in summary
+        assert "ids: app" in summary
+        assert "variables: --primary" in summary
+
+    def test_markup(self):
+        """Test that HTML IDs, classes and assets are listed"""
+        code = '<div id="root" class="container main"></div><script src="app.js"></script><link href="style.css">'
+        summary = summarize_interface("index.html", code)
+
+        assert "ids: root" in summary
+        assert "classes: container, main" in summary
+        assert "assets: app.js, style.css" in summary
+
+    def test_summary_is_bounded(self):
+        """Test that huge files still produce short summaries"""
+        code = "\n".join(f"export const value{i} = {i};" for i in range(1000))
+        assert len(summarize_interface("big.js", code)) <= MAX_SUMMARY_CHARS
+
+    def test_dependency_context(self):
+        """Test joining summaries of finished dependencies only"""
+        summaries = {"a.js": "a.js:\n  exports: a", "b.css": "b.css:\n  classes: b"}
+        context = dependency_context("index.html", {"index.html": ["a.js", "b.css", "c.js"]}, summaries)
+
+        assert context == "a.js:\n  exports: a\nb.css:\n  classes: b"
+        assert dependency_context("a.js", {}, summaries) == ""
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
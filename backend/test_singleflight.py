@@ -0,0 +1,221 @@
+"""
+Tests for single-flight coalescing of identical concurrent calls
+"""
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from agents.architect import ArchitectAgent
+from agents.engineer import EngineerAgent
+from metrics import llm_calls_saved, track_llm_call
+from singleflight import SingleFlight
+
+
+class TestSyncFlights:
+    """Test coalescing across threads"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that overlapping callers get the leader's result"""
+        flights = SingleFlight("test_sync")
+        calls = []
+        release = threading.Event()
+
+        def work():
+            calls.append(1)
+            release.wait()
+            return "shared"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do("k", work))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == ["shared"] * 4
+        assert len(calls) == 1
+        assert flights.stats() == {"in_flight": 0, "executions": 1, "coalesced": 3, "llm_calls_saved": 0}
+
+    def test_errors_are_shared_and_not_remembered(self):
+        """Test that followers see the leader's error and later calls run again"""
+        flights = SingleFlight("test_sync_error")
+        release = threading.Event()
+        errors = []
+
+        def fail():
+            release.wait()
+            raise ValueError("boom")
+
+        def call():
+            try:
+                flights.do("k", fail)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(errors) == 3
+        assert flights.do("k", lambda: "fresh") == "fresh"
+
+    def test_interrupted_leader_fails_followers(self):
+        """Test that a leader stopped by a BaseException does not hand followers None"""
+        flights = SingleFlight("test_sync_interrupt")
+        release = threading.Event()
+        outcomes = []
+
+        def interrupted():
+            release.wait()
+            raise KeyboardInterrupt
+
+        def call():
+            try:
+                outcomes.append(flights.do("k", interrupted))
+            except BaseException as e:
+                outcomes.append(type(e))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(outcome.__name__ for outcome in outcomes) == ["KeyboardInterrupt", "RuntimeError", "RuntimeError"]
+
+class TestAsyncFlights:
+    """Test coalescing on the event loop"""
+
+    def test_identical_calls_coalesce_distinct_keys_do_not(self):
+        """Test that only calls with the same key are merged"""
+        flights = SingleFlight("test_async")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return "done"
+
+        async def run():
+            return await asyncio.gather(
+                flights.ado("a", work), flights.ado("a", work), flights.ado("b", work)
+            )
+
+        assert asyncio.run(run()) == ["done"] * 3
+        assert len(calls) == 2
+        assert flights.stats()["coalesced"] == 1
+        assert flights.stats()["in_flight"] == 0
+
+    def test_cancelled_caller_does_not_cancel_others(self):
+        """Test that the shared work survives until its last caller leaves"""
+        flights = SingleFlight("test_cancel")
+        finished = []
+
+        async def work():
+            await asyncio.sleep(0.05)
+            finished.append(1)
+            return "done"
+
+        async def run():
+            first = asyncio.create_task(flights.ado("k", work))
+            second = asyncio.create_task(flights.ado("k", work))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            result = await second
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            return result
+
+        assert asyncio.run(run()) == "done"
+        assert finished == [1]
+
+    def test_abandoned_work_is_cancelled(self):
+        """Test that the execution stops once every caller is cancelled"""
+        flights = SingleFlight("test_abandon")
+        finished = []
+
+        async def work():
+            await asyncio.sleep(0.05)
+            finished.append(1)
+
+        async def run():
+            caller = asyncio.create_task(flights.ado("k", work))
+            await asyncio.sleep(0.01)
+            caller.cancel()
+            await asyncio.sleep(0.08)
+
+        asyncio.run(run())
+        assert finished == []
+        assert flights.stats()["in_flight"] == 0
+
+    def test_followers_are_credited_with_saved_llm_calls(self):
+        """Test the LLM-calls-saved counter"""
+        flights = SingleFlight("test_saved")
+        llm = MagicMock(openai_api_base=None)
+
+        async def work():
+            for _ in range(2):
+                with track_llm_call(llm, "test"):
+                    await asyncio.sleep(0.01)
+            return "done"
+
+        async def run():
+            return await asyncio.gather(*(flights.ado("k", work) for _ in range(3)))
+
+        asyncio.run(run())
+        assert llm_calls_saved.value(operation="test_saved") == 4
+
+class TestAgentFlights:
+    """Test that the agents coalesce identical plans and files"""
+
+    def test_concurrent_identical_plans_make_one_call(self):
+        """Test that plans for the same prompt and LLM share one call"""
+        agent = ArchitectAgent(use_cache=False)
+        llm = MagicMock()
+
+        async def reply(messages):
+            await asyncio.sleep(0.02)
+            return MagicMock(content='{"tech_stack": "Vue", "files": {"App.vue": "Root"}}', usage_metadata=None)
+
+        llm.ainvoke = AsyncMock(side_effect=reply)
+
+        async def run():
+            return await asyncio.gather(
+                agent.aplan("Create a todo app", llm=llm), agent.aplan("create a  TODO app", llm=llm)
+            )
+
+        first, second = asyncio.run(run())
+        assert first["files"] == second["files"] == {"App.vue": "Root"}
+        assert llm.ainvoke.await_count == 1
+
+    def test_follower_gets_the_file_as_one_delta(self):
+        """Test that a streaming caller that joins a write gets the whole file once"""
+        agent = EngineerAgent(use_cache=False)
+        llm = MagicMock()
+
+        async def stream(messages):
+            for part in ("print(", "1)"):
+                await asyncio.sleep(0.01)
+                yield MagicMock(content=part, usage_metadata=None)
+
+        llm.astream = stream
+        leader_tokens, follower_tokens = [], []
+
+        async def run():
+            return await asyncio.gather(
+                agent.awrite_file("main.py", "Entry", "app", "Python", on_token=leader_tokens.append, llm=llm),
+                agent.awrite_file("main.py", "Entry", "app", "Python", on_token=follower_tokens.append, llm=llm)
+            )
+
+        assert asyncio.run(run()) == ["print(1)", "print(1)"]
+        assert leader_tokens == ["print(", "1)"]
+        assert follower_tokens == ["print(1)"]
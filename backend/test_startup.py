@@ -0,0 +1,71 @@
+"""
+Test suite for CodeGenesis backend startup cost
+"""
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cumulative "import main" budget; the LLM stack alone used to cost over a second
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1000"))
+
+LLM_MODULES = ("langgraph", "langchain_core", "langchain_openai", "orchestrator", "agents")
+
+
+def run_python(code: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+
+
+def loaded_llm_modules(code: str) -> list:
+    """Run code in a fresh interpreter and report which LLM-stack modules it loaded."""
+    probe = (
+        f"{code}\n"
+        "import sys\n"
+        f"print(sorted(m for m in sys.modules if m.split('.')[0] in {LLM_MODULES!r}))"
+    )
+    result = run_python(probe)
+    assert result.returncode == 0, result.stderr
+    return eval(result.stdout.strip().splitlines()[-1])
+
+
+class TestStartup:
+    """Test that the app starts without loading the LLM stack"""
+
+    def test_import_time_within_budget(self):
+        """Test cumulative import time of main stays within budget"""
+        result = run_python("import main", "-X", "importtime")
+        assert result.returncode == 0, result.stderr
+
+        match = re.search(r"^import time:\s+\d+ \|\s+(\d+) \| main$", result.stderr, re.MULTILINE)
+        assert match is not None
+        cumulative_ms = int(match.group(1)) / 1000
+        assert cumulative_ms < IMPORT_BUDGET_MS, f"import main took {cumulative_ms:.0f}ms"
+
+    def test_import_does_not_load_llm_stack(self):
+        """Test importing main leaves langgraph and langchain unloaded"""
+        assert loaded_llm_modules("import main") == []
+
+    def test_health_check_does_not_load_llm_stack(self):
+        """Test /api/health answers without loading the LLM stack"""
+        code = (
+            "from fastapi.testclient import TestClient\n"
+            "from main import app\n"
+            "assert TestClient(app).get('/api/health').status_code == 200"
+        )
+        assert loaded_llm_modules(code) == []
+
+    def test_generation_loads_orchestrator_on_demand(self):
+        """Test the orchestrator is still importable once a handler needs it"""
+        code = (
+            "import main\n"
+            "from orchestrator import CodeGenesisOrchestrator"
+        )
+        assert "langgraph" in loaded_llm_modules(code)
@@ -0,0 +1,248 @@
+"""
+Tests for the content-addressed virtual file system
+"""
+import gc
+import io
+import mmap
+import os
+import zipfile
+import pytest
+from archive import stream_zip
+from vfs import BlobStore, PackStore, ProjectRegistry, VirtualFileSystem
+
+class TestVirtualFileSystem:
+    """Test the basic file API"""
+
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.vfs = VirtualFileSystem(BlobStore())
+
+    def test_write_read_list_delete(self):
+        """Test the file API used by the orchestrator"""
+        self.vfs.write_file("index.html", "<html></html>")
+        self.vfs.write_file("style.css", "body {}")
+
+        assert self.vfs.read_file("index.html") == "<html></html>"
+        assert self.vfs.list_files() == ["index.html", "style.css"]
+        assert self.vfs.delete_file("style.css") is True
+        assert self.vfs.delete_file("style.css") is False
+        assert self.vfs.read_file("missing.js") is None
+
+    def test_get_all_files_is_read_only(self):
+        """Test that get_all_files returns a view that later writes do not affect"""
+        self.vfs.write_file("index.html", "v1")
+        files = self.vfs.get_all_files()
+        self.vfs.write_file("index.html", "v2")
+
+        assert dict(files) == {"index.html": "v1"}
+        with pytest.raises(TypeError):
+            files["index.html"] = "hacked"
+
+class TestContentAddressing:
+    """Test deduplication and copy-on-write snapshots"""
+
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.store = BlobStore()
+
+    def test_identical_content_is_stored_once_across_projects(self):
+        """Test that boilerplate shared by many projects is one blob"""
+        projects = [VirtualFileSystem(self.store) for _ in range(100)]
+        for vfs in projects:
+            vfs.write_file("index.html", "<!DOCTYPE html>" * 100)
+
+        assert self.store.stats() == {"blobs": 1, "bytes": 1500}
+        assert projects[0].memory_usage()["logical_bytes"] == 1500
+
+    def test_unreferenced_blobs_are_released(self):
+        """Test that blobs disappear once no project uses them"""
+        vfs = VirtualFileSystem(self.store)
+        vfs.write_file("a.js", "one")
+        vfs.write_file("a.js", "two")
+        gc.collect()
+
+        assert self.store.stats()["blobs"] == 1
+
+    def test_snapshots_are_copy_on_write(self):
+        """Test that a snapshot is unaffected by later writes and can be restored"""
+        vfs = VirtualFileSystem(self.store)
+        vfs.write_file("index.html", "v1")
+        vfs.write_file("style.css", "body {}")
+        first = vfs.snapshot()
+        paths_before = vfs._paths
+
+        vfs.write_file("index.html", "v2")
+        vfs.delete_file("style.css")
+
+        assert vfs._paths is not paths_before
+        assert first.read_file("index.html") == "v1"
+        assert first.list_files() == ["index.html", "style.css"]
+        assert vfs.read_file("index.html") == "v2"
+
+        vfs.restore(first)
+        assert dict(vfs.files) == {"index.html": "v1", "style.css": "body {}"}
+        assert first.revision == 1 and vfs.memory_usage()["revisions"] == 1
+
+    def test_snapshot_does_not_copy(self):
+        """Test that taking a snapshot shares the path map until the next write"""
+        vfs = VirtualFileSystem(self.store)
+        vfs.write_file("index.html", "v1")
+        snapshot = vfs.snapshot()
+
+        assert snapshot._paths is vfs._paths
+
+class TestPackStorage:
+    """Test the disk-backed, memory-mapped storage tier"""
+
+    @pytest.fixture(autouse=True)
+    def pack_path(self, tmp_path):
+        """Per-test pack file"""
+        self.path = str(tmp_path / "project.pack")
+
+    def test_files_survive_reopening(self):
+        """Test that a new VFS over the same pack sees the latest writes and deletes"""
+        vfs = VirtualFileSystem(PackStore(self.path))
+        vfs.write_file("index.html", "v1")
+        vfs.write_file("style.css", "body {}")
+        vfs.write_file("index.html", "v2")
+        vfs.delete_file("style.css")
+        vfs.store.close()
+
+        reopened = VirtualFileSystem(PackStore(self.path))
+        assert reopened.list_files() == ["index.html"]
+        assert reopened.read_file("index.html") == "v2"
+
+    def test_reads_are_zero_copy_slices(self):
+        """Test that read_bytes returns a view of the mapped pack file"""
+        vfs = VirtualFileSystem(PackStore(self.path))
+        vfs.write_file("app.js", "console.log('é');")
+
+        view = vfs.read_bytes("app.js")
+        assert isinstance(view, memoryview)
+        assert isinstance(view.obj, mmap.mmap)
+        assert bytes(view).decode("utf-8") == "console.log('é');"
+
+    def test_identical_content_is_written_once(self):
+        """Test that duplicate content is recorded as a reference, not copied"""
+        vfs = VirtualFileSystem(PackStore(self.path))
+        vfs.write_file("a.js", "x" * 10000)
+        size = vfs.store.size_bytes()
+        vfs.write_file("b.js", "x" * 10000)
+
+        assert vfs.store.size_bytes() - size < 200
+        assert vfs.read_file("b.js") == "x" * 10000
+
+    def test_torn_record_is_truncated(self):
+        """Test that a partially written trailing record is dropped on load"""
+        vfs = VirtualFileSystem(PackStore(self.path))
+        vfs.write_file("index.html", "ok")
+        vfs.store.close()
+        with open(self.path, "ab") as f:
+            f.write(b'{"path": "broken.js", "digest": "x", "size": 100}\npartial')
+        size = os.path.getsize(self.path)
+
+        store = PackStore(self.path)
+        assert list(store.load()) == ["index.html"]
+        assert store.size_bytes() < size
+
+        VirtualFileSystem(store).write_file("next.js", "after")
+        assert VirtualFileSystem(PackStore(self.path)).list_files() == ["index.html", "next.js"]
+
+    def test_evict_and_reload(self):
+        """Test that an evicted project drops its path map and reloads on access"""
+        vfs = VirtualFileSystem(PackStore(self.path))
+        vfs.write_file("index.html", "<html></html>")
+        snapshot = vfs.snapshot()
+
+        assert vfs.evict() is True
+        assert not vfs.resident and not vfs.store.loaded
+        assert vfs.read_file("index.html") == "<html></html>"
+        assert snapshot.read_file("index.html") == "<html></html>"
+        assert VirtualFileSystem(BlobStore()).evict() is False
+
+    def test_restore_is_persisted(self):
+        """Test that restoring a snapshot is reflected in the pack"""
+        vfs = VirtualFileSystem(PackStore(self.path))
+        vfs.write_file("index.html", "v1")
+        first = vfs.snapshot()
+        vfs.write_file("index.html", "v2")
+        vfs.write_file("extra.js", "x")
+        vfs.restore(first)
+        vfs.store.close()
+
+        assert dict(VirtualFileSystem(PackStore(self.path)).files) == {"index.html": "v1"}
+
+    def test_archive_from_pack(self):
+        """Test that archives stream pack-backed files"""
+        vfs = VirtualFileSystem(PackStore(self.path))
+        vfs.write_file("index.html", "<html></html>")
+
+        data = b"".join(stream_zip(vfs.get_all_files()))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.read("index.html") == b"<html></html>"
+
+class TestProjectRegistry:
+    """Test project lookup and cold-project eviction"""
+
+    def test_cold_projects_are_evicted_and_reloaded(self, tmp_path):
+        """Test that only max_resident projects stay in RAM"""
+        registry = ProjectRegistry(max_projects=10, max_resident=2, storage_dir=str(tmp_path))
+        for i in range(4):
+            vfs = registry.create(f"p{i}")
+            vfs.write_file("index.html", f"project {i}")
+            registry.register(f"p{i}", vfs)
+
+        assert registry.stats() == {"projects": 4, "resident": 2, "storage": "pack"}
+        assert registry.get("p0").read_file("index.html") == "project 0"
+        assert registry.stats()["resident"] <= 3
+
+    def test_projects_are_reopened_from_disk(self, tmp_path):
+        """Test that a project dropped from the registry is found again by its pack"""
+        registry = ProjectRegistry(max_projects=1, storage_dir=str(tmp_path))
+        for project_id in ("first", "second"):
+            vfs = registry.create(project_id)
+            vfs.write_file("index.html", project_id)
+            registry.register(project_id, vfs)
+
+        assert len(registry) == 1
+        assert registry.get("first").read_file("index.html") == "first"
+        assert registry.get("../first") is None
+        assert ProjectRegistry(storage_dir=str(tmp_path)).get("second").read_file("index.html") == "second"
+
+    def test_one_pack_writer_per_project(self, tmp_path):
+        """Test that a resumed project shares the open pack instead of appending from a second store"""
+        registry = ProjectRegistry(storage_dir=str(tmp_path))
+        first = registry.create("p")
+        first.write_file("a.js", "// first")
+        registry.register("p", first)
+
+        second = registry.create("p")
+        assert second.store is first.store
+        second.write_file("b.js", "// second")
+        first.write_file("c.js", "// third")
+
+        reopened = ProjectRegistry(storage_dir=str(tmp_path)).get("p")
+        assert [reopened.read_file(path) for path in ("a.js", "b.js", "c.js")] == ["// first", "// second", "// third"]
+
+    def test_pack_offsets_follow_the_file(self, tmp_path):
+        """Test that offsets come from where the append landed, even with another writer"""
+        path = str(tmp_path / "p.pack")
+        one, two = PackStore(path), PackStore(path)
+        one.put("a.js", "aaa")
+        blob = two.put("b.js", "bbbb")
+        other = one.put("c.js", "cc")
+
+        assert bytes(blob.view()) == b"bbbb"
+        assert bytes(other.view()) == b"cc"
+
+    def test_memory_storage(self):
+        """Test that without a storage dir projects stay in memory"""
+        registry = ProjectRegistry(max_projects=1)
+        registry.register("a", registry.create("a"))
+        registry.register("b", registry.create("b"))
+
+        assert registry.get("a") is None
+        assert registry.stats()["storage"] == "memory"
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,34 +1,513 @@
-from typing import Dict, Optional
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Union
+
+
+class Blob:
+    """Immutable file content, addressed by its sha256 digest."""
+    __slots__ = ("digest", "data", "size", "__weakref__")
+
+    def __init__(self, digest: str, data: str, size: int):
+        self.digest = digest
+        self.data = data
+        self.size = size
+
+    def view(self) -> memoryview:
+        return memoryview(self.data.encode("utf-8"))
+
+
+class BlobStore:
+    """
+    Process-wide content-addressed blob store.
+
+    Identical content written by any project is stored once. Blobs are held
+    weakly, so content disappears as soon as no file system or snapshot uses it.
+    """
+    persistent = False
 
-class VirtualFileSystem:
-    """In-memory file system for storing generated code."""
-    
     def __init__(self):
-        self.files: Dict[str, str] = {}
-    
+        self._blobs: "weakref.WeakValueDictionary[str, Blob]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def intern(self, content: str) -> Blob:
+        """Return the shared blob for content, creating it if needed."""
+        encoded = content.encode("utf-8")
+        digest = hashlib.sha256(encoded).hexdigest()
+        with self._lock:
+            blob = self._blobs.get(digest)
+            if blob is None:
+                blob = Blob(digest, content, len(encoded))
+                self._blobs[digest] = blob
+            return blob
+
+    def stats(self) -> dict:
+        """Number of live blobs and their total size in bytes."""
+        with self._lock:
+            blobs = list(self._blobs.values())
+        return {"blobs": len(blobs), "bytes": sum(blob.size for blob in blobs)}
+
+    # Storage backend interface (see PackStore); paths live only in the VFS
+
+    def put(self, path: str, content: str) -> Blob:
+        return self.intern(content)
+
+    def delete(self, path: str) -> None:
+        pass
+
+    def load(self) -> Dict[str, Blob]:
+        return {}
+
+    def close(self) -> None:
+        pass
+
+
+# Shared by every VirtualFileSystem unless one is given explicitly
+blob_store = BlobStore()
+
+
+class PackBlob:
+    """File content stored in a PackStore, read through its memory map."""
+    __slots__ = ("digest", "size", "offset", "_pack")
+
+    def __init__(self, digest: str, size: int, offset: int, pack: "PackStore"):
+        self.digest = digest
+        self.size = size
+        self.offset = offset
+        self._pack = pack
+
+    @property
+    def data(self) -> str:
+        return str(self.view(), "utf-8")
+
+    def view(self) -> memoryview:
+        """Zero-copy slice of the pack file."""
+        return self._pack.read(self.offset, self.size)
+
+
+class PackStore:
+    """
+    Append-only pack file holding one project's files on disk.
+
+    Each record is a JSON header line followed by the content bytes:
+    {"path", "digest", "size"} + data, {"path", "digest", "size", "offset"} for
+    content already in the pack, or {"path", "deleted": true} as a tombstone.
+    The path -> (offset, size, digest) index is rebuilt by scanning the pack on
+    load, and content is read as slices of a read-only mmap, so only the index
+    is held in RAM. close() releases the index and the mapping; the next access
+    loads them again.
+    """
+    persistent = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._index: Optional[Dict[str, PackBlob]] = None  # None until scanned
+        self._digests: Dict[str, PackBlob] = {}
+        self._end = 0  # end of the last complete record
+
+    def load(self) -> Dict[str, PackBlob]:
+        """Return a fresh path map for the files currently in the pack."""
+        with self._lock:
+            return dict(self._scan())
+
+    def put(self, path: str, content: str) -> PackBlob:
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            index = self._scan()
+            blob = self._digests.get(digest)
+            if blob is not None:
+                # Same content is already in the pack: record a reference only
+                self._append(self._header(path=path, digest=digest, size=blob.size, offset=blob.offset))
+            else:
+                header = self._header(path=path, digest=digest, size=len(data))
+                blob = PackBlob(digest, len(data), self._append(header + data) + len(header), self)
+                self._digests[digest] = blob
+            index[path] = blob
+            return blob
+
+    def delete(self, path: str) -> None:
+        with self._lock:
+            index = self._scan()
+            if index.pop(path, None) is not None:
+                self._append(self._header(path=path, deleted=True))
+
+    def read(self, offset: int, size: int) -> memoryview:
+        if size == 0:
+            return memoryview(b"")
+        with self._lock:
+            if self._mmap is None or offset + size > len(self._mmap):
+                self._remap()
+            return memoryview(self._mmap)[offset:offset + size]
+
+    def close(self) -> None:
+        """Drop the index and mapping from memory (the pack file stays on disk)."""
+        with self._lock:
+            self._unmap()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._index = None
+            self._digests = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._index is not None
+
+    def size_bytes(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _header(**fields) -> bytes:
+        return json.dumps(fields).encode("utf-8") + b"\n"
+
+    def _open(self) -> int:
+        if self._fd is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        return self._fd
+
+    def _append(self, record: bytes) -> int:
+        """Append a record and return its offset, taken from where O_APPEND actually wrote it."""
+        fd = self._open()
+        os.write(fd, record)
+        self._end = os.lseek(fd, 0, os.SEEK_CUR)
+        return self._end - len(record)
+
+    def _remap(self) -> None:
+        self._unmap()
+        size = os.fstat(self._open()).st_size
+        self._mmap = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ) if size else None
+
+    def _unmap(self) -> None:
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # Views are still exported; the mapping is released with the last one
+            self._mmap = None
+
+    def _scan(self) -> Dict[str, PackBlob]:
+        """Build the index from the pack, truncating a torn trailing record."""
+        if self._index is not None:
+            return self._index
+
+        self._remap()
+        pack = self._mmap or b""
+        index: Dict[str, PackBlob] = {}
+        digests: Dict[str, PackBlob] = {}
+        position = 0
+        while position < len(pack):
+            newline = pack.find(b"\n", position)
+            if newline == -1:
+                break
+            try:
+                header = json.loads(pack[position:newline])
+            except ValueError:
+                break
+            start = newline + 1
+
+            if header.get("deleted"):
+                index.pop(header["path"], None)
+                position = start
+                continue
+
+            if "offset" in header:
+                blob = digests.get(header["digest"]) or PackBlob(header["digest"], header["size"], header["offset"], self)
+                end = start
+            else:
+                end = start + header["size"]
+                if end > len(pack):
+                    break
+                blob = PackBlob(header["digest"], header["size"], start, self)
+            digests.setdefault(blob.digest, blob)
+            index[header["path"]] = blob
+            position = end
+
+        if position < len(pack):
+            print(f"Truncating torn record at byte {position} of {self.path}")
+            self._unmap()
+            os.ftruncate(self._fd, position)
+            self._remap()
+
+        self._index = index
+        self._digests = digests
+        self._end = position
+        return index
+
+
+class FilesView(Mapping):
+    """Read-only path -> content mapping over a path map, without copying contents."""
+
+    def __init__(self, paths: Dict[str, Blob]):
+        self._paths = paths
+
+    def __getitem__(self, path: str) -> str:
+        return self._paths[path].data
+
+    def read_bytes(self, path: str) -> memoryview:
+        return self._paths[path].view()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+
+class Snapshot:
+    """An immutable revision of a VirtualFileSystem."""
+
+    def __init__(self, revision: int, paths: Dict[str, Blob]):
+        self.revision = revision
+        self._paths = paths
+
+    @property
+    def files(self) -> FilesView:
+        return FilesView(self._paths)
+
+    def read_file(self, path: str) -> Optional[str]:
+        blob = self._paths.get(path)
+        return blob.data if blob is not None else None
+
+    def list_files(self) -> List[str]:
+        return list(self._paths.keys())
+
+
+class VirtualFileSystem:
+    """
+    In-memory file system for storing generated code.
+
+    Paths map to content-addressed blobs shared across projects. Snapshots are
+    O(1): the path map is shared with the snapshot and only copied on the next
+    write (copy-on-write), and reads hand out views instead of copies.
+
+    The store is the storage backend: the shared in-memory BlobStore by default,
+    or a per-project PackStore that keeps content on disk and can be evicted.
+    """
+
+    def __init__(self, store: Optional[Union[BlobStore, PackStore]] = None):
+        self.store = store or blob_store
+        self._loaded_paths: Optional[Dict[str, Blob]] = None  # loaded from the store on first access
+        self._shared = False  # True while a snapshot references self._paths
+        self.revisions: List[Snapshot] = []
+
+    @property
+    def _paths(self) -> Dict[str, Blob]:
+        if self._loaded_paths is None:
+            self._loaded_paths = self.store.load()
+            self._shared = False
+        return self._loaded_paths
+
+    @_paths.setter
+    def _paths(self, paths: Dict[str, Blob]) -> None:
+        self._loaded_paths = paths
+
+    @property
+    def resident(self) -> bool:
+        """True while the path map is loaded in memory."""
+        return self._loaded_paths is not None
+
+    @property
+    def files(self) -> FilesView:
+        """Read-only view of the current files."""
+        return FilesView(self._paths)
+
     def write_file(self, path: str, content: str) -> None:
         """Write content to a file path."""
-        self.files[path] = content
-    
+        self._own()
+        self._paths[path] = self.store.put(path, content)
+
     def read_file(self, path: str) -> Optional[str]:
         """Read content from a file path."""
-        return self.files.get(path)
-    
+        blob = self._paths.get(path)
+        return blob.data if blob is not None else None
+
+    def read_bytes(self, path: str) -> Optional[memoryview]:
+        """Read a file's UTF-8 bytes (a zero-copy slice for pack-backed storage)."""
+        blob = self._paths.get(path)
+        return blob.view() if blob is not None else None
+
     def list_files(self) -> list[str]:
         """List all file paths."""
-        return list(self.files.keys())
-    
+        return list(self._paths.keys())
+
     def delete_file(self, path: str) -> bool:
         """Delete a file."""
-        if path in self.files:
-            del self.files[path]
+        if path in self._paths:
+            self._own()
+            del self._paths[path]
+            self.store.delete(path)
             return True
         return False
-    
+
     def clear(self) -> None:
         """Clear all files."""
-        self.files.clear()
-    
-    def get_all_files(self) -> Dict[str, str]:
-        """Get all files as a dictionary."""
-        return self.files.copy()
+        for path in self._paths:
+            self.store.delete(path)
+        self._paths = {}
+        self._shared = False
+
+    def get_all_files(self) -> Mapping:
+        """Get all files as a read-only mapping (an O(1) snapshot, not a copy)."""
+        self._shared = True
+        return FilesView(self._paths)
+
+    def snapshot(self) -> Snapshot:
+        """Record an O(1) revision of the current files."""
+        self._shared = True
+        snapshot = Snapshot(len(self.revisions) + 1, self._paths)
+        self.revisions.append(snapshot)
+        return snapshot
+
+    def restore(self, snapshot: Snapshot) -> None:
+        """Make a previous revision current again (without copying it)."""
+        if self.store.persistent:
+            # Record the difference so the pack's index matches after a reload
+            for path in self._paths.keys() - snapshot._paths.keys():
+                self.store.delete(path)
+            for path, blob in snapshot._paths.items():
+                current = self._paths.get(path)
+                if current is None or current.digest != blob.digest:
+                    self.store.put(path, blob.data)
+        self._paths = snapshot._paths
+        self._shared = True
+
+    def evict(self) -> bool:
+        """
+        Drop the path map and the store's mapping from memory.
+
+        Only persistent stores can be evicted; the files are reloaded from disk
+        on the next access. Returns whether anything was evicted.
+        """
+        if not self.store.persistent:
+            return False
+        self._loaded_paths = None
+        self._shared = False
+        self.store.close()
+        return True
+
+    def memory_usage(self) -> dict:
+        """
+        Memory reported for this project.
+
+        logical_bytes counts every file's content; stored_bytes counts each
+        distinct blob once; path_map_bytes is the overhead of the path map itself.
+        Blobs shared with other projects are included in stored_bytes of each.
+        """
+        distinct = {blob.digest: blob.size for blob in self._paths.values()}
+        return {
+            "files": len(self._paths),
+            "logical_bytes": sum(blob.size for blob in self._paths.values()),
+            "stored_bytes": sum(distinct.values()),
+            "path_map_bytes": sys.getsizeof(self._paths),
+            "revisions": len(self.revisions)
+        }
+
+    def _own(self) -> None:
+        """Copy the path map before mutating it if a snapshot shares it."""
+        if self._shared:
+            self._paths = dict(self._paths)
+            self._shared = False
+
+
+class ProjectRegistry:
+    """
+    LRU-bounded registry of generated projects' file systems, by project ID.
+
+    With a storage_dir, each project gets its own pack file there: at most
+    max_resident projects keep their files in RAM, colder ones are evicted and
+    reloaded from disk on access, and projects dropped from the registry (or
+    written by an earlier process) are reopened from their pack file. Every
+    file system of one project shares a single open PackStore, so there is
+    only one writer per pack.
+    """
+
+    def __init__(self, max_projects: int = 1000, max_resident: int = 100, storage_dir: Optional[str] = None):
+        self.max_projects = max_projects
+        self.max_resident = max_resident
+        self.storage_dir = storage_dir
+        self._projects: "OrderedDict[str, VirtualFileSystem]" = OrderedDict()
+        self._stores: "weakref.WeakValueDictionary[str, PackStore]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def create(self, project_id: str) -> VirtualFileSystem:
+        """New file system for a project, backed by the configured storage."""
+        with self._lock:
+            return VirtualFileSystem(self._open_store(project_id))
+
+    def register(self, project_id: str, vfs: VirtualFileSystem) -> None:
+        with self._lock:
+            self._projects[project_id] = vfs
+            self._projects.move_to_end(project_id)
+            while len(self._projects) > self.max_projects:
+                _, dropped = self._projects.popitem(last=False)
+                dropped.store.close()
+            self._evict_cold()
+
+    def get(self, project_id: str) -> Optional[VirtualFileSystem]:
+        with self._lock:
+            vfs = self._projects.get(project_id)
+            if vfs is None:
+                pack_path = self._pack_path(project_id)
+                if pack_path is None or not os.path.exists(pack_path):
+                    return None
+                vfs = VirtualFileSystem(self._open_store(project_id))
+                self._projects[project_id] = vfs
+            self._projects.move_to_end(project_id)
+            self._evict_cold()
+            return vfs
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "projects": len(self._projects),
+                "resident": sum(1 for vfs in self._projects.values() if vfs.resident),
+                "storage": "pack" if self.storage_dir else "memory"
+            }
+
+    def __len__(self) -> int:
+        return len(self._projects)
+
+    def _pack_path(self, project_id: str) -> Optional[str]:
+        if not self.storage_dir or not re.fullmatch(r"[A-Za-z0-9_-]+", project_id):
+            return None
+        return os.path.join(self.storage_dir, f"{project_id}.pack")
+
+    def _open_store(self, project_id: str) -> Optional[PackStore]:
+        """The project's open PackStore (opened if no file system holds it), or None without storage."""
+        pack_path = self._pack_path(project_id)
+        if pack_path is None:
+            return None
+        store = self._stores.get(project_id)
+        if store is None:
+            store = self._stores[project_id] = PackStore(pack_path)
+        return store
+
+    def _evict_cold(self) -> None:
+        """Evict resident projects beyond the max_resident most recently used."""
+        resident = [vfs for vfs in reversed(self._projects.values()) if vfs.resident]
+        for vfs in resident[self.max_resident:]:
+            vfs.evict()
+
+
+# Projects generated by this process, for export endpoints.
+# Set VFS_STORAGE_DIR to keep project files in pack files on disk instead of RAM.
+projects = ProjectRegistry(
+    max_projects=int(os.getenv("VFS_MAX_PROJECTS", "1000")),
+    max_resident=int(os.getenv("VFS_MAX_RESIDENT", "100")),
+    storage_dir=os.getenv("VFS_STORAGE_DIR") or None
+)
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+CodeGenesis - Load Generator
+Drives /api/generate, /api/chat and /api/validate-key concurrently and reports
+latency percentiles, throughput, error rates and time-to-first-file.
+
+Offline, against the bundled fake LLM server:
+    cd backend && uvicorn fake_llm_server:app --port 9000
+    cd backend && A4F_API_KEY=sk-fake A4F_BASE_URL=http://localhost:9000/v1 uvicorn main:app --port 8000
+    python scripts/load_test.py --concurrency 20 --duration 60 --output results.json
+
+Closed loop (--concurrency N): N virtual users send back-to-back requests.
+Open loop (--rps R): requests start at R per second regardless of latency,
+uncapped unless --concurrency sets an in-flight limit. Latency is measured
+from each request's scheduled start, so time queued behind the cap counts. /api/chat always uses the
+platform (A4F) settings, hence the A4F_* overrides above.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+# ============================================
+# CONFIGURATION
+# ============================================
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+EXAMPLE_PROMPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "docs", "EXAMPLE_PROMPTS.md")
+
+# Defaults target the fake LLM server (backend/fake_llm_server.py), so no provider quota is used
+DEFAULT_API_KEY = os.getenv("LOAD_TEST_API_KEY", "sk-load-test")
+DEFAULT_PROVIDER = os.getenv("LOAD_TEST_PROVIDER", "custom")
+DEFAULT_BASE_URL = os.getenv("LOAD_TEST_BASE_URL", "http://localhost:9000/v1")
+
+# Closed-loop virtual users when --concurrency is not given
+DEFAULT_USERS = 10
+
+# Relative weights of each scenario in the request mix
+DEFAULT_MIX = "generate=1,chat=2,validate=2"
+
+SCENARIOS = ("generate", "chat", "validate")
+
+FALLBACK_PROMPTS = ["Create a simple todo list app with add, complete and delete buttons."]
+
+CHAT_MESSAGES = [
+    "How should I structure a React project?",
+    "Suggest features for a productivity app.",
+    "What is a good color scheme for a landing page?"
+]
+
+# ============================================
+# PROMPTS
+# ============================================
+def load_prompts(path: str = EXAMPLE_PROMPTS) -> List[str]:
+    """Code blocks that follow a **Prompt:** line in the example prompts guide."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except OSError:
+        return FALLBACK_PROMPTS
+
+    prompts = [block.strip() for block in re.findall(r"\*\*Prompt:\*\*\s*```[^\n]*\n(.*?)```", text, re.DOTALL)]
+    return [prompt for prompt in prompts if prompt] or FALLBACK_PROMPTS
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse "generate=1,chat=2" into scenario weights."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}' (expected one of {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("The request mix needs at least one positive weight")
+    return mix
+
+# ============================================
+# STATISTICS
+# ============================================
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """q-th percentile (0-100) with linear interpolation between ranks."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples: List[dict], elapsed: float) -> dict:
+    """Latency, throughput and error figures for one scenario's samples."""
+    latencies = [sample["latency"] for sample in samples if sample["ok"]]
+    first_files = [sample["first_file"] for sample in samples if sample.get("first_file") is not None]
+    errors = {}
+    for sample in samples:
+        if not sample["ok"]:
+            errors[sample["error"]] = errors.get(sample["error"], 0) + 1
+
+    def distribution(values: List[float]) -> dict:
+        return {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "mean": sum(values) / len(values) if values else None,
+            "max": max(values) if values else None
+        }
+
+    return {
+        "requests": len(samples),
+        "succeeded": len(latencies),
+        "errors": errors,
+        "error_rate": (len(samples) - len(latencies)) / len(samples) if samples else 0.0,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_seconds": distribution(latencies),
+        "time_to_first_file_seconds": distribution(first_files) if first_files else None
+    }
+
+# ============================================
+# SCENARIOS
+# ============================================
+class LoadGenerator:
+    """Sends the request mix and records one sample per request."""
+
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace, prompts: List[str]):
+        self.client = client
+        self.args = args
+        self.prompts = prompts
+        self.mix = parse_mix(args.mix)
+        self.random = random.Random(args.seed)
+        self.samples: List[dict] = []
+
+    def credentials(self) -> dict:
+        return {
+            "user_api_key": self.args.api_key,
+            "user_provider": self.args.provider,
+            "user_base_url": self.args.base_url or None
+        }
+
+    async def run_one(self, start: Optional[float] = None) -> None:
+        """
+        Send one request from the mix and record its sample.
+
+        Args:
+            start: perf_counter() time the request was scheduled for (open
+                loop); latency is measured from it. Defaults to now.
+        """
+        scenario = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        sample = {"scenario": scenario, "ok": False, "error": None, "first_file": None}
+        if start is None:
+            start = time.perf_counter()
+        try:
+            if scenario == "generate":
+                await self.generate(sample, start)
+            elif scenario == "chat":
+                await self.check(await self.client.post("/api/chat", json={
+                    "message": self.random.choice(CHAT_MESSAGES)
+                }), sample)
+            else:
+                response = await self.client.post("/api/validate-key", json={"prompt": "", **self.credentials()})
+                await self.check(response, sample)
+                if sample["ok"] and not response.json().get("valid"):
+                    sample["ok"], sample["error"] = False, "KEY_INVALID"
+        except httpx.TimeoutException:
+            sample["error"] = "timeout"
+        except httpx.HTTPError as e:
+            sample["error"] = type(e).__name__
+        sample["latency"] = time.perf_counter() - start
+        self.samples.append(sample)
+
+    async def check(self, response: httpx.Response, sample: dict) -> None:
+        """A request succeeds on HTTP 200 without an error body."""
+        if response.status_code != 200:
+            sample["error"] = f"HTTP {response.status_code}"
+            return
+        body = response.json()
+        if isinstance(body, dict) and body.get("status") == "error":
+            sample["error"] = body.get("error", "error")
+            return
+        sample["ok"] = True
+
+    async def generate(self, sample: dict, start: float) -> None:
+        request = {"prompt": self.random.choice(self.prompts), "use_cache": self.args.use_cache, **self.credentials()}
+        if not self.args.stream:
+            await self.check(await self.client.post("/api/generate", json=request), sample)
+            return
+
+        # Stream so the first finished file can be timed
+        async with self.client.stream("POST", "/api/generate/stream", json=request) as response:
+            if response.status_code != 200:
+                sample["error"] = f"HTTP {response.status_code}"
+                return
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif event == "file_complete" and sample["first_file"] is None:
+                    sample["first_file"] = time.perf_counter() - start
+                elif event == "error" and line.startswith("data: "):
+                    sample["error"] = json.loads(line[len("data: "):]).get("error", "error")
+                    return
+                elif event == "done":
+                    sample["ok"] = True
+            if not sample["ok"]:
+                sample["error"] = "stream ended without done"
+
+    async def closed_loop(self, deadline: float, total: Optional[int]) -> None:
+        """--concurrency users, each sending its next request when the last one finishes."""
+        remaining = [total]
+
+        async def user():
+            while time.perf_counter() < deadline:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                await self.run_one()
+
+        await asyncio.gather(*(user() for _ in range(self.args.concurrency or DEFAULT_USERS)))
+
+    async def open_loop(self, deadline: float, total: Optional[int]) -> None:
+        """Start requests at --rps, capped at --concurrency in flight if it is set."""
+        limit = asyncio.Semaphore(self.args.concurrency) if self.args.concurrency else None
+        interval = 1 / self.args.rps
+        tasks = []
+
+        async def limited(start: float):
+            async with limit:
+                await self.run_one(start)
+
+        next_start = time.perf_counter()
+        while next_start < deadline and (total is None or len(tasks) < total):
+            await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+            # Timed from the scheduled start, so waiting for a slot under the cap is part of the latency
+            tasks.append(asyncio.create_task(limited(next_start) if limit else self.run_one(next_start)))
+            next_start += interval
+        await asyncio.gather(*tasks)
+
+# ============================================
+# MAIN
+# ============================================
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def run(args: argparse.Namespace, transport: Optional[httpx.AsyncBaseTransport] = None) -> dict:
+    """
+    Run the load test and return the results document.
+
+    Args:
+        args: Parsed command line options
+        transport: Optional httpx transport for the backend client, e.g.
+            httpx.ASGITransport(app=...) to drive an app in-process
+    """
+    prompts = load_prompts(args.prompts)
+    limits = httpx.Limits(max_connections=max(args.concurrency or 0, 100))
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=args.timeout, limits=limits, transport=transport
+    ) as client:
+        generator = LoadGenerator(client, args, prompts)
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        deadline = start + args.duration if args.duration else float("inf")
+        if args.rps:
+            await generator.open_loop(deadline, args.requests)
+        else:
+            await generator.closed_loop(deadline, args.requests)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "started_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "config": {
+            "url": args.url,
+            "mode": "open" if args.rps else "closed",
+            "rps": args.rps,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "requests": args.requests,
+            "mix": generator.mix,
+            "stream": args.stream,
+            "use_cache": args.use_cache,
+            "provider": args.provider,
+            "base_url": args.base_url,
+            "prompts": len(prompts)
+        },
+        "elapsed_seconds": elapsed,
+        # Requests actually sent per second, against the --rps target in open loop
+        "achieved_rps": len(generator.samples) / elapsed if elapsed else 0.0,
+        "overall": summarize(generator.samples, elapsed),
+        "scenarios": {
+            scenario: summarize([s for s in generator.samples if s["scenario"] == scenario], elapsed)
+            for scenario in generator.mix
+        }
+    }
+
+
+def print_report(results: dict) -> None:
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    if results["config"]["mode"] == "open":
+        print(f"\nTarget {results['config']['rps']:g} rps, achieved {results['achieved_rps']:.2f} rps")
+
+    print(f"\n{'scenario':<10} {'reqs':>6} {'err%':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'ttff p50':>9} {'ttff p95':>9}")
+    for name, stats in list(results["scenarios"].items()) + [("overall", results["overall"])]:
+        latency = stats["latency_seconds"]
+        first_file = stats["time_to_first_file_seconds"] or {}
+        print(
+            f"{name:<10} {stats['requests']:>6} {stats['error_rate'] * 100:>5.1f}% {stats['throughput_rps']:>7.2f} "
+            f"{ms(latency['p50']):>8} {ms(latency['p95']):>8} {ms(latency['p99']):>8} "
+            f"{ms(first_file.get('p50')):>9} {ms(first_file.get('p95')):>9}"
+        )
+        for error, count in stats["errors"].items():
+            print(f"{'':<10}   {count} x {error}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="CodeGenesis load generator")
+    parser.add_argument("--url", default=BACKEND_URL, help="Backend base URL")
+    parser.add_argument(
+        "--concurrency", type=int,
+        help=f"Virtual users (closed loop, default {DEFAULT_USERS}) or in-flight cap (open loop, default none)"
+    )
+    parser.add_argument("--rps", type=float, default=0, help="Target request rate; switches to an open loop")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run (0 = until --requests)")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--prompts", default=EXAMPLE_PROMPTS, help="Markdown file with **Prompt:** code blocks")
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="Use /api/generate (no time-to-first-file)")
+    parser.add_argument("--use-cache", action="store_true", help="Let the backend serve repeated prompts from its caches")
+    parser.add_argument("--api-key", default=DEFAULT_API_KEY)
+    parser.add_argument("--provider", default=DEFAULT_PROVIDER)
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="LLM base URL passed as user_base_url ('' for none)")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, help="Seed for the scenario and prompt choice")
+    parser.add_argument("--output", help="Write the results JSON here")
+    args = parser.parse_args(argv)
+
+    if not args.duration and not args.requests:
+        parser.error("--duration 0 needs --requests")
+    if not args.rps and args.concurrency is not None and args.concurrency < 1:
+        parser.error("closed-loop mode needs --concurrency >= 1")
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main() -> int:
+    args = parse_args()
+    mode = f"{args.rps:g} rps" if args.rps else f"{args.concurrency or DEFAULT_USERS} concurrent users"
+    print(f"Load testing {args.url} with {mode} for {args.duration:g}s" + (f" / {args.requests} requests" if args.requests else ""))
+
+    results = asyncio.run(run(args))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0 if results["overall"]["requests"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())